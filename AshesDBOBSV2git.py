@@ -1,23 +1,1607 @@
+import time
+PROCESS_START = time.perf_counter()  # Reference point for the startup timing report
+
 import os
 import tkinter as tk
-from tkinter import messagebox, simpledialog, ttk
+from tkinter import messagebox, simpledialog, ttk, filedialog
 import tkinter.font as tkFont
-import requests
 import json
-from datetime import datetime, timedelta
-import pytz
+import copy
+import argparse
+import bisect
+import functools
+import gc
+import getpass
+import hashlib
+import importlib
+import logging
+import math
+import mmap
+import queue
+import re
+import struct
+import sys
+import threading
+import unicodedata
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from itertools import combinations
+from datetime import datetime, timedelta, timezone
+
+
+class LazyModule:
+    """
+    Stands in for a heavy module and only imports it the first time one of its attributes is used,
+    so the window can come up before requests/pytz have finished loading.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            logger.debug("Lazily imported %s in %.1f ms", self._name, (time.perf_counter() - start) * 1000.0)
+        return getattr(self._module, attr)
+
+
+requests = LazyModule('requests')
+pytz = LazyModule('pytz')
+
+# Optional: zstandard gives smaller and faster roster snapshots, zlib is used when it isn't installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Set AOCDB_LOG_LEVEL=DEBUG to see every request and timing span
+logger = logging.getLogger('aocdb')
+
+# Local state (indexes, caches) lives here. Set AOCDB_HOME to move it.
+APP_DATA_DIR = os.environ.get('AOCDB_HOME', os.path.join(os.path.expanduser('~'), '.aocdb'))
+
+
+def configure_logging(level=None):
+    level_name = (level or os.environ.get('AOCDB_LOG_LEVEL', 'INFO')).upper()
+    logging.basicConfig(
+        level=getattr(logging, level_name, logging.INFO),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class ServiceStats:
+    """
+    Collects per-operation timings and request counters for the diagnostics view.
+    """
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self._timings = {}  # operation -> deque of durations in milliseconds
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, operation):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            self.record(operation, elapsed_ms)
+            logger.debug("span op=%s ms=%.2f", operation, elapsed_ms)
+
+    def record(self, operation, elapsed_ms):
+        with self._lock:
+            samples = self._timings.get(operation)
+            if samples is None:
+                samples = self._timings[operation] = deque(maxlen=self.max_samples)
+            samples.append(elapsed_ms)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def snapshot(self, extra_counters=None):
+        """
+        Returns a JSON-serialisable summary of counters and p50/p95 latencies per operation.
+        """
+        with self._lock:
+            timings = {op: sorted(samples) for op, samples in self._timings.items()}
+            counters = dict(self._counters)
+        if extra_counters:
+            counters.update(extra_counters)
+
+        operations = {}
+        for op, samples in sorted(timings.items()):
+            operations[op] = {
+                'count': len(samples),
+                'p50_ms': round(percentile(samples, 50), 2),
+                'p95_ms': round(percentile(samples, 95), 2),
+                'max_ms': round(samples[-1], 2) if samples else 0.0,
+                'total_ms': round(sum(samples), 2)
+            }
+        return {'counters': counters, 'operations': operations}
 
-class FirebaseService:
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+
+class StartupTimer:
+    """
+    Milestones from module import to a usable window, shown in the Diagnostics tab.
+    """
+    def __init__(self):
+        self.marks = OrderedDict()
+
+    def mark(self, milestone):
+        if milestone in self.marks:
+            return
+        elapsed_ms = (time.perf_counter() - PROCESS_START) * 1000.0
+        self.marks[milestone] = round(elapsed_ms, 1)
+        logger.info("startup: %s at %.0f ms", milestone, elapsed_ms)
+
+    def report(self):
+        return dict(self.marks)
+
+
+startup_timer = StartupTimer()
+
+
+class RequestBudgetExceeded(Exception):
+    pass
+
+
+_request_context = threading.local()
+
+
+@contextmanager
+def background_requests():
+    """
+    Requests made inside this block (on this thread) give way to interactive ones and stop once the
+    daily budget is used up. Bulk jobs run inside it; anything else counts as interactive.
+    """
+    previous = getattr(_request_context, 'background', False)
+    _request_context.background = True
+    try:
+        yield
+    finally:
+        _request_context.background = previous
+
+
+def in_background_requests():
+    return getattr(_request_context, 'background', False)
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second with bursts up to capacity. Background callers can't use the
+    last reserve tokens and wait while an interactive caller is waiting, so a bulk job never makes
+    the user wait behind it. The rate is halved when Firestore answers 429 and creeps back up on success.
+    """
+    def __init__(self, rate, capacity, reserve_fraction=0.25, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.capacity = float(capacity)
+        self.reserve = self.capacity * reserve_fraction
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.interactive_waiting = 0
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, interactive=True):
+        """
+        Blocks until a token is available. Returns the seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self.condition:
+            if interactive:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    floor = 0.0 if interactive else self.reserve
+                    if (interactive or not self.interactive_waiting) and self.tokens - 1.0 >= floor:
+                        self.tokens -= 1.0
+                        return time.monotonic() - start
+                    self.condition.wait(max(0.005, (1.0 + floor - self.tokens) / self.rate))
+            finally:
+                if interactive:
+                    self.interactive_waiting -= 1
+                    self.condition.notify_all()
+
+    def throttled(self):
+        with self.condition:
+            self.rate = max(self.min_rate, self.rate / 2.0)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self.condition:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+
+class RequestBudget:
+    """
+    Counts billed document reads and writes per day against a budget (Spark plan: 50k reads, 20k
+    writes). Days roll over at midnight Pacific time, like Firestore's quota. Stored in JSON so the
+    count survives restarts; the limits can be changed there or from the Diagnostics tab.
+    """
+    def __init__(self, path, read_limit=50000, write_limit=20000):
+        self.path = path
+        self.defaults = {'read_limit': read_limit, 'write_limit': write_limit}
+        self.data = None  # Loaded on first use
+        self.last_saved = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def today():
+        return datetime.now(pytz.timezone('America/Los_Angeles')).strftime('%Y-%m-%d')
+
+    def _current(self):
+        if self.data is None:
+            try:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+            for key, value in self.defaults.items():
+                self.data.setdefault(key, value)
+        today = self.today()
+        if self.data.get('date') != today:
+            self.data.update({'date': today, 'reads': 0, 'writes': 0})
+        return self.data
+
+    def remaining(self, kind):
+        with self._lock:
+            data = self._current()
+            return data[f'{kind}_limit'] - data[f'{kind}s']
+
+    def add(self, kind, units):
+        with self._lock:
+            data = self._current()
+            data[f'{kind}s'] += units
+            # Saving on every request would cost more than the request; a few seconds of counts at most are lost
+            if time.monotonic() - self.last_saved > 5.0:
+                self._save()
+
+    def set_limits(self, read_limit=None, write_limit=None):
+        with self._lock:
+            data = self._current()
+            if read_limit is not None:
+                data['read_limit'] = int(read_limit)
+            if write_limit is not None:
+                data['write_limit'] = int(write_limit)
+            self._save()
+
+    def usage(self):
+        with self._lock:
+            return dict(self._current())
+
+    def save(self):
+        with self._lock:
+            if self.data is not None:
+                self._save()
+
+    def _save(self):
+        self.last_saved = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f'{self.path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to save request budget: %s", e)
+
+
+class RequestScheduler:
+    """
+    Sits in front of every Firestore/Auth request: one token bucket per request class (read, write,
+    auth), interactive-before-background ordering, and the daily read/write budget.
+    """
+    def __init__(self, budget, rates=None):
+        rates = rates or {'read': (50, 100), 'write': (25, 50), 'auth': (2, 5)}
+        self.buckets = {name: TokenBucket(rate, capacity) for name, (rate, capacity) in rates.items()}
+        self.budget = budget
+        self.warned_over_budget = None  # Budget day the over-budget warning was logged for
+
+    def acquire(self, request_class, interactive=True):
+        """
+        Waits for a slot. Background requests are refused once the day's budget is used up.
+        """
+        if request_class in ('read', 'write') and self.budget.remaining(request_class) <= 0:
+            if not interactive:
+                raise RequestBudgetExceeded(f"Daily {request_class} budget used up; background job stopped. "
+                                            "Raise the budget in the Diagnostics tab or wait until tomorrow.")
+            today = self.budget.today()
+            if self.warned_over_budget != today:
+                self.warned_over_budget = today
+                logger.warning("Daily %s budget used up; only interactive requests are still sent.", request_class)
+        return self.buckets[request_class].acquire(interactive)
+
+    @staticmethod
+    def billed_units(request_class, method, url, json_body, response):
+        if response.status_code >= 400:
+            return 0
+        if request_class == 'write':
+            return len(json_body.get('writes', ())) if url.endswith(':commit') and json_body else 1
+        if request_class == 'read':
+            # Every returned document carries exactly one createTime; an empty result still costs one read
+            return max(1, response.content.count(b'"createTime"'))
+        return 0
+
+    def record(self, request_class, method, url, json_body, response):
+        bucket = self.buckets[request_class]
+        if response.status_code == 429:
+            bucket.throttled()
+        elif response.status_code < 400:
+            bucket.succeeded()
+        units = self.billed_units(request_class, method, url, json_body, response)
+        if units:
+            self.budget.add(request_class, units)
+        return units
+
+
+class RosterSnapshotError(Exception):
+    pass
+
+
+SNAPSHOT_MAGIC = b'AOCSNAP\x00'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_PREAMBLE = struct.Struct('>8sBI')  # magic, format version, header length
+SNAPSHOT_INDEX_FIELDS = ['Guild', 'Discord']
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RosterSnapshotError("This snapshot is zstd compressed. Install the 'zstandard' package to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _array_bytes(typecode, values):
+    packed = array(typecode, values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _array_from(typecode, data):
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if sys.byteorder != 'little':
+        unpacked.byteswap()
+    return unpacked
+
+
+def _encode_string_codes(strings, dictionary, codes_by_string):
+    # Code 0 means "missing", real strings start at 1
+    codes = []
+    for value in strings:
+        code = codes_by_string.get(value)
+        if code is None:
+            code = codes_by_string[value] = len(dictionary) + 1
+            dictionary.append(value)
+        codes.append(code)
+    return codes
+
+
+def _encode_columns(players):
+    """
+    Stores the roster column by column. Strings are dictionary encoded (one shared string table, a
+    uint32 code per cell), integers are packed as int64 and lists of strings as lengths plus codes.
+    That compresses far better than one JSON object per player and decodes without parsing JSON per cell.
+    Returns (directory, blob) where directory describes where each column lives inside blob.
+    """
+    fields = []
+    seen = set()
+    for player in players:
+        for key in player:
+            if key not in seen:
+                seen.add(key)
+                fields.append(key)
+
+    dictionary = []
+    codes_by_string = {None: 0}
+    blobs = []
+    offset = 0
+    directory = []
+
+    def add_blob(data):
+        nonlocal offset
+        blobs.append(data)
+        start = offset
+        offset += len(data)
+        return [start, len(data)]
+
+    for field in fields:
+        values = [player.get(field) for player in players]
+        present = [value for value in values if value is not None]
+        entry = {'field': field}
+        if present and all(type(value) is int for value in present) and len(present) == len(values):
+            entry['type'] = 'int'
+            entry['data'] = add_blob(_array_bytes('q', values))
+        elif all(isinstance(value, str) and '\x00' not in value for value in present):
+            entry['type'] = 'str'
+            entry['codes'] = add_blob(_array_bytes('I', _encode_string_codes(values, dictionary, codes_by_string)))
+        elif all(isinstance(value, list) and all(isinstance(item, str) and '\x00' not in item for item in value)
+                 for value in present):
+            entry['type'] = 'strlist'
+            lengths = [len(value) + 1 if value is not None else 0 for value in values]  # 0 means missing
+            flat = [item for value in present for item in value]
+            entry['lengths'] = add_blob(_array_bytes('I', lengths))
+            entry['codes'] = add_blob(_array_bytes('I', _encode_string_codes(flat, dictionary, codes_by_string)))
+        else:
+            entry['type'] = 'json'
+            entry['data'] = add_blob(json.dumps(values, separators=(',', ':')).encode('utf-8'))
+        directory.append(entry)
+
+    strings = add_blob('\x00'.join(dictionary).encode('utf-8'))
+    return {'rows': len(players), 'strings': strings, 'columns': directory}, b''.join(blobs)
+
+
+def _decode_columns(directory, blob):
+    def part(location):
+        start, length = location
+        return blob[start:start + length]
+
+    string_data = bytes(part(directory['strings'])).decode('utf-8')
+    strings = [None] + (string_data.split('\x00') if string_data else [])
+    rows = directory['rows']
+
+    fields = []
+    columns = []
+    for entry in directory['columns']:
+        column_type = entry['type']
+        if column_type == 'int':
+            column = _array_from('q', part(entry['data'])).tolist()
+        elif column_type == 'str':
+            column = [strings[code] for code in _array_from('I', part(entry['codes']))]
+        elif column_type == 'strlist':
+            flat = [strings[code] for code in _array_from('I', part(entry['codes']))]
+            column = []
+            position = 0
+            for length in _array_from('I', part(entry['lengths'])):
+                if length == 0:
+                    column.append(None)
+                else:
+                    column.append(flat[position:position + length - 1])
+                    position += length - 1
+        else:
+            column = json.loads(bytes(part(entry['data'])))
+        if len(column) != rows:
+            raise RosterSnapshotError(f"Column {entry['field']} has {len(column)} rows, expected {rows}.")
+        fields.append(entry['field'])
+        columns.append(column)
+
+    # Columns every player has go straight into dict(zip(...)); the few sparse ones are filled in after
+    dense = [(field, column) for field, column in zip(fields, columns) if None not in column]
+    sparse = [(field, column) for field, column in zip(fields, columns) if None in column]
+    if dense:
+        dense_fields = [field for field, _ in dense]
+        players = [dict(zip(dense_fields, row)) for row in zip(*(column for _, column in dense))]
+    else:
+        players = [{} for _ in range(rows)]
+    for field, column in sparse:
+        for player, value in zip(players, column):
+            if value is not None:
+                player[field] = value
+    return players
+
+
+def _pack_body(directory, blob):
+    directory_bytes = json.dumps(directory, separators=(',', ':')).encode('utf-8')
+    return struct.pack('>I', len(directory_bytes)) + directory_bytes + blob
+
+
+def _unpack_body(body):
+    view = memoryview(body)
+    (directory_length,) = struct.unpack_from('>I', view)
+    directory = json.loads(bytes(view[4:4 + directory_length]))
+    return directory, view[4 + directory_length:]
+
+
+def _build_indexes(players):
+    indexes = {}
+    for field in SNAPSHOT_INDEX_FIELDS:
+        index = {}
+        for row, player in enumerate(players):
+            value = player.get(field)
+            if value and value != 'N/A':
+                index.setdefault(value, []).append(row)
+        indexes[field] = index
+    return indexes
+
+
+def write_roster_snapshot(path, players, base_header=None, base_players=None, codec=None):
+    """
+    Writes a versioned, checksummed, compressed snapshot of the roster.
+
+    With base_header/base_players the file is a delta: it only holds the players that were added or
+    changed since that base snapshot plus the names that were removed, and records the base checksum.
+    Returns the header that was written.
+    """
+    codec = codec or ('zstd' if zstandard is not None else 'zlib')
+    header = {
+        'kind': 'full',
+        'codec': codec,
+        'created_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'player_count': len(players),
+        'max_updated_at': max((player.get('updatedAt', '') for player in players), default='')
+    }
+
+    if base_players is not None:
+        base_by_name = {player['Name'].lower(): player for player in base_players if player.get('Name')}
+        current_names = set()
+        upserts = []
+        for player in players:
+            if not player.get('Name'):
+                continue  # Can't be matched against the base, same as when reading
+            key = player['Name'].lower()
+            current_names.add(key)
+            if base_by_name.get(key) != player:
+                upserts.append(player)
+        directory, blob = _encode_columns(upserts)
+        directory['deleted'] = sorted(set(base_by_name) - current_names)
+        header['kind'] = 'delta'
+        header['base_checksum'] = base_header['checksum']
+        header['upsert_count'] = len(upserts)
+    else:
+        directory, blob = _encode_columns(players)
+        directory['indexes'] = _build_indexes(players)
+
+    payload = _compress(_pack_body(directory, blob), codec)
+    header['payload_size'] = len(payload)
+    header['checksum'] = hashlib.sha256(payload).hexdigest()
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'  # Unique per thread, a UI save and a background save may overlap
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_snapshot_header(path):
+    """
+    Reads just the header, e.g. to find out whether a file is a delta before loading anything else.
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(SNAPSHOT_PREAMBLE.size)
+        if len(preamble) < SNAPSHOT_PREAMBLE.size:
+            raise RosterSnapshotError("Not a roster snapshot.")
+        magic, version, header_length = SNAPSHOT_PREAMBLE.unpack(preamble)
+        if magic != SNAPSHOT_MAGIC:
+            raise RosterSnapshotError("Not a roster snapshot.")
+        return json.loads(f.read(header_length))
+
+
+def read_roster_snapshot(path, base_players=None, base_header=None):
+    """
+    Memory-maps a snapshot, verifies it and returns (header, players).
+    Delta snapshots are applied on top of base_players, whose header must match the delta's base checksum.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise RosterSnapshotError("Snapshot file is empty.")
+        with mapped:
+            view = memoryview(mapped)
+            try:
+                if len(view) < SNAPSHOT_PREAMBLE.size:
+                    raise RosterSnapshotError("Not a roster snapshot.")
+                magic, version, header_length = SNAPSHOT_PREAMBLE.unpack_from(view)
+                if magic != SNAPSHOT_MAGIC:
+                    raise RosterSnapshotError("Not a roster snapshot.")
+                if version > SNAPSHOT_FORMAT_VERSION:
+                    raise RosterSnapshotError(f"Snapshot format {version} is newer than this app supports.")
+
+                header_start = SNAPSHOT_PREAMBLE.size
+                header = json.loads(bytes(view[header_start:header_start + header_length]))
+                payload = view[header_start + header_length:]
+                if len(payload) != header['payload_size'] or hashlib.sha256(payload).hexdigest() != header['checksum']:
+                    raise RosterSnapshotError("Snapshot checksum mismatch, the file is damaged or incomplete.")
+                body = _decompress(payload, header['codec'])
+            finally:
+                # The mmap can't close while a memoryview still points into it
+                payload = None
+                view.release()
+
+    directory, blob = _unpack_body(body)
+    # Building 100k dicts triggers many pointless GC passes, none of these objects can form cycles
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        players = _decode_columns(directory, blob)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    if header['kind'] != 'delta':
+        return header, players
+
+    if base_players is None or base_header is None:
+        raise RosterSnapshotError("This is a delta snapshot, load its base snapshot first.")
+    if base_header.get('checksum') != header['base_checksum']:
+        raise RosterSnapshotError("This delta was made against a different base snapshot.")
+
+    merged = {player['Name'].lower(): player for player in base_players if player.get('Name')}
+    for name in directory.get('deleted', []):
+        merged.pop(name, None)
+    for player in players:
+        if player.get('Name'):
+            merged[player['Name'].lower()] = player
+    header = dict(header)
+    header['max_updated_at'] = max(base_header.get('max_updated_at', ''), header.get('max_updated_at', ''))
+    return header, list(merged.values())
+
+
+class LocalRosterSnapshot:
+    """
+    Last roster downloaded on this machine, used to paint the View tab before the network answers.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+
+    def load(self):
+        try:
+            self.header, players = read_roster_snapshot(self.path)
+            return players
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zlib.error, RosterSnapshotError) as e:
+            logger.warning("Ignoring unreadable roster snapshot %s: %s", self.path, e)
+            return None
+
+    def save(self, players):
+        self.header = write_roster_snapshot(self.path, players)
+
+
+def timed(operation):
+    """
+    Decorator that records the wrapped method's duration in self.stats under the given name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.span(operation):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _PendingLoad:
+    """
+    A lookup that is currently in flight. Other threads asking for the same key wait on it.
+    """
     def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+
+
+class TransientLookupError(Exception):
+    """
+    Raised by a cache loader when a lookup failed in a way that shouldn't be cached (e.g. a 5xx).
+    """
+    pass
+
+
+class ReadThroughCache:
+    """
+    Size-bounded LRU cache with a per-entry TTL.
+    Concurrent lookups of the same key share a single load instead of each making their own request.
+    """
+    def __init__(self, max_entries=512, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._in_flight = {}  # key -> _PendingLoad
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader() to fetch it if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                is_owner = False
+            else:
+                pending = _PendingLoad()
+                self._in_flight[key] = pending
+                self.misses += 1
+                is_owner = True
+
+        if not is_owner:
+            # Someone else is already fetching this key, wait for their result
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return copy.deepcopy(pending.value)
+
+        try:
+            value = loader()
+        except Exception as e:
+            pending.error = e
+            with self._lock:
+                self._in_flight.pop(key, None)
+            pending.event.set()
+            raise
+
+        pending.value = value
+        with self._lock:
+            self._in_flight.pop(key, None)
+            # Don't store the result if a local write invalidated the key while we were loading
+            if not pending.stale:
+                self._store(key, value)
+        pending.event.set()
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        with self._lock:
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                pending.stale = True
+            self._store(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                pending.stale = True
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            for pending in self._in_flight.values():
+                pending.stale = True
+            self._entries.clear()
+
+    def _store(self, key, value):
+        # Caller must hold self._lock
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class VaultIndex:
+    """
+    Remembers path, mtime, size and hash of every note we exported, along with the values that were
+    written into it. Finding edited notes is then a stat pass; only notes whose stat changed get read.
+    """
+    PLAYER_FIELDS = ['Level', 'Class', 'Hostile Status', 'Subclass', 'Guild', 'Known Associates', 'Discord']
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.entries = None  # Loaded lazily: path -> {'mtime_ns', 'size', 'hash', 'base'}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def player_base(player):
+        base = {}
+        for key in VaultIndex.PLAYER_FIELDS:
+            value = player.get(key)
+            base[key] = list(value) if isinstance(value, list) else value
+        base['Name'] = player.get('Name')
+        return base
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        try:
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def record(self, path, data, base=None):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            self._load()
+            self.entries[path] = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'hash': hashlib.sha1(data).hexdigest(),
+                'base': base
+            }
+
+    def get(self, path):
+        with self._lock:
+            self._load()
+            return self.entries.get(os.path.abspath(path))
+
+    def forget(self, path):
+        with self._lock:
+            self._load()
+            self.entries.pop(os.path.abspath(path), None)
+
+    def save(self):
+        with self._lock:
+            if self.entries is None:
+                return
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+
+    def changed_files(self, folder):
+        """
+        Yields (path, data, entry) for .md files in folder whose content differs from what we recorded.
+        Files with an unchanged mtime and size are skipped without being opened.
+        """
+        try:
+            scanner = os.scandir(folder)
+        except OSError:
+            return
+        with scanner:
+            for dir_entry in scanner:
+                if not dir_entry.name.endswith('.md') or not dir_entry.is_file():
+                    continue
+                path = os.path.abspath(dir_entry.path)
+                stat = dir_entry.stat()
+                entry = self.get(path)
+                if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    continue
+
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if entry and entry['hash'] == hashlib.sha1(data).hexdigest():
+                    # Touched but not edited, just refresh the stat so we skip it next time
+                    with self._lock:
+                        entry['mtime_ns'] = stat.st_mtime_ns
+                        entry['size'] = stat.st_size
+                    continue
+                yield path, data, entry
+
+
+MARKDOWN_FIELD_RE = re.compile(r'^\s*-\s+\*\*(.+?)\*\*:\s*(.*?)\s*$')
+MARKDOWN_LINK_RE = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+MARKDOWN_LIST_ITEM_RE = re.compile(r'^\s*-\s+(.*?)\s*$')
+MARKDOWN_FIELD_KEYS = {'Discord Name': 'Discord'}
+
+
+def markdown_link_text(value):
+    """
+    '[Name](../Players/Name.md)' -> 'Name', '[[Name]]' -> 'Name', anything else is returned stripped.
+    """
+    match = MARKDOWN_LINK_RE.search(value)
+    if match:
+        return match.group(1).strip()
+    return value.strip().strip('[]').split('|')[0].strip()
+
+
+def parse_player_markdown(text):
+    """
+    Parses a player note in the export_to_markdown layout back into a player dict.
+    Only fields present in the note are returned (Known Associates is always present).
+    """
+    player = {'Known Associates': []}
+    section = None
+    for line in strip_frontmatter(text).splitlines():
+        if line.startswith('# '):
+            player['Name'] = line[2:].strip()
+            continue
+        if line.startswith('## '):
+            section = line[3:].strip()
+            continue
+
+        field_match = MARKDOWN_FIELD_RE.match(line)
+        if field_match:
+            label, value = field_match.group(1).strip(), field_match.group(2)
+            key = MARKDOWN_FIELD_KEYS.get(label, label)
+            value = markdown_link_text(value)
+            if key == 'Level':
+                try:
+                    value = int(value)
+                except ValueError:
+                    continue
+            player[key] = value
+            continue
+
+        if section == 'Known Associates':
+            item_match = MARKDOWN_LIST_ITEM_RE.match(line)
+            if item_match and item_match.group(1):
+                player['Known Associates'].append(markdown_link_text(item_match.group(1)))
+    return player
+
+
+def parse_member_list_markdown(text):
+    """
+    Returns the linked names listed in a guild or Discord note.
+    """
+    names = []
+    for line in text.splitlines():
+        item_match = MARKDOWN_LIST_ITEM_RE.match(line)
+        if item_match and item_match.group(1) and not MARKDOWN_FIELD_RE.match(line):
+            names.append(markdown_link_text(item_match.group(1)))
+    return names
+
+
+def strip_frontmatter(text):
+    """
+    Drops a leading Obsidian frontmatter block (--- ... ---), so templates can add one freely.
+    """
+    if not text.startswith('---'):
+        return text
+    lines = text.split('\n')
+    if lines[0].strip() != '---':
+        return text
+    for number in range(1, len(lines)):
+        if lines[number].strip() == '---':
+            return '\n'.join(lines[number + 1:])
+    return text
+
+
+class TemplateError(Exception):
+    pass
+
+
+def _template_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(_template_text(item) for item in value)
+    return str(value)
+
+
+def _tag_text(value):
+    # Obsidian tags can't contain spaces or most punctuation
+    return re.sub(r'[^\w/-]+', '-', _template_text(value).strip().lower()).strip('-')
+
+
+class MarkdownTemplate:
+    """
+    A small Mustache-like template, parsed and compiled to nested closures once and then rendered
+    for any number of records.
+
+        {{Field}}  {{Field|filter:arg|filter}}   value of a field (of the current list item inside a section)
+        {{.}}                                     the current list item itself
+        {{#Field}}...{{/Field}}                   repeated for each item of a list (once for any other true value)
+        {{?Field}}...{{/Field}}                   shown once if the field is set
+        {{^Field}}...{{/Field}}                   shown if the field is empty
+
+    Filters: default:TEXT, link:player|guild|discord, wikilink, tag, yaml, join:SEP, lower, upper.
+    A section tag alone on its line doesn't leave an empty line behind.
+    """
+    TAG_RE = re.compile(r'\{\{\s*([#?^/]?)\s*(.*?)\s*\}\}')
+
+    def __init__(self, source, links=None, name='template'):
+        self.name = name
+        self.links = links or {}
+        self._render = self._compile(source)
+
+    def render(self, context):
+        out = []
+        self._render([context], out)
+        return ''.join(out)
+
+    def _tokens(self, source):
+        position = 0
+        for match in self.TAG_RE.finditer(source):
+            start, end = match.span()
+            kind, expression = match.groups()
+            if kind:
+                line_start = source.rfind('\n', 0, start) + 1
+                line_end = source.find('\n', end)
+                line_end = len(source) if line_end == -1 else line_end
+                if line_start >= position and not source[line_start:start].strip() and not source[end:line_end].strip():
+                    start, end = line_start, min(line_end + 1, len(source))
+            if start > position:
+                yield 'text', source[position:start]
+            yield kind or 'var', expression
+            position = end
+        if position < len(source):
+            yield 'text', source[position:]
+
+    def _compile(self, source):
+        stack = [(None, None, [])]  # Open sections: (kind, name, compiled children)
+        for kind, expression in self._tokens(source):
+            nodes = stack[-1][2]
+            if kind == 'text':
+                nodes.append(self._text_node(expression))
+            elif kind == 'var':
+                nodes.append(self._variable_node(expression))
+            elif kind == '/':
+                section_kind, name, children = stack.pop()
+                if len(stack) == 0 or name != expression:
+                    raise TemplateError(f"{self.name}: unexpected {{{{/{expression}}}}}")
+                stack[-1][2].append(self._section_node(section_kind, name, children))
+            else:
+                stack.append((kind, expression, []))
+        if len(stack) > 1:
+            raise TemplateError(f"{self.name}: {{{{{stack[-1][0]}{stack[-1][1]}}}}} is never closed")
+        return self._sequence(stack[0][2])
+
+    @staticmethod
+    def _sequence(nodes):
+        def render(stack, out):
+            for node in nodes:
+                node(stack, out)
+        return render
+
+    @staticmethod
+    def _lookup(stack, name):
+        if name == '.':
+            return stack[-1]
+        for context in reversed(stack):
+            if isinstance(context, dict) and name in context:
+                return context[name]
+        return None
+
+    @staticmethod
+    def _text_node(text):
+        def render(stack, out):
+            out.append(text)
+        return render
+
+    def _filter(self, spec):
+        name, _, argument = spec.partition(':')
+        name = name.strip()
+        if name == 'default':
+            return lambda value: value if value not in (None, '') else argument
+        if name == 'link':
+            prefix = self.links.get(argument.strip())
+            if prefix is None:
+                raise TemplateError(f"{self.name}: unknown link target '{argument}'")
+
+            def link(value):
+                text = _template_text(value)
+                return f"[{text}]({prefix}{text}.md)" if text and text != 'N/A' else 'N/A'
+            return link
+        if name == 'wikilink':
+            return lambda value: f"[[{_template_text(value)}]]" if _template_text(value) else ''
+        if name == 'tag':
+            return _tag_text
+        if name == 'yaml':
+            return lambda value: json.dumps(_template_text(value), ensure_ascii=False)
+        if name == 'join':
+            return lambda value: argument.join(_template_text(item) for item in value) if isinstance(value, list) else value
+        if name == 'lower':
+            return lambda value: _template_text(value).lower()
+        if name == 'upper':
+            return lambda value: _template_text(value).upper()
+        raise TemplateError(f"{self.name}: unknown filter '{name}'")
+
+    def _variable_node(self, expression):
+        name, *filter_specs = [part.strip() for part in expression.split('|')]
+        filters = [self._filter(spec) for spec in filter_specs]
+        lookup = self._lookup
+
+        def render(stack, out):
+            value = lookup(stack, name)
+            for apply_filter in filters:
+                value = apply_filter(value)
+            out.append(_template_text(value))
+        return render
+
+    def _section_node(self, kind, name, children):
+        body = self._sequence(children)
+        lookup = self._lookup
+
+        if kind == '?':
+            def render(stack, out):
+                if lookup(stack, name):
+                    body(stack, out)
+        elif kind == '^':
+            def render(stack, out):
+                if not lookup(stack, name):
+                    body(stack, out)
+        else:
+            def render(stack, out):
+                value = lookup(stack, name)
+                if isinstance(value, list):
+                    for item in value:
+                        stack.append(item)
+                        body(stack, out)
+                        stack.pop()
+                elif value:
+                    stack.append(value)
+                    body(stack, out)
+                    stack.pop()
+        return render
+
+
+DEFAULT_PLAYER_TEMPLATE = """# {{Name}}
+- **Level**: {{Level|default:N/A}}
+- **Class**: {{Class|default:N/A}}
+- **Hostile Status**: {{Hostile Status|default:N/A}}
+- **Subclass**: {{Subclass|default:N/A}}
+- **Guild**: {{Guild|default:N/A|link:guild}}
+{{?Known Associates}}
+
+## Known Associates
+{{#Known Associates}}
+- {{.|link:player}}
+{{/Known Associates}}
+{{/Known Associates}}
+{{?Discord}}
+
+- **Discord Name**: {{Discord|link:discord}}
+{{/Discord}}
+"""
+
+DEFAULT_GUILD_TEMPLATE = """# Guild: {{name}}
+
+## Members
+{{#members}}
+- {{Name|link:player}}
+{{/members}}
+"""
+
+DEFAULT_DISCORD_TEMPLATE = """# Discord: {{name}}
+
+## Characters
+{{#members}}
+- {{Name|link:player}}
+{{/members}}
+"""
+
+
+class ExportConfig:
+    """
+    Vault layout for export_to_markdown, read from export.json in the workspace's data folder:
+
+        {"player_path": "...", "guild_path": "...", "discord_path": "...",
+         "templates": {"player": "templates/player.md", "guild": null, "discord": null},
+         "links": {"player": "../Players/", "guild": "../Guilds/", "discord": "../Discord/"}}
+
+    Every key is optional. Template paths are relative to that folder; missing templates use the
+    built-in layout. Reverse sync (Import Vault Edits) reads the "- **Field**: value" lines and the
+    "# Name" heading, so custom player templates should keep those.
+    """
+    KINDS = ('player', 'guild', 'discord')
+    DEFAULT_TEMPLATES = {'player': DEFAULT_PLAYER_TEMPLATE, 'guild': DEFAULT_GUILD_TEMPLATE,
+                         'discord': DEFAULT_DISCORD_TEMPLATE}
+    DEFAULT_LINKS = {'player': '../Players/', 'guild': '../Guilds/', 'discord': '../Discord/'}
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except ValueError as e:
+            logger.warning("Ignoring %s: %s", path, e)
+            self.data = {}
+
+    def paths(self):
+        return {kind: os.path.expanduser(self.data[f'{kind}_path'])
+                for kind in self.KINDS if self.data.get(f'{kind}_path')}
+
+    def template_path(self, kind):
+        path = (self.data.get('templates') or {}).get(kind)
+        return os.path.join(os.path.dirname(self.path), os.path.expanduser(path)) if path else None
+
+    def compile_templates(self):
+        """
+        Reads and compiles the three templates. Called once per export run, so template edits apply
+        to the next export without restarting.
+        """
+        links = dict(self.DEFAULT_LINKS, **(self.data.get('links') or {}))
+        templates = {}
+        for kind in self.KINDS:
+            path = self.template_path(kind)
+            if path:
+                with open(path, encoding='utf-8') as f:
+                    source = f.read()
+            else:
+                source = self.DEFAULT_TEMPLATES[kind]
+            templates[kind] = MarkdownTemplate(source, links=links, name=path or f'default {kind} template')
+        return templates
+
+    def write_defaults(self):
+        """
+        Writes the built-in templates next to export.json (without overwriting anything) and points
+        the config at them, as a starting point for a custom layout.
+        """
+        directory = os.path.join(os.path.dirname(self.path), 'templates')
+        os.makedirs(directory, exist_ok=True)
+        templates = self.data.setdefault('templates', {})
+        for kind in self.KINDS:
+            if templates.get(kind):
+                continue
+            template_path = os.path.join(directory, f'{kind}.md')
+            if not os.path.exists(template_path):
+                with open(template_path, 'w', encoding='utf-8') as f:
+                    f.write(self.DEFAULT_TEMPLATES[kind])
+            templates[kind] = os.path.join('templates', f'{kind}.md')
+        self.data.setdefault('links', dict(self.DEFAULT_LINKS))
+        with open(self.path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+
+
+DEFAULT_WORKSPACE = 'default'
+
+
+class Workspace:
+    """
+    One game server (or Firebase project). Workspaces share nothing locally: each has its own
+    collection prefix, data folder (caches, indexes, snapshot, watchlist), vault folder and session.
+    project_id/api_key are only needed for servers kept in a different Firebase project.
+    """
+    NAME_RE = re.compile(r'^[\w-]+$')
+
+    def __init__(self, name, project_id=None, api_key=None, collection_prefix='', vault=None):
+        if not self.NAME_RE.match(name or ''):
+            raise Exception(f"Invalid workspace name '{name}': use letters, digits, '_' or '-'.")
+        if '/' in (collection_prefix or ''):
+            raise Exception("A collection prefix can't contain '/'.")
+        self.name = name
+        self.project_id = project_id or None
+        self.api_key = api_key or None
+        self.collection_prefix = collection_prefix or ''
+        self.vault = vault or None
+
+    @property
+    def data_dir(self):
+        # The default workspace keeps using the top-level folder, so existing caches stay valid
+        if self.name == DEFAULT_WORKSPACE:
+            return APP_DATA_DIR
+        return os.path.join(APP_DATA_DIR, 'workspaces', self.name)
+
+    def to_dict(self):
+        return {'project_id': self.project_id, 'api_key': self.api_key,
+                'collection_prefix': self.collection_prefix, 'vault': self.vault}
+
+
+class WorkspaceRegistry:
+    """
+    The workspaces defined in workspaces.json, plus which one the app opens with.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.workspaces = {}
+        self.active = DEFAULT_WORKSPACE
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except ValueError as e:
+            logger.warning("Ignoring %s: %s", path, e)
+            data = {}
+        for name, settings in (data.get('workspaces') or {}).items():
+            try:
+                self.workspaces[name] = Workspace(name, **settings)
+            except Exception as e:
+                logger.warning("Ignoring workspace %s: %s", name, e)
+        self.workspaces.setdefault(DEFAULT_WORKSPACE, Workspace(DEFAULT_WORKSPACE))
+        if data.get('active') in self.workspaces:
+            self.active = data['active']
+
+    def names(self):
+        return sorted(self.workspaces, key=lambda name: (name != DEFAULT_WORKSPACE, name.lower()))
+
+    def get(self, name=None):
+        name = name or self.active
+        if name not in self.workspaces:
+            raise Exception(f"Unknown workspace '{name}'. Known: {', '.join(self.names())}")
+        return self.workspaces[name]
+
+    def add(self, workspace):
+        self.workspaces[workspace.name] = workspace
+        self.save()
+
+    def remove(self, name):
+        if name == DEFAULT_WORKSPACE:
+            raise Exception("The default workspace can't be removed.")
+        self.workspaces.pop(name, None)
+        if self.active == name:
+            self.active = DEFAULT_WORKSPACE
+        self.save()
+
+    def set_active(self, name):
+        self.get(name)
+        self.active = name
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'active': self.active,
+                       'workspaces': {name: workspace.to_dict() for name, workspace in self.workspaces.items()}},
+                      f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def workspace_registry():
+    return WorkspaceRegistry(os.path.join(APP_DATA_DIR, 'workspaces.json'))
+
+
+def vault_folders(vault_root):
+    # The markdown links assume Players/, Guilds/ and Discord/ live side by side in the vault
+    return {'player': os.path.join(vault_root, 'Players'),
+            'guild': os.path.join(vault_root, 'Guilds'),
+            'discord': os.path.join(vault_root, 'Discord')}
+
+
+def workspace_vault_paths(workspace, export_config=None):
+    """
+    The note folders of a workspace: its vault if it has one, else the paths in its export.json.
+    Workspaces other than the default one never fall back to the shared folders; without a vault
+    they export into a vault inside their own data folder.
+    """
+    if export_config is None:
+        export_config = ExportConfig(os.path.join(workspace.data_dir, 'export.json'))
+    # Obsidian vault folders of the default workspace. Be sure to enter your own paths here.
+    paths = {'player': r"C:LOCALPATH", 'guild': r"C:LOCALPATH", 'discord': r"C:LOCALPATH"}
+    if workspace.name != DEFAULT_WORKSPACE:
+        paths = vault_folders(os.path.join(workspace.data_dir, 'vault'))
+    paths.update(export_config.paths())
+    if workspace.vault:
+        paths = vault_folders(os.path.expanduser(workspace.vault))
+    return paths
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def shared_scheduler(project_id):
+    """
+    Rate limits and the daily budget belong to the Firebase project, so workspaces in the same
+    project share one scheduler.
+    """
+    with _schedulers_lock:
+        if project_id not in _schedulers:
+            filename = 'request_budget.json' if project_id is None else f'request_budget.{project_id}.json'
+            _schedulers[project_id] = RequestScheduler(RequestBudget(os.path.join(APP_DATA_DIR, filename)))
+        return _schedulers[project_id]
+
+
+def _search_roster(load_roster, name_query, filters):
+    players = load_roster() or []
+    if name_query:
+        name_query = name_query.lower()
+        players = [player for player in players if name_query in player.get('Name', '').lower()]
+    return filter_and_sort_players(players, filters or {}, 'Name')
+
+
+def search_workspaces(sources, name_query='', filters=None, max_workers=8):
+    """
+    Searches several workspaces' rosters at once. sources maps a workspace name to a function that
+    returns its roster (usually from memory or its local snapshot, never a full download).
+    Returns ({workspace name: [players]}, {workspace name: error}).
+    """
+    results = {}
+    errors = {}
+    if not sources:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(sources))) as executor:
+        futures = {executor.submit(_search_roster, load_roster, name_query, filters): name
+                   for name, load_roster in sources.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.warning("Search in workspace %s failed: %s", name, e)
+                errors[name] = e
+    return results, errors
+
+
+class FirebaseService:
+    def __init__(self, workspace=None):
+        # Which server this service talks to; see Workspace
+        self.workspace = workspace or Workspace(DEFAULT_WORKSPACE)
+        self.collection_prefix = self.workspace.collection_prefix
+        self.data_dir = self.workspace.data_dir
+
         # Replace with your Firebase project configuration
         self.api_key = 'API KEY'  # Replace with your API Key
         self.project_id = 'ProjectID'  # Replace with your Project ID
+        if self.workspace.api_key:
+            self.api_key = self.workspace.api_key
+        if self.workspace.project_id:
+            self.project_id = self.workspace.project_id
         self.auth_url = 'https://identitytoolkit.googleapis.com/v1/accounts'
+        self.token_url = 'https://securetoken.googleapis.com/v1/token'
         self.database_url = f'https://firestore.googleapis.com/v1/projects/{self.project_id}/databases/(default)/documents'
         self.user = None  # Will hold user info after authentication
         self.id_token = None  # User's ID token
+        self.refresh_token = None  # Used to renew the ID token in long running sessions
+        self.token_expires_at = 0  # time.monotonic() deadline for the current ID token
         self.user_role = 'unverified'  # Default role is 'unverified'
 
+        # Read-through caches so repeated lookups don't hit Firestore (which bills per read)
+        self.player_cache = ReadThroughCache(max_entries=1024, ttl_seconds=300)
+        self.role_cache = ReadThroughCache(max_entries=16, ttl_seconds=900)
+
+        # One pooled session for every request, plus timings and counters for the diagnostics tab
+        self._session = None  # Created on first request so startup doesn't wait for requests to import
+        self.stats = ServiceStats()
+        self.max_retries = 3
+
+        # Rate limits per request class and the daily read/write budget (per Firebase project)
+        self.scheduler = shared_scheduler(self.workspace.project_id)
+
+        # Obsidian vault folders for export_to_markdown (see workspace_vault_paths), and note
+        # templates; both can be set in export.json (see ExportConfig)
+        self.export_config = ExportConfig(os.path.join(self.data_dir, 'export.json'))
+        paths = workspace_vault_paths(self.workspace, self.export_config)
+        self.player_path = paths['player']
+        self.guild_path = paths['guild']
+        self.discord_path = paths['discord']
+
+        # Stat/hash index of exported notes, used to find edits made inside Obsidian
+        self.vault_index = VaultIndex(os.path.join(self.data_dir, 'vault_index.json'))
+
+        # Page size used when listing whole collections
+        self.page_size = 300
+
+        # Called as listener(changed_players, removed_names) after writes and incremental syncs
+        self.change_listeners = []
+
+    RETRY_STATUS_CODES = (429, 500, 503)
+    MAX_RETRY_AFTER = 30.0  # Seconds; a longer Retry-After is not worth blocking a request for
+
+    def check_vault_folders(self):
+        """
+        Refuses to export or sync into note folders another workspace also uses: the servers would
+        overwrite each other's notes, and each would push the other's notes back as vault edits.
+        """
+        def normalized(path):
+            return os.path.normcase(os.path.abspath(path))
+
+        own = {normalized(path) for path in (self.player_path, self.guild_path, self.discord_path)}
+        for workspace in workspace_registry().workspaces.values():
+            if workspace.name == self.workspace.name:
+                continue
+            shared = own & {normalized(path) for path in workspace_vault_paths(workspace).values()}
+            if shared:
+                raise Exception(f"Workspace {workspace.name} also uses {min(shared)}. "
+                                f"Give each workspace its own vault before exporting or syncing.")
+
+    def collection(self, name):
+        """
+        Name of a per-server collection ('players', 'logs') in this workspace, e.g. eu1_players.
+        """
+        return f'{self.collection_prefix}{name}'
+
+    def adopt_session(self, other):
+        """
+        Reuses another workspace's sign-in when both live in the same Firebase project.
+        Returns False when this workspace needs its own sign-in.
+        """
+        if not other.id_token or (other.project_id, other.api_key) != (self.project_id, self.api_key):
+            return False
+        self.user = other.user
+        self.id_token = other.id_token
+        self.refresh_token = other.refresh_token
+        self.token_expires_at = other.token_expires_at
+        self.user_role = other.user_role
+        return True
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def _request(self, method, url, json_body=None, **kwargs):
+        """
+        Sends a request through the pooled session, retrying transient failures with exponential backoff.
+        429 means the request wasn't processed, so it is always retried. 500/503 are only retried for
+        requests that are safe to repeat; a POST that creates a document (logs, sightings) might have
+        gone through and would be written twice.
+        """
+        if json_body is not None:
+            # Encode once so retries don't re-serialise and so we can count bytes sent
+            kwargs['data'] = json.dumps(json_body).encode('utf-8')
+            headers = dict(kwargs.get('headers') or {})
+            headers['Content-Type'] = 'application/json'
+            kwargs['headers'] = headers
+        kwargs.setdefault('timeout', 30)
+        log_url = url.split('?')[0]  # Never log the API key
+        request_class = self.request_class(method, url)
+        interactive = not in_background_requests()
+        idempotent = method in ('GET', 'PATCH', 'DELETE') or url.endswith(':runQuery') or url.endswith(':batchGet')
+
+        attempt = 0
+        while True:
+            waited = self.scheduler.acquire(request_class, interactive)
+            if waited >= 0.001:
+                self.stats.increment('rate_limited_ms', int(waited * 1000))
+            self.stats.increment('http_calls')
+            self.stats.increment(f'http_{method.lower()}')
+            if isinstance(kwargs.get('data'), bytes):
+                self.stats.increment('bytes_sent', len(kwargs['data']))
+            response = self.session.request(method, url, **kwargs)
+            self.stats.increment('bytes_received', len(response.content))
+            logger.debug("%s %s -> %s (%d bytes)", method, log_url, response.status_code, len(response.content))
+            self.scheduler.record(request_class, method, url, json_body, response)
+
+            retryable = response.status_code == 429 or (idempotent and response.status_code in self.RETRY_STATUS_CODES)
+            if not retryable or attempt >= self.max_retries:
+                if response.status_code >= 400:
+                    self.stats.increment('http_errors')
+                return response
+
+            attempt += 1
+            self.stats.increment('retries')
+            delay = min(8.0, 0.5 * (2 ** (attempt - 1)))
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = min(float(retry_after), self.MAX_RETRY_AFTER)
+            logger.warning("%s %s returned %s, retry %d/%d in %.1fs",
+                           method, log_url, response.status_code, attempt, self.max_retries, delay)
+            time.sleep(delay)
+
+    def request_class(self, method, url):
+        if url.startswith(self.auth_url) or url.startswith(self.token_url):
+            return 'auth'
+        if method == 'GET' or url.endswith(':runQuery') or url.endswith(':batchGet'):
+            return 'read'
+        return 'write'
+
+    def diagnostics(self):
+        """
+        Counters and per-operation p50/p95 latencies, including cache hit rates.
+        """
+        cache_counters = {}
+        for cache_name, cache in (('player_cache', self.player_cache), ('role_cache', self.role_cache)):
+            cache_counters[f'{cache_name}_hits'] = cache.hits
+            cache_counters[f'{cache_name}_misses'] = cache.misses
+            cache_counters[f'{cache_name}_coalesced'] = cache.coalesced
+        report = self.stats.snapshot(extra_counters=cache_counters)
+        report['startup_ms'] = startup_timer.report()
+        report['request_budget'] = self.scheduler.budget.usage()
+        report['request_rates'] = {name: round(bucket.rate, 2) for name, bucket in self.scheduler.buckets.items()}
+        return report
+
+    @timed('create_user')
     def create_user(self, email, password, discord_name):
         url = f'{self.auth_url}:signUp?key={self.api_key}'
         payload = {
@@ -25,14 +1609,14 @@ class FirebaseService:
             'password': password,
             'returnSecureToken': True
         }
-        response = requests.post(url, json=payload)
+        response = self._request('POST', url, json_body=payload)
         if response.status_code == 200:
             self.user = response.json()
             self.id_token = self.user['idToken']
             user_id = self.user['localId']
 
-            print("User successfully registered.")
-            print(f"Assigning default role to user ID: {user_id}")
+            logger.info("User successfully registered.")
+            logger.debug("Assigning default role to user ID: %s", user_id)
 
             # Automatically assign 'unverified' role upon registration
             self.assign_default_role(user_id, email, discord_name)
@@ -41,6 +1625,7 @@ class FirebaseService:
             error_message = response.json()['error']['message']
             raise Exception(error_message)
 
+    @timed('assign_default_role')
     def assign_default_role(self, user_id, email, discord_name):
         # Assign default role 'unverified' to new users in Firestore
         url = f'{self.database_url}/users/{user_id}'
@@ -55,10 +1640,11 @@ class FirebaseService:
                 'role': {'stringValue': 'unverified'}  # Default role
             }
         }
-        response = requests.patch(url, headers=headers, json=firestore_data)
+        response = self._request('PATCH', url, headers=headers, json_body=firestore_data)
         if response.status_code != 200:
             raise Exception("Failed to assign default role.")
 
+    @timed('sign_in_user')
     def sign_in_user(self, email, password):
         url = f'{self.auth_url}:signInWithPassword?key={self.api_key}'
         payload = {
@@ -66,50 +1652,106 @@ class FirebaseService:
             'password': password,
             'returnSecureToken': True
         }
-        response = requests.post(url, json=payload)
+        response = self._request('POST', url, json_body=payload)
         if response.status_code == 200:
             self.user = response.json()
             self.id_token = self.user['idToken']
-            print(f"User authenticated. ID Token: {self.id_token}")  # Debugging: print the ID token
+            self.refresh_token = self.user.get('refreshToken')
+            self.token_expires_at = time.monotonic() + int(self.user.get('expiresIn', 3600))
+            logger.info("User authenticated: %s", email)
             return self.user
         else:
             error_message = response.json()['error']['message']
             raise Exception(error_message)
 
+    @timed('refresh_id_token')
+    def ensure_fresh_token(self, margin_seconds=300):
+        """
+        Renews the ID token when it is about to expire (they only last an hour).
+        """
+        if not self.refresh_token or time.monotonic() < self.token_expires_at - margin_seconds:
+            return
+        url = f'{self.token_url}?key={self.api_key}'
+        response = self._request('POST', url, data={
+            'grant_type': 'refresh_token',
+            'refresh_token': self.refresh_token
+        })
+        if response.status_code != 200:
+            raise Exception(f"Failed to refresh ID token: {response.text}")
+        token_data = response.json()
+        self.id_token = token_data['id_token']
+        self.refresh_token = token_data['refresh_token']
+        self.token_expires_at = time.monotonic() + int(token_data.get('expires_in', 3600))
+        logger.info("ID token refreshed.")
+
+    @timed('fetch_user_role')
     def fetch_user_role(self, user_id):
+        role = self.role_cache.get_or_load(user_id, lambda: self._fetch_user_role_uncached(user_id))
+        if role != 'user':
+            # Only verified roles are cached, so a user who just got verified isn't stuck on a stale role
+            self.role_cache.invalidate(user_id)
+        self.user_role = role
+        return self.user_role
+
+    def _fetch_user_role_uncached(self, user_id):
         url = f'{self.database_url}/users/{user_id}'
         headers = {
             'Authorization': f'Bearer {self.id_token}'
         }
-        response = requests.get(url, headers=headers)
+        response = self._request('GET', url, headers=headers)
 
         if response.status_code == 200:
             firestore_data = response.json()
-            print(f"Firestore response: {firestore_data}")  # Debugging output
             try:
-                self.user_role = firestore_data['fields']['role']['stringValue']
-                print(f"User role fetched: {self.user_role}")  # Debugging output
+                role = firestore_data['fields']['role']['stringValue']
+                logger.debug("User role fetched: %s", role)
             except KeyError:
-                print("Role field not found. Setting role to 'unverified'.")
-                self.user_role = 'unverified'
+                logger.warning("Role field not found. Setting role to 'unverified'.")
+                role = 'unverified'
         else:
-            print(f"Failed to fetch user document: {response.status_code} {response.json()}")
-            self.user_role = 'unverified'
+            logger.warning("Failed to fetch user document: %s %s", response.status_code, response.text)
+            role = 'unverified'
 
-        return self.user_role
+        return role
+
+    def clear_caches(self):
+        """
+        Drop all cached documents, e.g. when the user logs out.
+        """
+        self.player_cache.clear()
+        self.role_cache.clear()
+
+    def add_change_listener(self, listener):
+        self.change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        if listener in self.change_listeners:
+            self.change_listeners.remove(listener)
+
+    def _notify_change(self, changed=(), removed=()):
+        for listener in list(self.change_listeners):
+            try:
+                listener(list(changed), list(removed))
+            except Exception:
+                logger.exception("Change listener %r failed", listener)
 
     def check_user_permission(self):
         # Ensure that only users with the 'user' role can access the database
         if self.user_role != 'user':
             raise Exception("Access Denied: Your account is not verified yet.")
 
+    @timed('add_or_update_player')
     def add_or_update_player(self, player_data):
+        """
+        Saves a player over its stored document. Returns the player as it was stored before
+        (None for a new player, or when it couldn't be read).
+        """
         if not self.id_token:
             raise Exception("User not authenticated")
 
         # Use the player's name (lowercased) as the document ID
         doc_name = player_data['Name'].lower()
-        url = f'{self.database_url}/players/{doc_name}'
+        url = f'{self.database_url}/{self.collection("players")}/{doc_name}'
 
         headers = {
             'Authorization': f'Bearer {self.id_token}',
@@ -117,33 +1759,58 @@ class FirebaseService:
         }
 
         # Fetch the existing player data (if any) for comparison
+        existing_known = True
         try:
-            existing_player_data = self.get_player_by_name(player_data['Name'])
+            existing_player_data = self.get_player_for_update(player_data['Name'])
         except Exception as e:
-            print(f"Error fetching existing player data: {e}")
+            logger.warning("Error fetching existing player data: %s", e)
             existing_player_data = None
+            existing_known = False
 
         # Attach metadata (who made the change and when)
         current_time_iso = self.get_adjusted_timestamp()
         player_data['updatedBy'] = self.user['email']
         player_data['updatedAt'] = current_time_iso  # Store timestamp
+        # The PATCH replaces the whole document, so carry createdAt over from the stored player
+        if existing_player_data and existing_player_data.get('createdAt'):
+            player_data['createdAt'] = existing_player_data['createdAt']
+        elif existing_known and not existing_player_data and 'createdAt' not in player_data:
+            player_data['createdAt'] = current_time_iso
 
         # Convert player data to Firestore document format
         firestore_data = {'fields': self.dict_to_firestore_fields(player_data)}
 
+        # Without the stored player we can't carry its other fields (createdAt) over, so only
+        # replace the fields we send and leave the rest of the document as it is
+        params = None
+        if not existing_known:
+            params = {'updateMask.fieldPaths': [f'`{key}`' if not key.isidentifier() else key
+                                                for key in player_data]}
+
         # Send PATCH request to create or update the document
-        response = requests.patch(url, headers=headers, json=firestore_data)
+        response = self._request('PATCH', url, headers=headers, json_body=firestore_data, params=params)
         if response.status_code not in [200, 201]:
             error_message = response.json()
             raise Exception(f"Failed to add/update player: {error_message}")
         else:
-            print(f"Player '{player_data['Name']}' added/updated successfully.")
+            logger.info("Player '%s' added/updated successfully.", player_data['Name'])
+
+        if existing_known:
+            # The PATCH replaced the whole document, so the cache can hold exactly what we sent
+            self.player_cache.put(doc_name, player_data)
+        else:
+            self.player_cache.invalidate(doc_name)
+        self._notify_change(changed=[player_data])
 
         # Determine the type of change (added or updated) and what fields were changed
         if existing_player_data:
             # If player exists, find the differences between old and new data
             changes = self.compare_player_data(existing_player_data, player_data)
             action_type = "update"
+        elif not existing_known:
+            # The player may well exist, we just couldn't read it
+            changes = {"action": "updated player, previous values unavailable"}
+            action_type = "update"
         else:
             # If no existing data, it's a new player
             changes = {"action": "added new player"}
@@ -151,6 +1818,106 @@ class FirebaseService:
 
         # Log the action in the 'logs' collection with detailed changes
         self.log_user_action(action_type=action_type, player_name=player_data['Name'], changes=changes)
+        return existing_player_data
+
+    @timed('save_player_with_associates')
+    def save_player_with_associates(self, player_data):
+        """
+        Saves a player and makes sure every known associate lists them back.
+        Associates that were removed from the player also lose their link back to the player.
+        """
+        existing_player_data = self.add_or_update_player(player_data) or {}
+
+        def fetch_associate(associate_name):
+            # Each associate is saved whole, so read it fresh rather than from the cache
+            try:
+                return self.get_player_for_update(associate_name)
+            except TransientLookupError as e:
+                logger.warning("Couldn't update the link from %s to %s: %s", associate_name, name, e)
+                return None
+
+        name = player_data['Name']
+        new_associates = {associate.lower() for associate in player_data.get('Known Associates', [])}
+        for associate_name in player_data.get('Known Associates', []):
+            # Fetch associate data to check if they already exist in Firebase
+            associate_data = fetch_associate(associate_name)
+
+            if associate_data:
+                # Add primary player as a known associate of the associate if not already listed
+                listed = {associate.lower() for associate in associate_data.get('Known Associates', [])}
+                if name.lower() not in listed:
+                    associate_data.setdefault('Known Associates', []).append(name)
+                    self.add_or_update_player(associate_data)
+
+        for associate_name in existing_player_data.get('Known Associates', []):
+            if associate_name.lower() in new_associates:
+                continue
+            associate_data = fetch_associate(associate_name)
+            if associate_data:
+                kept = [associate for associate in associate_data.get('Known Associates', [])
+                        if associate.lower() != name.lower()]
+                if len(kept) != len(associate_data.get('Known Associates', [])):
+                    associate_data['Known Associates'] = kept
+                    self.add_or_update_player(associate_data)
+
+    def document_name(self, path):
+        """
+        Full resource name Firestore expects inside batch writes, e.g. projects/p/databases/(default)/documents/players/bob
+        """
+        return self.database_url.split('/v1/', 1)[1] + '/' + path
+
+    @timed('commit_writes')
+    def commit_writes(self, writes, chunk_size=500):
+        """
+        Sends writes through :commit in chunks (Firestore allows at most 500 writes per commit).
+        Each chunk is atomic. Returns the number of writes committed.
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
+
+        url = f'{self.database_url}:commit'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        committed = 0
+        for start in range(0, len(writes), chunk_size):
+            chunk = writes[start:start + chunk_size]
+            response = self._request('POST', url, headers=headers, json_body={'writes': chunk})
+            if response.status_code != 200:
+                raise Exception(f"Batch commit failed after {committed} writes: {response.text}")
+            committed += len(chunk)
+            logger.info("Committed %d/%d writes.", committed, len(writes))
+        return committed
+
+    def player_field_update(self, name, fields=None, append=None, remove=None):
+        """
+        A batch write that only touches the given fields of an existing player document.
+        append/remove map an array field (e.g. Known Associates) to values Firestore adds if missing or
+        removes on its side, so entries someone else added since the roster was read are kept.
+        A field can only be appended to or removed from once per write.
+        """
+        def field_path(key):
+            return f'`{key}`' if not key.isidentifier() else key
+
+        fields = dict(fields or {})
+        fields['updatedBy'] = self.user['email']
+        fields['updatedAt'] = self.get_adjusted_timestamp()
+        write = {
+            'update': {
+                'name': self.document_name(f'{self.collection("players")}/{name.lower()}'),
+                'fields': self.dict_to_firestore_fields(fields)
+            },
+            'updateMask': {'fieldPaths': [field_path(key) for key in fields]},
+            'currentDocument': {'exists': True}
+        }
+        transforms = []
+        for kind, changes in (('appendMissingElements', append), ('removeAllFromArray', remove)):
+            for key, values in (changes or {}).items():
+                transforms.append({'fieldPath': field_path(key),
+                                   kind: {'values': [self.to_firestore_value(value) for value in values]}})
+        if transforms:
+            write['updateTransforms'] = transforms
+        return write
 
     def compare_player_data(self, old_data, new_data):
         """
@@ -164,6 +1931,7 @@ class FirebaseService:
                 changes[key] = {"old": old_value, "new": new_value}
         return changes
 
+    @timed('log_user_action')
     def log_user_action(self, action_type, player_name, changes):
         """
         Logs the user actions like adding, updating, or deleting a player.
@@ -181,20 +1949,278 @@ class FirebaseService:
                 'actionType': {'stringValue': action_type},
                 'playerName': {'stringValue': player_name},
                 'timestamp': {'timestampValue': current_time},  # Correct format for timestamp
-                'changes': {'stringValue': json.dumps(changes)}
+                # Stored as a map (not a JSON string) so individual changes can be read back and queried
+                'changes': self.to_firestore_value(changes)
             }
         }
 
         # Send the log to Firestore
-        log_url = f'{self.database_url}/logs'
+        log_url = f'{self.database_url}/{self.collection("logs")}'
         headers = {
             'Authorization': f'Bearer {self.id_token}',
             'Content-Type': 'application/json'
         }
-        response = requests.post(log_url, headers=headers, json=log_data)
+        response = self._request('POST', log_url, headers=headers, json_body=log_data)
+
+        if response.status_code not in [200, 201]:
+            logger.warning("Failed to log action: %s", response.text)
+
+    @timed('query_logs')
+    def query_logs(self, player_name=None, email=None, since=None, until=None, limit=50, cursor=None,
+                   ascending=False, field=None):
+        """
+        Server-side query of the logs collection, newest first unless ascending is set.
+        Returns (entries, next_cursor); pass next_cursor back in to get the following page.
+        Equality filters combined with the timestamp order need a composite index in Firestore.
+
+        Like the local LogCache search, names and emails match regardless of case: the name is looked
+        up as the player's stored spelling and emails are stored lowercase by Firebase Auth.
+        field keeps only entries whose changes touch that field; pages are read until limit of
+        those are found or the logs run out, so a page is only short at the end.
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
+
+        filters = []
+        if player_name:
+            player = self.get_player_by_name(player_name)
+            filters.append(('playerName', 'EQUAL', {'stringValue': player['Name'] if player else player_name}))
+        if email:
+            filters.append(('email', 'EQUAL', {'stringValue': email.lower()}))
+        if since:
+            filters.append(('timestamp', 'GREATER_THAN_OR_EQUAL', {'timestampValue': since}))
+        if until:
+            filters.append(('timestamp', 'LESS_THAN', {'timestampValue': until}))
+
+        direction = 'ASCENDING' if ascending else 'DESCENDING'
+        structured_query = {
+            'from': [{'collectionId': self.collection('logs')}],
+            'orderBy': [
+                {'field': {'fieldPath': 'timestamp'}, 'direction': direction},
+                {'field': {'fieldPath': '__name__'}, 'direction': direction}
+            ],
+            'limit': limit
+        }
+        field_filters = [
+            {'fieldFilter': {'field': {'fieldPath': field}, 'op': op, 'value': value}}
+            for field, op, value in filters
+        ]
+        if len(field_filters) == 1:
+            structured_query['where'] = field_filters[0]
+        elif field_filters:
+            structured_query['where'] = {'compositeFilter': {'op': 'AND', 'filters': field_filters}}
+
+        url = f'{self.database_url}:runQuery'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        entries = []
+        while True:
+            if cursor:
+                structured_query['startAt'] = {
+                    'values': [{'timestampValue': cursor[0]}, {'referenceValue': cursor[1]}],
+                    'before': False
+                }
+            response = self._request('POST', url, headers=headers, json_body={'structuredQuery': structured_query})
+            if response.status_code != 200:
+                raise Exception(f"Failed to query logs: {response.text}")
+
+            documents = [result['document'] for result in response.json() if result.get('document')]
+            for document in documents:
+                # The cursor follows every document read, matching or not
+                cursor = (document['fields']['timestamp']['timestampValue'], document['name'])
+                entry = self.log_entry_from_document(document)
+                if field and field not in (entry.get('changes') or {}):
+                    continue
+                entries.append(entry)
+                if len(entries) == limit:
+                    return entries, cursor
+            if len(documents) < limit:
+                return entries, None
+
+    def encounter_timestamp(self):
+        """
+        Real UTC time of a sighting, e.g. 2024-05-01T18:30:00Z (unlike updatedAt, which is shifted).
+        """
+        return datetime.now(timezone.utc).replace(microsecond=0).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    @timed('add_encounter')
+    def add_encounter(self, player_name, level=None, guild=None, status=None, location='', seen_at=None):
+        """
+        Appends a sighting to players/{id}/encounters. Returns the stored encounter including its id.
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
+
+        encounter = {
+            'player': player_name,
+            'time': seen_at or self.encounter_timestamp(),
+            'location': location or '',
+            'level': level,
+            'guild': guild,
+            'status': status,
+            'reporter': self.user['email']
+        }
+        fields = self.dict_to_firestore_fields({key: value for key, value in encounter.items() if key != 'time'})
+        fields['time'] = {'timestampValue': encounter['time']}
 
+        url = f'{self.database_url}/{self.collection("players")}/{player_name.lower()}/encounters'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        response = self._request('POST', url, headers=headers, json_body={'fields': fields})
         if response.status_code not in [200, 201]:
-            print(f"Failed to log action: {response.json()}")
+            raise Exception(f"Failed to record encounter: {response.text}")
+        encounter['id'] = response.json()['name'].rsplit('/', 1)[-1]
+        return encounter
+
+    @timed('get_encounters')
+    def get_encounters(self, player_name, since=None, until=None, limit=100):
+        """
+        Sightings of one player, newest first, optionally limited to a time range.
+        Only the requested range is read, never the whole history.
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
+
+        filters = []
+        if since:
+            filters.append({'fieldFilter': {'field': {'fieldPath': 'time'}, 'op': 'GREATER_THAN_OR_EQUAL',
+                                            'value': {'timestampValue': since}}})
+        if until:
+            filters.append({'fieldFilter': {'field': {'fieldPath': 'time'}, 'op': 'LESS_THAN',
+                                            'value': {'timestampValue': until}}})
+        structured_query = {
+            'from': [{'collectionId': 'encounters'}],
+            'orderBy': [{'field': {'fieldPath': 'time'}, 'direction': 'DESCENDING'}],
+            'limit': limit
+        }
+        if len(filters) == 1:
+            structured_query['where'] = filters[0]
+        elif filters:
+            structured_query['where'] = {'compositeFilter': {'op': 'AND', 'filters': filters}}
+
+        url = f'{self.database_url}/{self.collection("players")}/{player_name.lower()}:runQuery'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        response = self._request('POST', url, headers=headers, json_body={'structuredQuery': structured_query})
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch encounters: {response.text}")
+
+        encounters = []
+        for result in response.json():
+            document = result.get('document')
+            if document:
+                encounter = self.firestore_fields_to_dict(document.get('fields', {}))
+                encounter['id'] = document['name'].rsplit('/', 1)[-1]
+                encounter.setdefault('player', player_name)
+                encounters.append(encounter)
+        return encounters
+
+    @timed('get_encounters_since')
+    def get_encounters_since(self, player_name, since=None, page_size=300):
+        """
+        Every sighting of one player at or after since, oldest first, for keeping a local copy current.
+        Pages forward with a (time, document) cursor until a short page, so a backlog bigger than one
+        page is fetched completely instead of only its newest part.
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
+
+        url = f'{self.database_url}/{self.collection("players")}/{player_name.lower()}:runQuery'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        encounters = []
+        cursor = None
+        while True:
+            structured_query = {
+                'from': [{'collectionId': 'encounters'}],
+                'orderBy': [{'field': {'fieldPath': 'time'}, 'direction': 'ASCENDING'},
+                            {'field': {'fieldPath': '__name__'}, 'direction': 'ASCENDING'}],
+                'limit': page_size
+            }
+            if since:
+                structured_query['where'] = {'fieldFilter': {'field': {'fieldPath': 'time'}, 'op': 'GREATER_THAN_OR_EQUAL',
+                                                             'value': {'timestampValue': since}}}
+            if cursor:
+                structured_query['startAt'] = {
+                    'values': [{'timestampValue': cursor[0]}, {'referenceValue': cursor[1]}],
+                    'before': False
+                }
+            response = self._request('POST', url, headers=headers, json_body={'structuredQuery': structured_query})
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch encounters: {response.text}")
+
+            page = [result['document'] for result in response.json() if result.get('document')]
+            for document in page:
+                encounter = self.firestore_fields_to_dict(document.get('fields', {}))
+                encounter['id'] = document['name'].rsplit('/', 1)[-1]
+                encounter.setdefault('player', player_name)
+                encounters.append(encounter)
+            if len(page) < page_size:
+                return encounters
+            last = page[-1]
+            cursor = (last['fields']['time']['timestampValue'], last['name'])
+
+    def get_player_document(self, name):
+        """
+        A player document as Firestore returns it (including updateTime), or None if there is none.
+        """
+        self.check_user_permission()
+        url = f'{self.database_url}/{self.collection("players")}/{name.lower()}'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}'
+        }
+        response = self._request('GET', url, headers=headers)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise TransientLookupError(f"HTTP {response.status_code}")
+        return response.json()
+
+    def get_encounter_documents(self, player_name):
+        """
+        Every encounter document of a player, as returned by Firestore (used to move them on merge).
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
+
+        url = f'{self.database_url}/{self.collection("players")}/{player_name.lower()}/encounters'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        documents = []
+        page_token = None
+        while True:
+            params = {'pageSize': self.page_size}
+            if page_token:
+                params['pageToken'] = page_token
+            response = self._request('GET', url, headers=headers, params=params)
+            if response.status_code != 200:
+                raise Exception(f"Failed to list encounters: {response.text}")
+            data = response.json()
+            documents.extend(data.get('documents', []))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return documents
+
+    def get_last_seen(self, player_name):
+        encounters = self.get_encounters(player_name, limit=1)
+        return encounters[0] if encounters else None
+
+    def log_entry_from_document(self, document):
+        entry = self.firestore_fields_to_dict(document.get('fields', {}))
+        entry['id'] = document['name'].rsplit('/', 1)[-1]
+        changes = entry.get('changes')
+        if isinstance(changes, str):
+            # Older entries stored changes as a JSON string
+            try:
+                entry['changes'] = json.loads(changes)
+            except ValueError:
+                entry['changes'] = {'raw': changes}
+        return entry
 
     def get_adjusted_timestamp(self):
         """
@@ -212,65 +2238,131 @@ class FirebaseService:
 
         return formatted_time
 
+    @timed('get_player_by_name')
     def get_player_by_name(self, name):
         self.check_user_permission()  # Check if user has 'user' role
         doc_name = name.lower()
-        url = f'{self.database_url}/players/{doc_name}'
+        try:
+            return self.player_cache.get_or_load(doc_name, lambda: self._get_player_uncached(name, doc_name))
+        except TransientLookupError:
+            return None
+
+    @timed('get_player_for_update')
+    def get_player_for_update(self, name):
+        """
+        Reads a player straight from Firestore before a read-modify-write. Unlike get_player_by_name it
+        skips the cache, so an edit another scout made within the cache TTL isn't written back over,
+        and it raises TransientLookupError when the lookup failed instead of returning None, so a
+        failed read is never taken for a player that doesn't exist.
+        """
+        self.check_user_permission()
+        doc_name = name.lower()
+        player = self._get_player_uncached(name, doc_name)
+        self.player_cache.put(doc_name, player)
+        return player
+
+    def _get_player_uncached(self, name, doc_name):
+        url = f'{self.database_url}/{self.collection("players")}/{doc_name}'
         headers = {
             'Authorization': f'Bearer {self.id_token}'
         }
-        response = requests.get(url, headers=headers)
-        print(f"Fetching player '{name}' from Firestore.")
-        print(f"Response status code: {response.status_code}")
-        print(f"Response content: {response.content}")
+        response = self._request('GET', url, headers=headers)
         if response.status_code == 200:
             try:
                 firestore_data = response.json()
                 # Check if 'fields' key exists
                 if 'fields' in firestore_data:
-                    player_data = self.firestore_fields_to_dict(firestore_data['fields'])
-                    return player_data
+                    return self.player_from_document(firestore_data)
                 else:
-                    print(f"No 'fields' in firestore_data for player {name}: {firestore_data}")
+                    logger.warning("No 'fields' in document for player %s", name)
                     return None
             except json.JSONDecodeError as e:
-                print(f"JSON decoding error: {e}")
-                return None
+                logger.error("JSON decoding error for player %s: %s", name, e)
+                raise TransientLookupError(str(e))
         elif response.status_code == 404:
-            print(f"Player '{name}' not found in Firestore.")
+            logger.info("Player '%s' not found in Firestore.", name)
             return None
         else:
-            print(f"Failed to fetch player {name}: {response.status_code} {response.content}")
-            return None
+            logger.error("Failed to fetch player %s: %s %s", name, response.status_code, response.text)
+            raise TransientLookupError(f"HTTP {response.status_code}")
 
+    @timed('get_all_players')
     def get_all_players(self):
         if not self.id_token:
             raise Exception("User not authenticated")
 
-        url = f'{self.database_url}/players'
+        url = f'{self.database_url}/{self.collection("players")}'
 
         headers = {
             'Authorization': f'Bearer {self.id_token}',
         }
 
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            firestore_data = response.json()
-            players = []
-            for document in firestore_data.get('documents', []):
-                if 'fields' in document:
-                    player_data = self.firestore_fields_to_dict(document['fields'])
-                    players.append(player_data)
-                else:
-                    print(f"No 'fields' in document: {document}")
-            return players
-        else:
-            raise Exception(f"Failed to fetch players: {response.json()}")
+        # Firestore returns at most one page per request, so follow nextPageToken until the end
+        players = []
+        page_token = None
+        while True:
+            params = {'pageSize': self.page_size}
+            if page_token:
+                params['pageToken'] = page_token
+            response = self._request('GET', url, headers=headers, params=params)
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch players: {response.json()}")
+
+            with self.stats.span('get_all_players.decode'):
+                firestore_data = response.json()
+                for document in firestore_data.get('documents', []):
+                    if 'fields' in document:
+                        players.append(self.player_from_document(document))
+                    else:
+                        logger.warning("No 'fields' in document: %s", document.get('name'))
+
+            page_token = firestore_data.get('nextPageToken')
+            if not page_token:
+                return players
 
+    @timed('get_players_updated_since')
+    def get_players_updated_since(self, since):
+        """
+        Returns players whose updatedAt is at or after the given timestamp string, oldest first.
+        updatedAt only has whole seconds, so a later write can share the timestamp of the last one seen;
+        callers drop the players they already have.
+        """
+        if not self.id_token:
+            raise Exception("User not authenticated")
 
-    def get_all_discordNames(self):
+        url = f'{self.database_url}:runQuery'
+        headers = {
+            'Authorization': f'Bearer {self.id_token}',
+        }
+        query = {
+            'structuredQuery': {
+                'from': [{'collectionId': self.collection('players')}],
+                'where': {
+                    'fieldFilter': {
+                        'field': {'fieldPath': 'updatedAt'},
+                        'op': 'GREATER_THAN_OR_EQUAL',
+                        'value': {'stringValue': since}
+                    }
+                },
+                'orderBy': [{'field': {'fieldPath': 'updatedAt'}, 'direction': 'ASCENDING'}]
+            }
+        }
+        response = self._request('POST', url, headers=headers, json_body=query)
+        if response.status_code != 200:
+            raise Exception(f"Failed to query updated players: {response.text}")
+
+        players = []
+        for result in response.json():
+            document = result.get('document')
+            if document and 'fields' in document:
+                players.append(self.player_from_document(document))
+        return players
+
+    @timed('get_all_discordNames')
+    def get_all_discordNames(self, players=None):
         discord_Name = {}
-        players = self.get_all_players()
+        if players is None:
+            players = self.get_all_players()
         for player in players:
             discordName = player.get('Discord')
             if discordName and discordName != 'N/A':
@@ -279,10 +2371,12 @@ class FirebaseService:
                 discord_Name[discordName].append(player)
         return discord_Name
 
-    def get_all_guilds(self):
+    @timed('get_all_guilds')
+    def get_all_guilds(self, players=None):
         # Add this method to fetch all guilds and their members from Firebase
         guilds = {}
-        players = self.get_all_players()
+        if players is None:
+            players = self.get_all_players()
         for player in players:
             guild_name = player.get('Guild')
             if guild_name and guild_name != 'N/A':
@@ -291,82 +2385,90 @@ class FirebaseService:
                 guilds[guild_name].append(player)
         return guilds
 
+    @timed('export_to_markdown')
     def export_to_markdown(self, players, guilds, discord_Name):
         """
         Exports the player and guild data to markdown files with links to known associates and guild members.
         """
-        player_path = r"C:LOCALPATH"
-        guild_path = r"C:LOCALPATH" #Be sure to enter your own path here.
-        discord_path = r"C:LOCALPATH"
+        self.check_vault_folders()
+        player_path = self.player_path
+        guild_path = self.guild_path
+        discord_path = self.discord_path
 
         # Ensure output directories exist
         os.makedirs(player_path, exist_ok=True)
         os.makedirs(guild_path, exist_ok=True)
         os.makedirs(discord_path, exist_ok=True)
 
+        # Templates are compiled once per run and then only rendered for each note
+        templates = self.export_config.compile_templates()
+
         # Export player files with links to known associates, discord names, and guilds
         for player in players:
             player_name = player.get('Name', 'Unknown')
             player_file_path = os.path.join(player_path, f"{player_name}.md")
+            content = templates['player'].render(dict(player, Name=player_name))
 
-            with open(player_file_path, "w") as player_file:
-                player_file.write(f"# {player_name}\n")
-                player_file.write(f"- **Level**: {player.get('Level', 'N/A')}\n")
-                player_file.write(f"- **Class**: {player.get('Class', 'N/A')}\n")
-                player_file.write(f"- **Hostile Status**: {player.get('Hostile Status', 'N/A')}\n")
-                player_file.write(f"- **Subclass**: {player.get('Subclass', 'N/A')}\n")
-                guild = player.get('Guild', 'N/A')
-                if guild != 'N/A':
-                    player_file.write(f"- **Guild**: [{guild}](../Guilds/{guild}.md)\n")
-                else:
-                    player_file.write(f"- **Guild**: N/A\n")
-
-                # Known Associates
-                associates = player.get('Known Associates', [])
-                if associates:
-                    player_file.write("\n## Known Associates\n")
-                    for associate in associates:
-                        player_file.write(f"- [{associate}](../Players/{associate}.md)\n")
-
-                # Discord name
-                if player.get('Discord'):
-                    discord_name = player['Discord']
-                    player_file.write(f"\n- **Discord Name**: [{discord_name}](../Discord/{discord_name}.md)\n")
+            # Remember what was exported so edits made in Obsidian can be diffed against it later
+            self.write_vault_note(player_file_path, content, base=VaultIndex.player_base(player))
 
         # Export guild files with links to members
         for guild_name, members in guilds.items():
             guild_file_path = os.path.join(guild_path, f"{guild_name}.md")
-
-            with open(guild_file_path, "w") as guild_file:
-                guild_file.write(f"# Guild: {guild_name}\n\n")
-                guild_file.write("## Members\n")
-                for member in members:
-                    guild_file.write(f"- [{member['Name']}](../Players/{member['Name']}.md)\n")
+            content = templates['guild'].render({'name': guild_name, 'members': members, 'count': len(members)})
+            self.write_vault_note(guild_file_path, content, base=[member['Name'] for member in members])
 
         # Export discord files with links to Players
         for discordName, chars in discord_Name.items():
             discord_file_path = os.path.join(discord_path, f"{discordName}.md")
+            content = templates['discord'].render({'name': discordName, 'members': chars, 'count': len(chars)})
+            self.write_vault_note(discord_file_path, content, base=[char['Name'] for char in chars])
 
-            with open(discord_file_path, "w") as discord_file:
-                discord_file.write(f"# Discord: {discordName}\n\n")
-                discord_file.write("## Characters\n")
-                for char in chars:
-                    discord_file.write(f"- [{char['Name']}](../Players/{char['Name']}.md)\n")
+        self.vault_index.save()
+        logger.info("Export completed: %d players, %d guilds, %d discord names.",
+                    len(players), len(guilds), len(discord_Name))
 
-        print("Export completed.")
+    def write_vault_note(self, path, content, base=None):
+        data = content.encode('utf-8')
+        with open(path, 'wb') as note_file:
+            note_file.write(data)
+        self.vault_index.record(path, data, base)
 
     def dict_to_firestore_fields(self, data_dict):
         fields = {}
         for key, value in data_dict.items():
-            if isinstance(value, int):
-                fields[key] = {'integerValue': str(value)}
-            elif isinstance(value, list):
-                # Handle lists, specifically for Known Associates
-                fields[key] = {'arrayValue': {'values': [{'stringValue': item} for item in value]}}
-            else:
-                fields[key] = {'stringValue': value}
+            fields[key] = self.to_firestore_value(value)
         return fields
 
+    def to_firestore_value(self, value):
+        if isinstance(value, bool):
+            return {'booleanValue': value}
+        elif isinstance(value, int):
+            return {'integerValue': str(value)}
+        elif isinstance(value, float):
+            return {'doubleValue': value}
+        elif isinstance(value, list):
+            # Handle lists, specifically for Known Associates
+            return {'arrayValue': {'values': [self.to_firestore_value(item) for item in value]}}
+        elif isinstance(value, dict):
+            # Nested maps, e.g. the structured 'changes' of a log entry
+            return {'mapValue': {'fields': self.dict_to_firestore_fields(value)}}
+        elif value is None:
+            return {'nullValue': None}
+        else:
+            return {'stringValue': value}
+
+    def player_from_document(self, document):
+        """
+        Converts a player document. Players saved before createdAt existed get it from the document's
+        createTime, shifted like get_adjusted_timestamp, so analytics can tell when they were added.
+        """
+        player_data = self.firestore_fields_to_dict(document['fields'])
+        if 'createdAt' not in player_data and document.get('createTime'):
+            created = datetime.strptime(document['createTime'][:19], '%Y-%m-%dT%H:%M:%S')  # UTC
+            player_data['createdAt'] = (created - timedelta(hours=4)).isoformat(timespec='seconds') + 'Z'
+        return player_data
+
     def firestore_fields_to_dict(self, fields_dict):
         data = {}
         for key, value_dict in fields_dict.items():
@@ -376,16 +2478,1411 @@ class FirebaseService:
                 data[key] = int(value_dict['integerValue'])
             elif 'arrayValue' in value_dict:
                 array_values = value_dict['arrayValue'].get('values', [])
-                data[key] = [item.get('stringValue', '') for item in array_values]
+                data[key] = [self.from_firestore_value(item) for item in array_values]
             else:
-                data[key] = None
+                data[key] = self.from_firestore_value(value_dict)
         return data
 
+    def from_firestore_value(self, value_dict):
+        if 'stringValue' in value_dict:
+            return value_dict['stringValue']
+        elif 'integerValue' in value_dict:
+            return int(value_dict['integerValue'])
+        elif 'timestampValue' in value_dict:
+            return value_dict['timestampValue']
+        elif 'booleanValue' in value_dict:
+            return value_dict['booleanValue']
+        elif 'doubleValue' in value_dict:
+            return float(value_dict['doubleValue'])
+        elif 'mapValue' in value_dict:
+            return self.firestore_fields_to_dict(value_dict['mapValue'].get('fields', {}))
+        elif 'arrayValue' in value_dict:
+            return [self.from_firestore_value(item) for item in value_dict['arrayValue'].get('values', [])]
+        return None
+
+
+def filter_and_sort_players(players, filters, sort_by=None):
+    """
+    Applies the View tab filters (case-insensitive exact match) and sort order to a list of players.
+    """
+    filtered_data = players
+    for key, value in filters.items():
+        if value:
+            filtered_data = [player for player in filtered_data if player.get(key, '').lower() == value.lower()]
+    filtered_data = list(filtered_data)
+
+    # Sort data
+    if sort_by:
+        try:
+            if sort_by == 'Level':
+                filtered_data.sort(key=lambda x: x.get(sort_by, 0))
+            else:
+                filtered_data.sort(key=lambda x: x.get(sort_by, '').lower())
+        except KeyError:
+            pass
+    return filtered_data
+
+
+def optional_numpy():
+    """
+    numpy is optional and slow to import, so it is only imported the first time analytics need it.
+    Returns None when it isn't installed; RosterColumns then falls back to plain Python loops.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            _numpy = importlib.import_module('numpy')
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+_numpy = False  # Not tried yet
+
+
+class RosterColumns:
+    """
+    Column-oriented copy of the roster for the analytics tab.
+    Text fields are dictionary-encoded into int32 columns (array('i'), viewed as numpy arrays without
+    copying), so grouped counts, histograms and percentiles are a few vectorized passes instead of
+    loops over player dicts. Rows are updated in place as players change; removed players are only
+    flagged dead, so nothing is ever rebuilt for a single change.
+    """
+    CATEGORY_FIELDS = ('Guild', 'Class', 'Subclass', 'Hostile Status', 'Guild Rank', 'Month')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0  # Bumped on every change so the UI can skip redundant refreshes
+        self.clear()
+
+    def clear(self):
+        self.rows = {}  # lowercased name -> row
+        self.names = []
+        self.level = array('i')  # -1 when unknown
+        self.alive = array('b')
+        self.codes = {field: array('i') for field in self.CATEGORY_FIELDS}
+        self.vocab = {field: [] for field in self.CATEGORY_FIELDS}
+        self.code_of = {field: {} for field in self.CATEGORY_FIELDS}
+
+    @staticmethod
+    def month_of(player):
+        # Players read from Firestore always have createdAt (see player_from_document); updatedAt is only
+        # a fallback for rosters loaded from snapshots taken before that
+        return (player.get('createdAt') or player.get('updatedAt') or '')[:7] or 'Unknown'
+
+    def _code(self, field, value):
+        value = value if isinstance(value, str) and value else 'N/A'
+        code = self.code_of[field].get(value)
+        if code is None:
+            code = self.code_of[field][value] = len(self.vocab[field])
+            self.vocab[field].append(value)
+        return code
+
+    def _upsert(self, player):
+        key = player['Name'].lower()
+        try:
+            level = int(player.get('Level'))
+        except (TypeError, ValueError):
+            level = -1
+        values = {field: player.get(field) for field in self.CATEGORY_FIELDS}
+        values['Month'] = self.month_of(player)
+        row = self.rows.get(key)
+        if row is None:
+            self.rows[key] = len(self.names)
+            self.names.append(player['Name'])
+            self.level.append(level)
+            self.alive.append(1)
+            for field in self.CATEGORY_FIELDS:
+                self.codes[field].append(self._code(field, values[field]))
+        else:
+            self.level[row] = level
+            self.alive[row] = 1
+            for field in self.CATEGORY_FIELDS:
+                self.codes[field][row] = self._code(field, values[field])
+
+    def rebuild(self, players):
+        with self._lock:
+            self.clear()
+            for player in players:
+                if player.get('Name'):
+                    self._upsert(player)
+            self.version += 1
+
+    def apply_changes(self, changed=(), removed=()):
+        """
+        Change listener: updates only the rows of the given players.
+        """
+        with self._lock:
+            for player in changed:
+                if player.get('Name'):
+                    self._upsert(player)
+            for name in removed:
+                row = self.rows.get(name.lower())
+                if row is not None:
+                    self.alive[row] = 0
+            self.version += 1
+
+    def __len__(self):
+        return sum(self.alive)
+
+    def _matching_codes(self, field, value):
+        value = value.lower()
+        return [code for code, text in enumerate(self.vocab[field]) if text.lower() == value]
+
+    def _selection(self, np, filters):
+        """
+        Row selection for the View tab style filters (case-insensitive exact match).
+        numpy: a boolean mask. Without numpy: a list of row numbers.
+        """
+        wanted = {field: self._matching_codes(field, value) for field, value in (filters or {}).items() if value}
+        if np is not None:
+            mask = np.frombuffer(self.alive, dtype=np.int8) == 1
+            for field, codes in wanted.items():
+                mask &= np.isin(np.frombuffer(self.codes[field], dtype=np.int32), codes)
+            return mask
+        rows = [row for row, alive in enumerate(self.alive) if alive]
+        for field, codes in wanted.items():
+            column = self.codes[field]
+            codes = set(codes)
+            rows = [row for row in rows if column[row] in codes]
+        return rows
+
+    def group_counts(self, field, filters=None):
+        """
+        [(value, players)] for every value of field in the selection, largest group first.
+        """
+        np = optional_numpy()
+        with self._lock:
+            selection = self._selection(np, filters)
+            if np is not None:
+                codes = np.frombuffer(self.codes[field], dtype=np.int32)[selection]
+                counts = np.bincount(codes, minlength=len(self.vocab[field])).tolist()
+            else:
+                counts = [0] * len(self.vocab[field])
+                column = self.codes[field]
+                for row in selection:
+                    counts[column[row]] += 1
+            vocab = list(self.vocab[field])
+        return sorted(((vocab[code], count) for code, count in enumerate(counts) if count),
+                      key=lambda item: (-item[1], item[0].lower()))
+
+    def crosstab(self, row_field, col_field, filters=None):
+        """
+        {row value: {column value: players}}, e.g. class mix per hostile status.
+        """
+        np = optional_numpy()
+        with self._lock:
+            selection = self._selection(np, filters)
+            width = max(1, len(self.vocab[col_field]))
+            if np is not None:
+                row_codes = np.frombuffer(self.codes[row_field], dtype=np.int32)[selection]
+                col_codes = np.frombuffer(self.codes[col_field], dtype=np.int32)[selection]
+                flat = np.bincount(row_codes.astype(np.int64) * width + col_codes,
+                                   minlength=len(self.vocab[row_field]) * width).tolist()
+            else:
+                flat = [0] * (len(self.vocab[row_field]) * width)
+                row_column, col_column = self.codes[row_field], self.codes[col_field]
+                for row in selection:
+                    flat[row_column[row] * width + col_column[row]] += 1
+            row_vocab, col_vocab = list(self.vocab[row_field]), list(self.vocab[col_field])
+        table = {}
+        for index, count in enumerate(flat):
+            if count:
+                table.setdefault(row_vocab[index // width], {})[col_vocab[index % width]] = count
+        return table
+
+    def level_histogram(self, filters=None, bin_width=5):
+        """
+        [(lowest level in bin, players)] for players with a known level.
+        """
+        np = optional_numpy()
+        with self._lock:
+            selection = self._selection(np, filters)
+            if np is not None:
+                levels = np.frombuffer(self.level, dtype=np.int32)[selection]
+                counts = np.bincount(levels[levels >= 0] // bin_width).tolist()
+            else:
+                counts = []
+                for row in selection:
+                    level = self.level[row]
+                    if level >= 0:
+                        bucket = level // bin_width
+                        if bucket >= len(counts):
+                            counts.extend([0] * (bucket + 1 - len(counts)))
+                        counts[bucket] += 1
+        return [(bucket * bin_width, count) for bucket, count in enumerate(counts) if count]
+
+    def level_stats(self, group_field=None, filters=None, pcts=(50, 90)):
+        """
+        Players, mean level and nearest-rank level percentiles, per value of group_field (or overall
+        under the key 'All'). Percentiles of every group come out of one sort.
+        """
+        np = optional_numpy()
+        with self._lock:
+            selection = self._selection(np, filters)
+            vocab = list(self.vocab[group_field]) if group_field else ['All']
+            if np is not None:
+                levels = np.frombuffer(self.level, dtype=np.int32)[selection]
+                if group_field:
+                    groups = np.frombuffer(self.codes[group_field], dtype=np.int32)[selection]
+                else:
+                    groups = np.zeros(len(levels), dtype=np.int32)
+                known = levels >= 0
+                levels, groups = levels[known], groups[known]
+                order = np.lexsort((levels, groups))
+                levels, groups = levels[order], groups[order]
+                counts = np.bincount(groups, minlength=len(vocab))
+                sums = np.bincount(groups, weights=levels, minlength=len(vocab))
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+                present = np.nonzero(counts)[0]
+                ranks = {}
+                for pct in pcts:
+                    offsets = np.clip(np.ceil(pct / 100.0 * counts[present]).astype(np.int64) - 1, 0, None)
+                    ranks[pct] = levels[starts[present] + offsets].tolist()
+                stats = {}
+                for position, code in enumerate(present.tolist()):
+                    entry = {'players': int(counts[code]), 'mean': round(float(sums[code]) / int(counts[code]), 1)}
+                    for pct in pcts:
+                        entry[f'p{pct}'] = ranks[pct][position]
+                    stats[vocab[code]] = entry
+                return stats
+
+            by_group = {}
+            group_column = self.codes[group_field] if group_field else None
+            for row in selection:
+                level = self.level[row]
+                if level >= 0:
+                    by_group.setdefault(group_column[row] if group_field else 0, []).append(level)
+        stats = {}
+        for code, levels in by_group.items():
+            levels.sort()
+            entry = {'players': len(levels), 'mean': round(sum(levels) / len(levels), 1)}
+            for pct in pcts:
+                entry[f'p{pct}'] = percentile(levels, pct)
+            stats[vocab[code]] = entry
+        return stats
+
+    def compare_guilds(self, guild_names, filters=None):
+        """
+        Side by side numbers for a few guilds: size, level stats, class mix and hostile status mix.
+        """
+        comparison = {}
+        for guild in guild_names:
+            guild_filters = dict(filters or {}, Guild=guild)
+            comparison[guild] = {
+                'levels': self.level_stats(filters=guild_filters, pcts=(25, 50, 75, 90)).get('All', {'players': 0}),
+                'classes': dict(self.group_counts('Class', guild_filters)),
+                'status': dict(self.group_counts('Hostile Status', guild_filters)),
+            }
+        return comparison
+
+    def growth(self, filters=None):
+        """
+        [(month, players added that month, running total)], oldest month first.
+        """
+        running = 0
+        growth = []
+        for month, count in sorted(self.group_counts('Month', filters)):
+            running += count
+            growth.append((month, count, running))
+        return growth
+
+
+class RosterSync:
+    """
+    Keeps a warm in-memory copy of the roster and rewrites only the vault notes touched by a change.
+    """
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+        self.players = {}  # lowercased name -> player dict
+        self.last_updated_at = ''  # Highest updatedAt seen so far
+
+    def full_sync(self, export=True):
+        """
+        Downloads the whole roster and (optionally) rewrites every vault note.
+        """
+        players = self.firebase_service.get_all_players()
+        self.players = {player['Name'].lower(): player for player in players if player.get('Name')}
+        self.last_updated_at = max((player.get('updatedAt', '') for player in players), default='')
+        if export:
+            self.firebase_service.export_to_markdown(
+                players,
+                self.firebase_service.get_all_guilds(players),
+                self.firebase_service.get_all_discordNames(players)
+            )
+        return len(players)
+
+    def seed(self, players, max_updated_at=''):
+        """
+        Starts from a roster loaded from a snapshot, so the next incremental_sync only fetches newer changes.
+        """
+        self.players = {player['Name'].lower(): player for player in players if player.get('Name')}
+        self.last_updated_at = max_updated_at or max((player.get('updatedAt', '') for player in players), default='')
+
+    def incremental_sync(self, export=True):
+        """
+        Fetches players changed since the last sync and rewrites only their notes and the guild and
+        Discord pages they were (or are now) listed on. Returns the changed players.
+        """
+        # The query includes the last updatedAt seen, so skip what we already have from that second
+        changed = [player for player in self.firebase_service.get_players_updated_since(self.last_updated_at)
+                   if player.get('Name') and self.players.get(player['Name'].lower()) != player]
+        if not changed:
+            return []
+
+        affected_guilds = set()
+        affected_discord = set()
+        for player in changed:
+            key = player['Name'].lower()
+            old = self.players.get(key)
+            for record in (old, player):
+                if record:
+                    affected_guilds.add(record.get('Guild'))
+                    affected_discord.add(record.get('Discord'))
+            self.players[key] = player
+            self.firebase_service.player_cache.put(key, player)
+            self.last_updated_at = max(self.last_updated_at, player.get('updatedAt', ''))
+        self.firebase_service._notify_change(changed=changed)
+
+        if export:
+            roster = list(self.players.values())
+            guilds = self.firebase_service.get_all_guilds(roster)
+            discord_names = self.firebase_service.get_all_discordNames(roster)
+            self.firebase_service.export_to_markdown(
+                changed,
+                {name: guilds.get(name, []) for name in affected_guilds if name and name != 'N/A'},
+                {name: discord_names.get(name, []) for name in affected_discord if name and name != 'N/A'}
+            )
+        return changed
+
+
+class AssociateConsistencyJob:
+    """
+    Finds one-sided and dangling Known Associates links in a single pass over the roster and repairs
+    them with batched commits instead of a GET/PATCH pair per player.
+    """
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+
+    def scan(self, players):
+        """
+        Returns a report with:
+          one_sided: (player, associate) where associate exists but doesn't list player back
+          dangling:  (player, associate) where associate has no player document
+        """
+        by_name = {}
+        associate_sets = {}
+        for player in players:
+            name = player.get('Name')
+            if not name:
+                continue
+            key = name.lower()
+            by_name[key] = player
+            associate_sets[key] = {associate.lower() for associate in player.get('Known Associates') or []}
+
+        one_sided = []
+        dangling = []
+        for key, player in by_name.items():
+            for associate in player.get('Known Associates') or []:
+                associate_key = associate.lower()
+                if associate_key == key:
+                    continue
+                if associate_key not in by_name:
+                    dangling.append((player['Name'], associate))
+                elif key not in associate_sets[associate_key]:
+                    one_sided.append((player['Name'], by_name[associate_key]['Name']))
+
+        return {
+            'players_scanned': len(by_name),
+            'one_sided': one_sided,
+            'dangling': dangling
+        }
+
+    def plan_fixes(self, players, report, prune_dangling=False):
+        """
+        Returns {player name: {'append': [links], 'remove': [links]}}. One-sided links get the missing
+        back-link; dangling links are only removed when prune_dangling is set (the player may just not
+        be entered yet). Only the links themselves are written, never the whole list from the scan.
+        """
+        by_name = {player['Name'].lower(): player for player in players if player.get('Name')}
+        fixes = {}
+
+        def fix_of(name):
+            return fixes.setdefault(name.lower(), {'append': [], 'remove': []})
+
+        for player_name, associate_name in report['one_sided']:
+            append = fix_of(associate_name)['append']
+            if player_name.lower() not in {link.lower() for link in append}:
+                append.append(player_name)
+
+        if prune_dangling:
+            for player_name, associate_name in report['dangling']:
+                fix_of(player_name)['remove'].append(associate_name)
+
+        return {by_name[key]['Name']: fix for key, fix in fixes.items()}
+
+    def run(self, players=None, dry_run=True, prune_dangling=False):
+        service = self.firebase_service
+        if players is None:
+            players = service.get_all_players()
+
+        with service.stats.span('associate_check.scan'):
+            report = self.scan(players)
+            fixes = self.plan_fixes(players, report, prune_dangling=prune_dangling)
+        report['players_to_update'] = len(fixes)
+        logger.info("Associate check: %d one-sided, %d dangling, %d players to update.",
+                    len(report['one_sided']), len(report['dangling']), len(fixes))
+
+        if dry_run or not fixes:
+            report['committed'] = 0
+            return report
+
+        # Separate writes for adding and removing: Firestore transforms a field once per write
+        writes = []
+        for name, fix in fixes.items():
+            if fix['remove']:
+                writes.append(service.player_field_update(name, remove={'Known Associates': fix['remove']}))
+            if fix['append']:
+                writes.append(service.player_field_update(name, append={'Known Associates': fix['append']}))
+        report['committed'] = service.commit_writes(writes)
+
+        # Keep cached documents in line with what was just written
+        by_name = {player['Name'].lower(): player for player in players if player.get('Name')}
+        changed = []
+        for name, fix in fixes.items():
+            service.player_cache.invalidate(name.lower())
+            if name.lower() in by_name:
+                associates = [link for link in by_name[name.lower()].get('Known Associates') or []
+                              if link not in fix['remove']]
+                changed.append(dict(by_name[name.lower()], **{'Known Associates': associates + fix['append']}))
+        service._notify_change(changed=changed)
+        service.log_user_action(action_type='associate_repair', player_name='*',
+                                changes={'players_updated': len(fixes),
+                                         'one_sided_fixed': len(report['one_sided']),
+                                         'dangling_pruned': len(report['dangling']) if prune_dangling else 0})
+        return report
+
+
+EMPTY_FIELD_VALUES = (None, '', 'N/A', 'Unknown', 'Unavailable')
+
+
+def normalize_player_name(name):
+    """
+    'Dark  Knight_', 'darkknight' and 'DárkKnight' all normalise to 'darkknight'.
+    """
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    return ''.join(char for char in decomposed.lower() if char.isalnum())
+
+
+def name_trigrams(normalized):
+    padded = f'^{normalized}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DuplicateFinder:
+    """
+    Finds likely duplicate entries (typos, spacing variants) and alts sharing a Discord name.
+
+    Rather than comparing every pair of players, each player is put into a few blocking buckets
+    (normalised name, name trigrams, Discord name) and only players sharing a bucket are scored.
+    Trigrams shared by more than max_bucket_size players are too common to say anything and are skipped.
+    Pairs scoring at least threshold are reported as 'duplicate'; other pairs on the same Discord
+    name are reported as 'alt', however different their names are.
+    """
+    def __init__(self, threshold=0.6, max_bucket_size=50, min_shared_trigrams=3):
+        self.threshold = threshold
+        self.max_bucket_size = max_bucket_size
+        self.min_shared_trigrams = min_shared_trigrams
+
+    def candidate_pairs(self, players):
+        """
+        Returns {(i, j): set of blocking reasons} for index pairs worth scoring.
+        """
+        buckets = {}
+        for index, player in enumerate(players):
+            normalized = normalize_player_name(player.get('Name'))
+            if not normalized:
+                continue
+            buckets.setdefault(('name', normalized), []).append(index)
+            for trigram in name_trigrams(normalized):
+                buckets.setdefault(('trigram', trigram), []).append(index)
+            discord_name = (player.get('Discord') or '').strip().lower()
+            if discord_name and discord_name != 'n/a':
+                buckets.setdefault(('discord', discord_name), []).append(index)
+
+        pairs = {}
+        shared_trigrams = {}
+        for (kind, _), members in buckets.items():
+            if len(members) < 2 or len(members) > self.max_bucket_size:
+                continue
+            for pair in combinations(members, 2):
+                if kind == 'trigram':
+                    shared_trigrams[pair] = shared_trigrams.get(pair, 0) + 1
+                else:
+                    pairs.setdefault(pair, set()).add(kind)
+
+        for pair, shared in shared_trigrams.items():
+            if shared >= self.min_shared_trigrams:
+                pairs.setdefault(pair, set()).add('trigram')
+        return pairs
+
+    def score(self, first, second):
+        """
+        Returns (score between 0 and 1, list of reasons).
+        """
+        first_name = normalize_player_name(first.get('Name'))
+        second_name = normalize_player_name(second.get('Name'))
+        reasons = []
+        if first_name == second_name:
+            name_similarity = 1.0
+            reasons.append('same normalised name')
+        else:
+            name_similarity = SequenceMatcher(None, first_name, second_name).ratio()
+            if name_similarity >= 0.75:
+                reasons.append(f'similar name ({name_similarity:.2f})')
+
+        score = 0.6 * name_similarity
+        discord_name = (first.get('Discord') or '').strip().lower()
+        if discord_name and discord_name != 'n/a' and discord_name == (second.get('Discord') or '').strip().lower():
+            score += 0.25
+            reasons.append('same Discord')
+        if first.get('Guild') not in EMPTY_FIELD_VALUES and first.get('Guild') == second.get('Guild'):
+            score += 0.1
+            reasons.append('same guild')
+        if first.get('Class') not in EMPTY_FIELD_VALUES and first.get('Class') == second.get('Class'):
+            score += 0.05
+            reasons.append('same class')
+        return min(score, 1.0), reasons
+
+    def find(self, players):
+        """
+        Returns candidate duplicates sorted by score, best first.
+        """
+        players = [player for player in players if player.get('Name')]
+        candidates = []
+        for (i, j), blocks in self.candidate_pairs(players).items():
+            score, reasons = self.score(players[i], players[j])
+            if score >= self.threshold:
+                kind = 'duplicate'
+            elif 'discord' in blocks:
+                kind = 'alt'
+            else:
+                continue
+            candidates.append({
+                'first': players[i]['Name'],
+                'second': players[j]['Name'],
+                'kind': kind,
+                'score': round(score, 3),
+                'reasons': reasons,
+                'blocks': sorted(blocks)
+            })
+        candidates.sort(key=lambda candidate: candidate['score'], reverse=True)
+        return candidates
+
+
+def merge_player_records(primary, duplicate):
+    """
+    Combines two records of the same player. The primary wins unless its field is empty;
+    the higher level is kept, notes are concatenated and associates are unioned.
+    """
+    merged = dict(primary)
+    for key, value in duplicate.items():
+        if key in ('Name', 'updatedAt', 'updatedBy', 'Known Associates', 'Notes', 'Level'):
+            continue
+        if merged.get(key) in EMPTY_FIELD_VALUES and value not in EMPTY_FIELD_VALUES:
+            merged[key] = value
+
+    levels = [record.get('Level') for record in (primary, duplicate) if isinstance(record.get('Level'), int)]
+    if levels:
+        merged['Level'] = max(levels)
+
+    notes = [record.get('Notes', '').strip() for record in (primary, duplicate)]
+    merged['Notes'] = '\n\n'.join(dict.fromkeys(note for note in notes if note))
+
+    excluded = {primary['Name'].lower(), duplicate['Name'].lower()}
+    associates = {}
+    for associate in (primary.get('Known Associates') or []) + (duplicate.get('Known Associates') or []):
+        if associate.lower() not in excluded:
+            associates.setdefault(associate.lower(), associate)
+    merged['Known Associates'] = list(associates.values())
+    return merged
+
+
+class DuplicateMerger:
+    """
+    Merges a duplicate entry into the primary one and rewrites every back-link to point at the primary,
+    all in one batched commit.
+    """
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+
+    def plan(self, players, primary_name, duplicate_name, update_times=None):
+        """
+        The merged player, the players whose links get rewritten and the writes doing it.
+        update_times maps lowercased names to the updateTime the primary and duplicate were read at;
+        the commit then fails instead of overwriting a change made to either of them since.
+        """
+        service = self.firebase_service
+        by_name = {player['Name'].lower(): player for player in players if player.get('Name')}
+        primary = by_name.get(primary_name.lower())
+        duplicate = by_name.get(duplicate_name.lower())
+        if primary is None or duplicate is None:
+            raise Exception("Both players must exist to merge them.")
+        if primary is duplicate:
+            raise Exception("Can't merge a player into itself.")
+
+        merged = merge_player_records(primary, duplicate)
+        merged['updatedBy'] = service.user['email']
+        merged['updatedAt'] = service.get_adjusted_timestamp()
+        update_times = update_times or {}
+        primary_write = {
+            'update': {
+                'name': service.document_name(f"{service.collection('players')}/{primary['Name'].lower()}"),
+                'fields': service.dict_to_firestore_fields(merged)
+            },
+            'updateMask': {'fieldPaths': [f'`{key}`' if not key.isidentifier() else key for key in merged]},
+            'currentDocument': {'exists': True}
+        }
+        if update_times.get(primary['Name'].lower()):
+            primary_write['currentDocument'] = {'updateTime': update_times[primary['Name'].lower()]}
+        writes = [primary_write]
+
+        # Anyone who listed the duplicate now lists the primary instead
+        duplicate_key = duplicate['Name'].lower()
+        primary_key = primary['Name'].lower()
+        relinked = []
+        for key, player in by_name.items():
+            if key in (primary_key, duplicate_key):
+                continue
+            associates = player.get('Known Associates') or []
+            stale = [associate for associate in associates if associate.lower() == duplicate_key]
+            if not stale:
+                continue
+            # Only the link itself changes, so associates added since the roster was read are kept
+            writes.append(service.player_field_update(player['Name'], remove={'Known Associates': stale}))
+            if primary_key not in {associate.lower() for associate in associates}:
+                writes.append(service.player_field_update(player['Name'], append={'Known Associates': [primary['Name']]}))
+            relinked.append(player['Name'])
+
+        delete = {'delete': service.document_name(f"{service.collection('players')}/{duplicate_key}")}
+        if update_times.get(duplicate_key):
+            delete['currentDocument'] = {'updateTime': update_times[duplicate_key]}
+        writes.append(delete)
+        return merged, relinked, writes
+
+    def encounter_moves(self, primary_name, duplicate_name):
+        """
+        Writes that move the duplicate's sightings under the primary. Deleting a document leaves its
+        subcollections behind, so they have to be moved one by one.
+        """
+        service = self.firebase_service
+        writes = []
+        for document in service.get_encounter_documents(duplicate_name):
+            encounter_id = document['name'].rsplit('/', 1)[-1]
+            fields = dict(document.get('fields', {}))
+            fields['player'] = {'stringValue': primary_name}
+            target = f"{service.collection('players')}/{primary_name.lower()}/encounters/{encounter_id}"
+            writes.append({'update': {'name': service.document_name(target), 'fields': fields}})
+            writes.append({'delete': document['name']})
+        return writes
+
+    def merge(self, primary_name, duplicate_name, players=None, encounter_store=None):
+        """
+        Merges and commits. encounter_store, the local mirror of the sightings, gets the moved
+        sightings filed under the primary too.
+        """
+        service = self.firebase_service
+        if players is None:
+            players = service.get_all_players()
+        # The roster can be minutes old: merge the two players as they are stored right now
+        update_times = {}
+        fresh = {}
+        for name in (primary_name, duplicate_name):
+            document = service.get_player_document(name)
+            if document is None or 'fields' not in document:
+                raise Exception("Both players must exist to merge them.")
+            update_times[name.lower()] = document.get('updateTime')
+            fresh[name.lower()] = service.player_from_document(document)
+        players = [fresh.get((player.get('Name') or '').lower(), player) for player in players]
+        merged, relinked, writes = self.plan(players, primary_name, duplicate_name, update_times)
+        # Sightings move before the duplicate itself is deleted (the last write of the plan)
+        writes[-1:-1] = self.encounter_moves(merged['Name'], duplicate_name)
+        # Normally a single commit; only a huge number of back-links would need more than one chunk
+        try:
+            service.commit_writes(writes)
+        except Exception as e:
+            if 'FAILED_PRECONDITION' in str(e):
+                raise Exception(f"{primary_name} or {duplicate_name} changed while merging; try again.")
+            raise
+        if encounter_store is not None:
+            encounter_store.move(duplicate_name, merged['Name'])
+
+        service.player_cache.put(merged['Name'].lower(), merged)
+        service.player_cache.invalidate(duplicate_name.lower())
+        for name in relinked:
+            service.player_cache.invalidate(name.lower())
+        service._notify_change(changed=[merged], removed=[duplicate_name])
+        service.log_user_action(action_type='merge', player_name=merged['Name'],
+                                changes={'merged_from': duplicate_name, 'relinked': relinked})
+        return merged, relinked
+
+
+class LogCache:
+    """
+    Append-only local copy of the logs collection (one JSON entry per line).
+    Each sync only asks Firestore for entries at or after the newest timestamp already cached.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = None  # Loaded lazily, oldest first
+        self.ids = set()
+        self.by_player = {}  # lowercased player name -> entries
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        self.entries = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            self._index(json.loads(line))
+                        except ValueError:
+                            logger.warning("Skipping damaged line in %s", self.path)
+        except FileNotFoundError:
+            pass
+
+    def _index(self, entry):
+        self.entries.append(entry)
+        self.ids.add(entry['id'])
+        self.by_player.setdefault((entry.get('playerName') or '').lower(), []).append(entry)
+
+    def latest_timestamp(self):
+        with self._lock:
+            self._load()
+            return self.entries[-1].get('timestamp') if self.entries else None
+
+    def sync(self, firebase_service, page_size=500):
+        """
+        Fetches and appends log entries newer than the cache. Returns the number of new entries.
+        """
+        since = self.latest_timestamp()
+        added = 0
+        cursor = None
+        while True:
+            entries, cursor = firebase_service.query_logs(since=since, limit=page_size, cursor=cursor, ascending=True)
+            with self._lock:
+                new_entries = [entry for entry in entries if entry['id'] not in self.ids]
+                if new_entries:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    with open(self.path, 'a') as f:
+                        for entry in new_entries:
+                            f.write(json.dumps(entry) + '\n')
+                            self._index(entry)
+                    added += len(new_entries)
+            if not cursor:
+                return added
+
+    def query(self, player_name=None, email=None, field=None, limit=None):
+        """
+        Searches the local cache, newest first. field keeps only entries whose changes touch that field.
+        """
+        with self._lock:
+            self._load()
+            entries = self.by_player.get(player_name.lower(), []) if player_name else self.entries
+            results = []
+            for entry in reversed(entries):
+                if email and entry.get('email', '').lower() != email.lower():
+                    continue
+                if field and field not in (entry.get('changes') or {}):
+                    continue
+                results.append(entry)
+                if limit and len(results) >= limit:
+                    break
+            return results
+
+
+def summarize_log_changes(changes):
+    if not isinstance(changes, dict):
+        return str(changes)
+    parts = []
+    for key, value in changes.items():
+        if isinstance(value, dict) and 'old' in value and 'new' in value:
+            parts.append(f"{key}: {value['old']} -> {value['new']}")
+        else:
+            parts.append(f"{key}: {value}")
+    return '; '.join(parts)
+
+
+class EncounterStore:
+    """
+    Local, time-indexed mirror of the encounters subcollections.
+    Each player's sightings are kept sorted by time, so timelines are a bisect and "last seen" is the
+    last element; the file is append-only JSONL.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.by_player = None  # lowercased name -> (sorted times, encounters in the same order)
+        self.ids = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.by_player is not None:
+            return
+        self.by_player = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            self._insert(json.loads(line))
+                        except ValueError:
+                            logger.warning("Skipping damaged line in %s", self.path)
+        except FileNotFoundError:
+            pass
+
+    def _insert(self, encounter):
+        if encounter.get('id') in self.ids:
+            return False
+        self.ids.add(encounter.get('id'))
+        self._place(encounter)
+        return True
+
+    def _place(self, encounter):
+        times, encounters = self.by_player.setdefault(encounter['player'].lower(), ([], []))
+        position = bisect.bisect_right(times, encounter['time'])
+        times.insert(position, encounter['time'])
+        encounters.insert(position, encounter)
+
+    def add(self, encounters):
+        """
+        Adds encounters (ignoring ones already stored). Returns how many were new.
+        """
+        with self._lock:
+            self._load()
+            new_encounters = [encounter for encounter in encounters if self._insert(encounter)]
+            if new_encounters:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a') as f:
+                    for encounter in new_encounters:
+                        f.write(json.dumps(encounter) + '\n')
+            return len(new_encounters)
+
+    def move(self, from_name, to_name):
+        """
+        Files a player's sightings under another player, like DuplicateMerger does remotely.
+        The ids stay the same, so the file is rewritten rather than appended to. Returns how many moved.
+        """
+        with self._lock:
+            self._load()
+            _, moved = self.by_player.pop(from_name.lower(), ([], []))
+            if not moved:
+                return 0
+            for encounter in moved:
+                encounter['player'] = to_name
+                self._place(encounter)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                for _, encounters in self.by_player.values():
+                    for encounter in encounters:
+                        f.write(json.dumps(encounter) + '\n')
+            os.replace(tmp_path, self.path)
+            return len(moved)
+
+    def timeline(self, player_name, since=None, until=None):
+        """
+        Sightings of a player between since (inclusive) and until (exclusive), oldest first.
+        """
+        with self._lock:
+            self._load()
+            times, encounters = self.by_player.get(player_name.lower(), ([], []))
+            start = bisect.bisect_left(times, since) if since else 0
+            end = bisect.bisect_left(times, until) if until else len(times)
+            return encounters[start:end]
+
+    def last_seen(self, player_name):
+        with self._lock:
+            self._load()
+            _, encounters = self.by_player.get(player_name.lower(), ([], []))
+            return encounters[-1] if encounters else None
+
+    def latest_time(self, player_name):
+        last = self.last_seen(player_name)
+        return last['time'] if last else None
+
+
+def describe_encounter(encounter):
+    parts = [encounter.get('time', '')]
+    if encounter.get('location'):
+        parts.append(f"at {encounter['location']}")
+    if encounter.get('level') is not None:
+        parts.append(f"level {encounter['level']}")
+    if encounter.get('guild') and encounter['guild'] != 'N/A':
+        parts.append(f"in {encounter['guild']}")
+    if encounter.get('status'):
+        parts.append(f"({encounter['status']})")
+    if encounter.get('reporter'):
+        parts.append(f"- reported by {encounter['reporter']}")
+    return ' '.join(parts)
+
+
+class WatchRuleError(Exception):
+    pass
+
+
+class WatchRule:
+    """
+    One watchlist rule, e.g. 'Guild = Red Hand', 'Hostile Status = Hostile and Level >= 40' or
+    'associate of Steven'. Conditions are joined with 'and'; quote values that contain ' and '.
+    """
+    FIELDS = {
+        'name': 'Name', 'level': 'Level', 'class': 'Class', 'subclass': 'Subclass', 'guild': 'Guild',
+        'guild rank': 'Guild Rank', 'rank': 'Guild Rank', 'status': 'Hostile Status',
+        'hostile status': 'Hostile Status', 'discord': 'Discord',
+    }
+    OPERATORS = {'=': '=', '==': '=', '!=': '!=', '>=': '>=', '≥': '>=', '<=': '<=', '≤': '<=', '>': '>', '<': '<'}
+    CONDITION_PATTERN = re.compile(r'^(?P<field>[A-Za-z ]+?)\s*(?P<op>==|!=|>=|<=|=|>|<|≥|≤)\s*(?P<value>.+)$')
+    AND_PATTERN = re.compile(r'\s+and\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', re.IGNORECASE)
+
+    def __init__(self, rule_id, text):
+        self.id = rule_id
+        self.text = text.strip()
+        self.conditions = [self.parse_condition(part) for part in self.AND_PATTERN.split(self.text)]
+
+    @classmethod
+    def parse_condition(cls, text):
+        text = text.strip()
+        associate = re.match(r'^associate\s+of\s+(?P<value>.+)$', text, re.IGNORECASE)
+        if associate:
+            return ('Known Associates', 'has', associate.group('value').strip().strip('"').lower())
+        match = cls.CONDITION_PATTERN.match(text)
+        if not match or match.group('field').strip().lower() not in cls.FIELDS:
+            raise WatchRuleError(f"Can't understand '{text}'. Try e.g. 'Guild = Red Hand', 'Level >= 40' or 'associate of Steven'.")
+        field = cls.FIELDS[match.group('field').strip().lower()]
+        op = cls.OPERATORS[match.group('op')]
+        value = match.group('value').strip().strip('"')
+        if field == 'Level':
+            try:
+                value = int(value)
+            except ValueError:
+                raise WatchRuleError(f"Level must be a number in '{text}'.")
+        elif op not in ('=', '!='):
+            raise WatchRuleError(f"Only = and != work for {field} in '{text}'.")
+        else:
+            value = value.lower()
+        return (field, op, value)
+
+    def matches(self, player):
+        for field, op, value in self.conditions:
+            if op == 'has':
+                if value not in {associate.lower() for associate in player.get(field) or []}:
+                    return False
+                continue
+            if field == 'Level':
+                try:
+                    actual = int(player.get('Level'))
+                except (TypeError, ValueError):
+                    return False
+            else:
+                actual = str(player.get(field) or '').lower()
+            if op == '=' and actual != value:
+                return False
+            if op == '!=' and actual == value:
+                return False
+            if op == '>=' and not actual >= value:
+                return False
+            if op == '<=' and not actual <= value:
+                return False
+            if op == '>' and not actual > value:
+                return False
+            if op == '<' and not actual < value:
+                return False
+        return True
+
+    def anchor(self):
+        """
+        The equality condition used as this rule's index key, picking the most selective field available.
+        """
+        for preferred in ('Name', 'Known Associates', 'Discord', 'Guild', 'Guild Rank', 'Subclass', 'Class', 'Hostile Status'):
+            for field, op, value in self.conditions:
+                if field == preferred and op in ('=', 'has'):
+                    return (field, value)
+        return None
+
+
+class Watchlist:
+    """
+    Watchlist rules, compiled into an index keyed by each rule's most selective equality condition.
+    Checking a changed player only looks up that player's own field values (and associates), so the
+    cost doesn't grow with the number of rules or the roster size. Rules with no equality condition
+    at all (e.g. just 'Level >= 40') are checked against every change.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.rules = {}
+        self.next_id = 1
+        self.desktop_notifications = True
+        self.index = {}  # (field, lowercased value) -> [rules]
+        self.unanchored = []
+        self.matched = {}  # lowercased player name -> ids of the rules it currently matches
+        self.alerts = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.desktop_notifications = data.get('desktop_notifications', True)
+        for rule in data.get('rules', []):
+            try:
+                self.rules[rule['id']] = WatchRule(rule['id'], rule['text'])
+            except WatchRuleError as e:
+                logger.warning("Ignoring watchlist rule %s: %s", rule.get('id'), e)
+        self.next_id = max(self.rules, default=0) + 1
+        self._compile()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'desktop_notifications': self.desktop_notifications,
+                'rules': [{'id': rule.id, 'text': rule.text} for rule in self.rules.values()]
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _compile(self):
+        self.index = {}
+        self.unanchored = []
+        for rule in self.rules.values():
+            key = rule.anchor()
+            if key is None:
+                self.unanchored.append(rule)
+            else:
+                self.index.setdefault(key, []).append(rule)
+        self.indexed_fields = {field for field, _ in self.index if field != 'Known Associates'}
+
+    def add_rule(self, text):
+        rule = WatchRule(self.next_id, text)
+        with self._lock:
+            self.rules[rule.id] = rule
+            self.next_id += 1
+            self._compile()
+        self.save()
+        return rule
+
+    def remove_rule(self, rule_id):
+        with self._lock:
+            self.rules.pop(rule_id, None)
+            for rule_ids in self.matched.values():
+                rule_ids.discard(rule_id)
+            self._compile()
+        self.save()
+
+    def set_desktop_notifications(self, enabled):
+        self.desktop_notifications = enabled
+        self.save()
+
+    def candidates(self, player):
+        rules = list(self.unanchored)
+        for field in self.indexed_fields:
+            rules.extend(self.index.get((field, str(player.get(field) or '').lower()), ()))
+        for associate in player.get('Known Associates') or []:
+            rules.extend(self.index.get(('Known Associates', associate.lower()), ()))
+        return rules
+
+    def match(self, player):
+        with self._lock:
+            return [rule for rule in self.candidates(player) if rule.matches(player)]
+
+    def prime(self, players, rules=None):
+        """
+        Records what already matches without alerting, so only new matches raise alerts.
+        Returns {rule id: [player names]}. This is the only pass over a whole roster.
+        """
+        found = {}
+        with self._lock:
+            rules = list(rules) if rules is not None else None
+            for player in players:
+                if not player.get('Name'):
+                    continue
+                for rule in (rules if rules is not None else self.candidates(player)):
+                    if rule.matches(player):
+                        self.matched.setdefault(player['Name'].lower(), set()).add(rule.id)
+                        found.setdefault(rule.id, []).append(player['Name'])
+        return found
+
+    def check(self, changed=(), removed=()):
+        """
+        Change listener body: returns alerts for players that started matching a rule with this change.
+        """
+        alerts = []
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            for name in removed:
+                self.matched.pop(name.lower(), None)
+            for player in changed:
+                if not player.get('Name'):
+                    continue
+                key = player['Name'].lower()
+                matching = {rule.id: rule for rule in self.candidates(player) if rule.matches(player)}
+                previous = self.matched.get(key, set())
+                if matching:
+                    self.matched[key] = set(matching)
+                else:
+                    self.matched.pop(key, None)
+                for rule in matching.values():
+                    if rule.id in previous:
+                        continue
+                    alert = {'time': now, 'rule_id': rule.id, 'rule': rule.text, 'player': player['Name'],
+                             'level': player.get('Level'), 'guild': player.get('Guild'),
+                             'status': player.get('Hostile Status'), 'updatedBy': player.get('updatedBy')}
+                    self.alerts.appendleft(alert)
+                    alerts.append(alert)
+        return alerts
+
+    def matching_players(self, rule_id):
+        with self._lock:
+            return sorted(name for name, rule_ids in self.matched.items() if rule_id in rule_ids)
+
+    def match_counts(self):
+        with self._lock:
+            counts = dict.fromkeys(self.rules, 0)
+            for rule_ids in self.matched.values():
+                for rule_id in rule_ids:
+                    if rule_id in counts:
+                        counts[rule_id] += 1
+            return counts
+
+
+def describe_alert(alert):
+    details = [f"level {alert['level']}" if alert.get('level') is not None else None,
+               alert.get('guild') if alert.get('guild') not in (None, '', 'N/A') else None,
+               alert.get('status')]
+    return f"{alert['player']} ({', '.join(detail for detail in details if detail)}) matches '{alert['rule']}'"
+
+
+def send_desktop_notification(title, message):
+    """
+    Shows a desktop notification through plyer (optional). Returns False when it couldn't,
+    so the caller can fall back to something else.
+    """
+    try:
+        plyer = importlib.import_module('plyer')
+    except ImportError:
+        return False
+    try:
+        plyer.notification.notify(title=title, message=message, app_name='AOCDB', timeout=10)
+        return True
+    except Exception as e:
+        # plyer raises NotImplementedError when there's no notification backend on this system
+        logger.debug("Desktop notification failed: %s", e)
+        return False
+
+
+class VaultSync:
+    """
+    Pushes edits made to exported notes inside Obsidian back to Firestore.
+    Only fields the user changed in the note are applied, on top of the current remote document,
+    so a concurrent edit to another field isn't overwritten.
+    """
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+        self.vault_index = firebase_service.vault_index
+        self.pending = []  # (path, data, new base, lowercased names the note edited), recorded after the push
+        self.untracked = {}  # lowercased name -> fields that only come from a note missing from the index
+
+    def collect_updates(self, dry_run=False):
+        """
+        Returns {lowercased name: {field: value}} for every field edited in the vault since the last export.
+        Unless dry_run is set, the edited notes are remembered in pending; push_updates makes them the new
+        base in the index once their edits reached Firestore.
+        """
+        updates = {}
+        self.pending = []
+        self.untracked = {}
+        service = self.firebase_service
+        service.check_vault_folders()
+
+        with service.stats.span('vault_sync.players'):
+            for path, data, entry in self.vault_index.changed_files(service.player_path):
+                parsed = parse_player_markdown(data.decode('utf-8', errors='replace'))
+                name = parsed.get('Name') or os.path.splitext(os.path.basename(path))[0]
+                base = (entry or {}).get('base') or {}
+                edited = {key: value for key, value in parsed.items()
+                          if key in VaultIndex.PLAYER_FIELDS and value != base.get(key)}
+                if edited:
+                    updates.setdefault(name.lower(), {'Name': name}).update(edited)
+                if entry is None:
+                    # Exported before the index existed, or written by hand: there's no telling which
+                    # values were edited, so push_updates only uses them for a player that doesn't exist yet
+                    self.untracked[name.lower()] = set(edited)
+                if not dry_run:
+                    new_base = dict(base)
+                    new_base.update({key: value for key, value in parsed.items() if key in VaultIndex.PLAYER_FIELDS})
+                    self.pending.append((path, data, new_base, {name.lower()} if edited else set()))
+
+        # A name added to a guild or Discord page moves that player into it; removed names are ignored
+        for folder, key, prefix in ((service.guild_path, 'Guild', 'Guild:'),
+                                    (service.discord_path, 'Discord', 'Discord:')):
+            with service.stats.span(f'vault_sync.{key.lower()}'):
+                for path, data, entry in self.vault_index.changed_files(folder):
+                    text = strip_frontmatter(data.decode('utf-8', errors='replace'))
+                    group_name = os.path.splitext(os.path.basename(path))[0]
+                    first_line = text.splitlines()[0] if text else ''
+                    if first_line.startswith('# ') and first_line[2:].strip().startswith(prefix):
+                        group_name = first_line[2:].strip()[len(prefix):].strip()
+                    base = set((entry or {}).get('base') or [])
+                    members = parse_member_list_markdown(text)
+                    added = set()
+                    removed = sorted(base - set(members))
+                    if removed:
+                        # Taking a name off a page doesn't say where the player went, so it isn't pushed
+                        logger.warning("Ignoring %s removed from %s page %s; change their %s on their own note instead.",
+                                       ', '.join(removed), key, group_name, key)
+                    # An untracked page may well be stale, so it never moves anyone; it just becomes the base
+                    for member in (members if entry is not None else []):
+                        if member not in base:
+                            updates.setdefault(member.lower(), {'Name': member})[key] = group_name
+                            self.untracked.get(member.lower(), set()).discard(key)
+                            added.add(member.lower())
+                    if not dry_run:
+                        self.pending.append((path, data, members, added))
+        return updates
+
+    def record_pushed(self, names):
+        """
+        Makes pending notes the new base, but only those whose edits all reached Firestore; the rest
+        are found again by the next pass.
+        """
+        remaining = []
+        for path, data, base, note_names in self.pending:
+            if note_names <= names:
+                self.vault_index.record(path, data, base=base)
+            else:
+                remaining.append((path, data, base, note_names))
+        self.pending = remaining
+
+    def push_updates(self, updates, dry_run=False):
+        """
+        Applies collected field edits through add_or_update_player, or save_player_with_associates when
+        Known Associates changed. Returns the names that were updated.
+        A player that can't be read stops the push (TransientLookupError); its note and the ones after
+        it stay edits for the next pass.
+        """
+        service = self.firebase_service
+        pushed = []
+        done = set()
+        try:
+            for key, edited in updates.items():
+                name = edited['Name']
+                current = service.get_player_for_update(name)
+                if current is None:
+                    # A brand new note made in Obsidian becomes a new player with the usual defaults
+                    current = {
+                        'Name': name, 'Level': 1, 'Class': 'N/A', 'Subclass': 'Unavailable',
+                        'Hostile Status': 'Neutral', 'Guild': 'N/A', 'Guild Rank': 'N/A',
+                        'Notes': '', 'Discord': '', 'Known Associates': []
+                    }
+                elif self.untracked.get(key):
+                    logger.info("Not pushing %s for %s: the note isn't in the vault index, so it may be stale.",
+                                ', '.join(sorted(self.untracked[key])), name)
+                    edited = {field: value for field, value in edited.items() if field not in self.untracked[key]}
+                merged = dict(current)
+                merged.update(edited)
+                merged['Name'] = current['Name']
+                changes = service.compare_player_data(current, merged)
+                if changes:
+                    logger.info("Vault edit for %s: %s", name, ', '.join(sorted(changes)))
+                    if not dry_run:
+                        merged.pop('updatedBy', None)
+                        merged.pop('updatedAt', None)
+                        if 'Known Associates' in changes:
+                            # Also adds or drops the link back on each associate, like the Add/Update form
+                            service.save_player_with_associates(merged)
+                        else:
+                            service.add_or_update_player(merged)
+                    pushed.append(merged)
+                done.add(key)
+        finally:
+            # Also after a failed push (network, budget): the notes that did go through stop being edits
+            if not dry_run:
+                self.record_pushed(done)
+        return pushed
+
+    def sync(self, dry_run=False):
+        """
+        One reverse-sync pass. Changed notes are re-exported afterwards so the index matches the vault again.
+        """
+        with self.firebase_service.stats.span('vault_sync'):
+            try:
+                pushed = self.push_updates(self.collect_updates(dry_run=dry_run), dry_run=dry_run)
+                if dry_run:
+                    return pushed
+                if pushed:
+                    self.firebase_service.export_to_markdown(pushed, {}, {})
+            finally:
+                # Keeps what a failed pass did push from being pushed again
+                if not dry_run:
+                    self.vault_index.save()
+        return pushed
+
 # The rest of your code (PlayerManagementApp and main execution) remains the same.
 # Ensure that all methods are properly indented and defined.
 
 
+class WorkspaceState:
+    """
+    Everything the app keeps per workspace. Switching workspaces only swaps which of these is
+    current, so the others keep their signed-in session, caches and roster warm.
+    """
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+        self.workspace = firebase_service.workspace
+        data_dir = firebase_service.data_dir
+        self.roster_snapshot = LocalRosterSnapshot(os.path.join(data_dir, 'roster.aocsnap'))
+        self.roster = None  # Last known list of players, from the snapshot or the network
+        self.roster_refresh_running = False
+        self.log_cache = LogCache(os.path.join(data_dir, 'logs.jsonl'))
+        self.encounter_store = EncounterStore(os.path.join(data_dir, 'encounters.jsonl'))
+        self.roster_columns = RosterColumns()  # Filled once the Analytics tab is opened
+        self.watchlist = Watchlist(os.path.join(data_dir, 'watchlist.json'))
+        self.watch_sync = None  # Fetches remote changes for the watchlist once the roster is loaded
+
+    def load_roster(self):
+        """
+        The roster in memory, or else the one in the local snapshot (for searching without a download).
+        """
+        if self.roster is not None:
+            return self.roster
+        return self.roster_snapshot.load()
+
+
+def _workspace_attribute(name):
+    # App attributes that really belong to the current workspace
+    return property(lambda self: getattr(self.workspace_state, name),
+                    lambda self, value: setattr(self.workspace_state, name, value))
+
+
 class PlayerManagementApp:
+    firebase_service = _workspace_attribute('firebase_service')
+    roster_snapshot = _workspace_attribute('roster_snapshot')
+    roster = _workspace_attribute('roster')
+    roster_refresh_running = _workspace_attribute('roster_refresh_running')
+    log_cache = _workspace_attribute('log_cache')
+    encounter_store = _workspace_attribute('encounter_store')
+    roster_columns = _workspace_attribute('roster_columns')
+    watchlist = _workspace_attribute('watchlist')
+    watch_sync = _workspace_attribute('watch_sync')
+
     def __init__(self, root):
         self.root = root
         self.root.title("Player Management System")
@@ -400,7 +3897,36 @@ class PlayerManagementApp:
         # Apply the default font to the root window
         self.root.option_add('*Font', default_font)
 
-        # Create and configure ttk styles
+        # ttk styles are only needed once the main interface is shown (the login screen is plain tk)
+        self.style = None
+
+        # Initialize Firebase service (one per workspace, created when the workspace is first opened)
+        self.workspaces = workspace_registry()
+        self.workspace_states = {}
+        self.workspace_state = self.create_workspace_state(self.workspaces.get())
+        self.analytics_refresh_pending = False
+        self.watch_poll_seconds = 60
+
+        # Results from worker threads are handed back to Tk through this queue
+        self.ui_queue = queue.Queue()
+        self.process_ui_queue()
+
+        # Create the login screen
+        self.create_login_screen()
+        startup_timer.mark('login_screen_built')
+        self.root.after_idle(lambda: startup_timer.mark('window_interactive'))
+
+    def create_workspace_state(self, workspace):
+        state = WorkspaceState(FirebaseService(workspace))
+        # Saves and syncs in this workspace keep its analytics columns and watchlist current
+        state.firebase_service.add_change_listener(lambda changed, removed: self.on_players_changed(changed, removed, state))
+        state.firebase_service.add_change_listener(lambda changed, removed: self.on_watch_changes(changed, removed, state))
+        self.workspace_states[workspace.name] = state
+        return state
+
+    def configure_styles(self):
+        if self.style is not None:
+            return
         self.style = ttk.Style()
         self.style.theme_use('clam')
 
@@ -422,11 +3948,34 @@ class PlayerManagementApp:
                              foreground='white',
                              arrowcolor='white')
 
-        # Initialize Firebase service
-        self.firebase_service = FirebaseService()
+    def run_in_background(self, work, on_success, on_error=None, background=False):
+        """
+        Runs work() on a worker thread and calls on_success(result) or on_error(exception) on the Tk thread.
+        With background=True its requests give way to interactive ones (bulk jobs).
+        """
+        def worker():
+            try:
+                if background:
+                    with background_requests():
+                        result = work()
+                else:
+                    result = work()
+                self.ui_queue.put((on_success, result))
+            except Exception as e:
+                self.ui_queue.put((on_error or self.show_background_error, e))
+        threading.Thread(target=worker, daemon=True).start()
 
-        # Create the login screen
-        self.create_login_screen()
+    def process_ui_queue(self):
+        try:
+            while True:
+                callback, value = self.ui_queue.get_nowait()
+                callback(value)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.process_ui_queue)
+
+    def show_background_error(self, error):
+        messagebox.showerror("Error", str(error))
 
     def create_login_screen(self):
         self.login_frame = tk.Frame(self.root, bg='black')
@@ -463,7 +4012,7 @@ class PlayerManagementApp:
             # Fetch the user role (only once, unless it's not fetched)
             user_role = self.firebase_service.fetch_user_role(user_id)
 
-            print(f"User role after login: {user_role}")  # Debugging output
+            logger.debug("User role after login: %s", user_role)
 
             # Check if the user role is 'user'
             if user_role == "user":
@@ -486,24 +4035,109 @@ class PlayerManagementApp:
             messagebox.showerror("Registration Failed", str(e))
 
     def create_main_interface(self):
+        self.configure_styles()
+
+        # Workspace picker and cross-workspace search
+        self.workspace_bar = tk.Frame(self.root, bg='black')
+        self.workspace_bar.pack(fill='x')
+        tk.Label(self.workspace_bar, text="Workspace:", bg='black', fg='white').pack(side='left', padx=(10, 5), pady=3)
+        self.workspace_var = tk.StringVar(value=self.workspace_state.workspace.name)
+        workspace_menu = ttk.Combobox(self.workspace_bar, textvariable=self.workspace_var, values=self.workspaces.names(),
+                                      state='readonly', style='CustomCombobox.TCombobox', width=16)
+        workspace_menu.pack(side='left')
+        workspace_menu.bind('<<ComboboxSelected>>', lambda event: self.switch_workspace(self.workspace_var.get()))
+        tk.Button(self.workspace_bar, text="New Workspace", command=self.add_workspace, bg='black', fg='white').pack(side='left', padx=5)
+        tk.Button(self.workspace_bar, text="Search All Workspaces", command=self.search_all_workspaces, bg='black', fg='white').pack(side='left', padx=5)
+
         # Create a Notebook for tabs
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(expand=True, fill='both')
 
+        # Today's Firestore usage against the daily budget
+        self.budget_label = tk.Label(self.notebook, text="", bg='black', fg='gray70', anchor='e')
+        self.budget_label.place(relx=1.0, rely=0.0, anchor='ne')
+        if getattr(self, 'budget_refresh_id', None):
+            self.root.after_cancel(self.budget_refresh_id)  # Loop left over from before a logout or workspace switch
+        self.refresh_budget_label()
+
         # Create frames for each tab with black background
         self.manage_frame = ttk.Frame(self.notebook)
         self.view_frame = ttk.Frame(self.notebook)
+        self.diagnostics_frame = ttk.Frame(self.notebook)
+        self.logs_frame = ttk.Frame(self.notebook)
+        self.analytics_frame = ttk.Frame(self.notebook)
+        self.watch_frame = ttk.Frame(self.notebook)
         self.manage_frame.configure(style='TFrame')
         self.view_frame.configure(style='TFrame')
+        self.diagnostics_frame.configure(style='TFrame')
+        self.logs_frame.configure(style='TFrame')
+        self.analytics_frame.configure(style='TFrame')
+        self.watch_frame.configure(style='TFrame')
         self.notebook.add(self.manage_frame, text='Manage Players')
         self.notebook.add(self.view_frame, text='View Players')
-
-        # Manage Players Tab
-        self.create_manage_tab()
-
-        # View Players Tab
-        self.create_view_tab()
-
+        self.notebook.add(self.analytics_frame, text='Analytics')
+        self.notebook.add(self.watch_frame, text='Watchlist')
+        self.notebook.add(self.logs_frame, text='Audit Log')
+        self.notebook.add(self.diagnostics_frame, text='Diagnostics')
+
+        # Tabs other than the first are only built when they are first shown
+        self.tab_builders = {
+            str(self.manage_frame): self.create_manage_tab,
+            str(self.view_frame): self.create_view_tab,
+            str(self.analytics_frame): self.create_analytics_tab,
+            str(self.watch_frame): self.create_watch_tab,
+            str(self.logs_frame): self.create_logs_tab,
+            str(self.diagnostics_frame): self.create_diagnostics_tab,
+        }
+        self.built_tabs = set()
+        self.notebook.bind('<<NotebookTabChanged>>', self.build_selected_tab)
+        self.build_selected_tab()
+        startup_timer.mark('main_interface_built')
+
+        if self.roster is not None:
+            return  # Switched back to a workspace that is already warm
+
+        # Load the local snapshot and start fetching the roster now, so the View tab is warm when opened
+        state = self.workspace_state
+        self.run_in_background(state.roster_snapshot.load, lambda players: self.on_snapshot_loaded(players, state), lambda e: None)
+        self.refresh_roster()
+
+    def on_snapshot_loaded(self, players, state=None):
+        startup_timer.mark('snapshot_loaded')
+        state = state or self.workspace_state
+        # Don't let a snapshot replace a roster that already came back from the network
+        if players is None or state.roster is not None:
+            return
+        state.roster = players
+        if state is not self.workspace_state:
+            return
+        if self.is_tab_built(self.view_frame):
+            self.render_players()
+            startup_timer.mark('view_painted')
+
+    def refresh_budget_label(self):
+        self.update_budget_label()
+        self.budget_refresh_id = self.root.after(5000, self.refresh_budget_label)
+
+    def update_budget_label(self):
+        if not self.budget_label.winfo_exists():
+            return  # Logged out
+        usage = self.firebase_service.scheduler.budget.usage()
+        text = f"Today: {usage['reads']}/{usage['read_limit']} reads, {usage['writes']}/{usage['write_limit']} writes"
+        over = usage['reads'] >= usage['read_limit'] or usage['writes'] >= usage['write_limit']
+        near = usage['reads'] >= 0.8 * usage['read_limit'] or usage['writes'] >= 0.8 * usage['write_limit']
+        self.budget_label.config(text=text, fg='red' if over else 'orange' if near else 'gray70')
+
+    def build_selected_tab(self, event=None):
+        selected = self.notebook.select()
+        if selected and selected not in self.built_tabs:
+            self.built_tabs.add(selected)
+            self.tab_builders[selected]()
+
+    def is_tab_built(self, frame):
+        return str(frame) in getattr(self, 'built_tabs', ())
+
+    def create_markdown_buttons(self):
         # Update Markdown Button
         update_button = tk.Button(
             self.manage_frame,
@@ -514,17 +4148,217 @@ class PlayerManagementApp:
         )
         update_button.pack(fill='x', padx=10, pady=10)
 
+        # Push edits made to player notes inside Obsidian back to the database
+        import_vault_button = tk.Button(
+            self.manage_frame,
+            text="Import Vault Edits",
+            command=self.import_vault_edits,
+            bg='black',
+            fg='white'
+        )
+        import_vault_button.pack(fill='x', padx=10, pady=5)
+
+        tk.Button(
+            self.manage_frame, text="Check Associate Links", command=self.check_associate_links, bg='black', fg='white'
+        ).pack(fill='x', padx=10, pady=5)
+
+        tk.Button(
+            self.manage_frame, text="Find Duplicates", command=self.find_duplicates, bg='black', fg='white'
+        ).pack(fill='x', padx=10, pady=5)
+
+        # Roster snapshots for sharing with teammates
+        tk.Button(
+            self.manage_frame, text="Export Snapshot", command=self.export_snapshot, bg='black', fg='white'
+        ).pack(fill='x', padx=10, pady=5)
+        tk.Button(
+            self.manage_frame, text="Import Snapshot", command=self.import_snapshot, bg='black', fg='white'
+        ).pack(fill='x', padx=10, pady=5)
+
     def update_markdown_files(self):
-        try:
+        def work():
             # Fetch players and guilds from Firebase
             players = self.firebase_service.get_all_players()
-            guilds = self.firebase_service.get_all_guilds()
-            discord = self.firebase_service.get_all_discordNames()
+            guilds = self.firebase_service.get_all_guilds(players)
+            discord = self.firebase_service.get_all_discordNames(players)
             # Export the data to markdown files
             self.firebase_service.export_to_markdown(players, guilds, discord)
-            messagebox.showinfo("Success", "Markdown files updated successfully.")
+
+        self.run_in_background(
+            work,
+            lambda result: messagebox.showinfo("Success", "Markdown files updated successfully."),
+            lambda e: messagebox.showerror("Error", f"Failed to update markdown files: {str(e)}"),
+            background=True
+        )
+
+    def import_vault_edits(self):
+        try:
+            vault_sync = VaultSync(self.firebase_service)
+            updates = vault_sync.collect_updates(dry_run=True)
+            if not updates:
+                messagebox.showinfo("Vault", "No edits found in the vault.")
+                return
+            names = ', '.join(sorted(edited['Name'] for edited in updates.values()))
+            if not messagebox.askyesno("Vault", f"Push vault edits for: {names}?"):
+                return
+            pushed = vault_sync.sync()
+            messagebox.showinfo("Success", f"Pushed vault edits for {len(pushed)} players.")
+            self.apply_filters()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to import vault edits: {str(e)}")
+
+    def check_associate_links(self):
+        job = AssociateConsistencyJob(self.firebase_service)
+        self.run_in_background(lambda: (job.run(dry_run=True), job), self.show_associate_report, background=True)
+
+    def show_associate_report(self, result):
+        report, job = result
+        report_window = tk.Toplevel(self.root)
+        report_window.title("Associate Links")
+        report_window.configure(bg='black')
+
+        summary = (f"Scanned {report['players_scanned']} players: {len(report['one_sided'])} one-sided links, "
+                   f"{len(report['dangling'])} links to players that don't exist.")
+        tk.Label(report_window, text=summary, bg='black', fg='white').pack(anchor='w', padx=10, pady=5)
+
+        details = tk.Text(report_window, height=20, width=80, bg='gray20', fg='white')
+        details.pack(expand=True, fill='both', padx=10, pady=5)
+        for player_name, associate_name in report['one_sided']:
+            details.insert(tk.END, f"One-sided: {player_name} lists {associate_name}, but not the other way round\n")
+        for player_name, associate_name in report['dangling']:
+            details.insert(tk.END, f"Dangling: {player_name} lists {associate_name}, who has no entry\n")
+        details.config(state='disabled')
+
+        prune_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(report_window, text="Also remove links to players that don't exist", variable=prune_var,
+                       bg='black', fg='white', selectcolor='black').pack(anchor='w', padx=10)
+
+        def repair():
+            def done(repair_report):
+                messagebox.showinfo("Success", f"Updated {repair_report['committed']} players.")
+                report_window.destroy()
+                self.apply_filters()
+            prune_dangling = prune_var.get()  # Tk variables must be read on the Tk thread
+            self.run_in_background(lambda: job.run(dry_run=False, prune_dangling=prune_dangling), done, background=True)
+
+        tk.Button(report_window, text="Repair", command=repair, bg='black', fg='white').pack(anchor='e', padx=10, pady=10)
+
+    def find_duplicates(self):
+        def work():
+            players = self.firebase_service.get_all_players()
+            return players, DuplicateFinder().find(players)
+        self.run_in_background(work, self.show_duplicates)
+
+    def show_duplicates(self, result):
+        players, candidates = result
+        if not candidates:
+            messagebox.showinfo("Duplicates", "No likely duplicates found.")
+            return
+
+        dupes_window = tk.Toplevel(self.root)
+        dupes_window.title("Possible Duplicates")
+        dupes_window.configure(bg='black')
+
+        columns = ('Player', 'Possible Duplicate', 'Kind', 'Score', 'Why')
+        dupes_tree = ttk.Treeview(dupes_window, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            dupes_tree.heading(col, text=col, anchor='w')
+        dupes_tree.pack(expand=True, fill='both', padx=10, pady=5)
+        for candidate in candidates:
+            dupes_tree.insert('', 'end', values=(
+                candidate['first'], candidate['second'], candidate['kind'], candidate['score'], ', '.join(candidate['reasons'])
+            ))
+
+        def merge(keep_first):
+            selection = dupes_tree.selection()
+            if not selection:
+                messagebox.showwarning("Merge", "Select a pair first.")
+                return
+            first, second = dupes_tree.item(selection[0], 'values')[:2]
+            primary_name, duplicate_name = (first, second) if keep_first else (second, first)
+            if not messagebox.askyesno("Merge", f"Merge {duplicate_name} into {primary_name}? {duplicate_name} will be deleted "
+                                                f"and their sightings moved to {primary_name}."):
+                return
+
+            def done(merge_result):
+                merged, relinked = merge_result
+                dupes_tree.delete(selection[0])
+                messagebox.showinfo("Success", f"Merged into {merged['Name']}, relinked {len(relinked)} players.")
+                self.apply_filters()
+            merger = DuplicateMerger(self.firebase_service)
+            encounter_store = self.encounter_store
+            self.run_in_background(
+                lambda: merger.merge(primary_name, duplicate_name, encounter_store=encounter_store), done)
+
+        buttons_frame = tk.Frame(dupes_window, bg='black')
+        buttons_frame.pack(fill='x', padx=10, pady=10)
+        tk.Button(buttons_frame, text="Merge into Player", command=lambda: merge(True), bg='black', fg='white').pack(side='left', padx=5)
+        tk.Button(buttons_frame, text="Merge into Possible Duplicate", command=lambda: merge(False), bg='black', fg='white').pack(side='left', padx=5)
+
+    def export_snapshot(self):
+        path = filedialog.asksaveasfilename(defaultextension='.aocsnap', filetypes=[('Roster snapshot', '*.aocsnap')])
+        if not path:
+            return
+        base_path = None
+        if messagebox.askyesno("Export Snapshot", "Only export changes since an earlier snapshot (delta)?"):
+            base_path = filedialog.askopenfilename(title="Base snapshot", filetypes=[('Roster snapshot', '*.aocsnap')])
+            if not base_path:
+                return
+
+        def work():
+            players = self.firebase_service.get_all_players()
+            if base_path:
+                base_header, base_players = read_roster_snapshot(base_path)
+                return write_roster_snapshot(path, players, base_header=base_header, base_players=base_players)
+            return write_roster_snapshot(path, players)
+
+        def done(header):
+            if header['kind'] == 'delta':
+                messagebox.showinfo("Success", f"Delta with {header['upsert_count']} changed players written.")
+            else:
+                messagebox.showinfo("Success", f"Snapshot of {header['player_count']} players written.")
+
+        self.run_in_background(work, done)
+
+    def import_snapshot(self):
+        path = filedialog.askopenfilename(filetypes=[('Roster snapshot', '*.aocsnap')])
+        if not path:
+            return
+        try:
+            # A delta is applied on top of the snapshot it was made from, like snapshot import --base.
+            # The local roster snapshot can't serve as base, it's rewritten on every roster refresh.
+            base_header = base_players = None
+            if read_snapshot_header(path)['kind'] == 'delta':
+                base_path = filedialog.askopenfilename(title="Base snapshot this delta was made against",
+                                                       filetypes=[('Roster snapshot', '*.aocsnap')])
+                if not base_path:
+                    return
+                base_header, base_players = read_roster_snapshot(base_path)
+            header, players = read_roster_snapshot(path, base_players=base_players, base_header=base_header)
+            self.roster_snapshot.save(players)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to update markdown files: {str(e)}")
+            messagebox.showerror("Error", f"Failed to import snapshot: {str(e)}")
+            return
+
+        self.roster = players
+        if self.is_tab_built(self.view_frame):
+            self.render_players()
+
+        def catch_up():
+            # Only fetch what changed after the snapshot was taken
+            sync = RosterSync(self.firebase_service)
+            sync.seed(players, header.get('max_updated_at', ''))
+            changed = sync.incremental_sync(export=False)
+            roster = list(sync.players.values())
+            self.roster_snapshot.save(roster)
+            return roster, len(changed)
+
+        def done(result):
+            self.roster, changed_count = result
+            if self.is_tab_built(self.view_frame):
+                self.render_players()
+            messagebox.showinfo("Success", f"Loaded {len(players)} players, {changed_count} changed since the snapshot.")
+
+        self.run_in_background(catch_up, done, background=True)
 
     def create_manage_tab(self):
         # Add Player Button
@@ -554,12 +4388,114 @@ class PlayerManagementApp:
         )
         self.logout_button.pack(fill='x', padx=10, pady=5)
 
+        self.create_markdown_buttons()
+
+    def switch_workspace(self, name):
+        """
+        Makes another workspace current. A workspace opened before comes back exactly as it was left;
+        a new one in the same Firebase project reuses the current sign-in.
+        """
+        if name == self.workspace_state.workspace.name:
+            return
+        state = self.workspace_states.get(name)
+        if state is None:
+            try:
+                state = self.create_workspace_state(self.workspaces.get(name))
+                if not state.firebase_service.adopt_session(self.firebase_service):
+                    email = self.firebase_service.user['email']
+                    password = simpledialog.askstring("Sign In", f"Password for {email} in {state.firebase_service.project_id}:", show='*')
+                    if password is None:
+                        raise Exception("Sign-in cancelled.")
+                    state.firebase_service.sign_in_user(email, password)
+                    if state.firebase_service.fetch_user_role(state.firebase_service.user['localId']) != 'user':
+                        raise Exception("Your account is not verified in that project.")
+            except Exception as e:
+                self.workspace_states.pop(name, None)
+                self.workspace_var.set(self.workspace_state.workspace.name)
+                messagebox.showerror("Error", f"Can't open workspace {name}: {e}")
+                return
+
+        # Only in memory: the saved default (workspace use) is what the CLI and daemon run against
+        self.workspace_state = state
+        self.notebook.destroy()
+        self.workspace_bar.destroy()
+        self.built_tabs = set()
+        self.create_main_interface()
+
+    def add_workspace(self):
+        name = simpledialog.askstring("New Workspace", "Workspace name (e.g. the server):")
+        if not name or not name.strip():
+            return
+        name = name.strip()
+        prefix = simpledialog.askstring("New Workspace", "Collection prefix for this server's players and logs:",
+                                        initialvalue=f"{name.lower()}_")
+        if prefix is None:
+            return
+        # Each server needs its own vault; without one its notes go to a vault in its data folder
+        vault = filedialog.askdirectory(title=f"Obsidian vault for {name} (Cancel for one in its data folder)") or None
+        try:
+            if name in self.workspaces.workspaces:
+                raise Exception(f"Workspace {name} already exists.")
+            # Same Firebase project as the current workspace; other projects are set up with the workspace command
+            current = self.workspace_state.workspace
+            self.workspaces.add(Workspace(name, current.project_id, current.api_key, prefix.strip(), vault))
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.switch_workspace(name)
+
+    def search_all_workspaces(self):
+        query = simpledialog.askstring("Search All Workspaces", "Player name (or part of it):")
+        if not query:
+            return
+        sources = {}
+        for name in self.workspaces.names():
+            state = self.workspace_states.get(name)
+            if state is not None:
+                sources[name] = state.load_roster
+            else:
+                # Not opened this session: search its local snapshot without signing in or downloading
+                snapshot = LocalRosterSnapshot(os.path.join(self.workspaces.get(name).data_dir, 'roster.aocsnap'))
+                sources[name] = snapshot.load
+        self.run_in_background(lambda: search_workspaces(sources, query),
+                               lambda result: self.show_workspace_search(query, *result))
+
+    def show_workspace_search(self, query, results, errors):
+        results_window = tk.Toplevel(self.root)
+        results_window.title(f"Search: {query}")
+        results_window.configure(bg='black')
+        found = [name for name in results if results[name]]
+        summary = f"{sum(len(results[name]) for name in found)} players in {len(found)} workspaces"
+        if errors:
+            summary += f" ({', '.join(sorted(errors))} couldn't be searched)"
+        tk.Label(results_window, text=summary, bg='black', fg='white').pack(anchor='w', padx=10, pady=5)
+
+        columns = ('Workspace', 'Name', 'Level', 'Class', 'Hostile Status', 'Guild')
+        results_tree = ttk.Treeview(results_window, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            results_tree.heading(col, text=col, anchor='w')
+        results_tree.pack(expand=True, fill='both', padx=10, pady=5)
+        for name in self.workspaces.names():
+            for player in results.get(name, []):
+                results_tree.insert('', 'end', values=(
+                    name, player.get('Name', ''), player.get('Level', ''), player.get('Class', ''),
+                    player.get('Hostile Status', ''), player.get('Guild', '')
+                ))
+
     def logout_user(self):
         confirm = messagebox.askyesno("Logout", "Are you sure you want to logout?")
         if confirm:
             self.notebook.destroy()
-            self.firebase_service.user = None
-            self.firebase_service.id_token = None
+            self.workspace_bar.destroy()
+            self.built_tabs = set()
+            for state in self.workspace_states.values():
+                state.firebase_service.user = None
+                state.firebase_service.id_token = None
+                state.firebase_service.clear_caches()
+                state.firebase_service.scheduler.budget.save()
+            # Start over with fresh workspace state; the polling loops of the old ones stop by themselves
+            self.workspace_states = {}
+            self.workspace_state = self.create_workspace_state(self.workspaces.get())
             self.create_login_screen()
 
     def add_player(self):
@@ -702,6 +4638,16 @@ class PlayerManagementApp:
         if is_update:
             notes_text.insert("1.0", player.get('Notes', ''))
 
+        # Sighting: saving the form also appends an encounter to the player's timeline
+        record_sighting_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            self.new_window, text="Log as sighting", variable=record_sighting_var,
+            bg='black', fg='white', selectcolor='black'
+        ).grid(row=11, column=0, sticky='e')
+        location_entry = tk.Entry(self.new_window, bg='gray20', fg='white')
+        location_entry.grid(row=11, column=1, sticky='w', padx=5, pady=5)
+        tk.Label(self.new_window, text="Seen at (location/node)", bg='black', fg='white').grid(row=12, column=1, sticky='w', padx=5)
+
         # Submit Button
         if is_update:
             submit_command = lambda: self.submit_player_update(
@@ -717,7 +4663,8 @@ class PlayerManagementApp:
                 guild_rank_entry.get(),
                 status_var.get(),
                 notes_text.get("1.0", tk.END),
-                associates=associates_entry.get()
+                associates=associates_entry.get(),
+                sighting_location=location_entry.get().strip() if record_sighting_var.get() else None
             )
         else:
             submit_command = lambda: self.submit_player(
@@ -732,7 +4679,8 @@ class PlayerManagementApp:
                 guild_rank_entry.get(),
                 status_var.get(),
                 notes_text.get("1.0", tk.END),
-                associates=associates_entry.get()
+                associates=associates_entry.get(),
+                sighting_location=location_entry.get().strip() if record_sighting_var.get() else None
             )
 
         submit_button = tk.Button(
@@ -779,7 +4727,7 @@ class PlayerManagementApp:
             guild_rank_entry.delete(0, 'end')
             guild_rank_entry.config(state='disabled')
 
-    def submit_player(self, name, level, subclass, player_class, discordName, in_guild, guild_rank_known, guild_name, guild_rank, status, notes, associates=[]):
+    def submit_player(self, name, level, subclass, player_class, discordName, in_guild, guild_rank_known, guild_name, guild_rank, status, notes, associates=[], sighting_location=None):
         try:
             level = int(level)
             if not (1 <= level <= 50):
@@ -806,7 +4754,9 @@ class PlayerManagementApp:
                 'Known Associates': [associate.strip() for associate in associates.split(',') if associate.strip()]
             }
 
-            self.firebase_service.add_or_update_player(player_data)
+            self.firebase_service.save_player_with_associates(player_data)
+            if sighting_location is not None:
+                self.record_sighting(player_data, sighting_location)
             messagebox.showinfo("Success", "Player added.")
             self.new_window.destroy()
             self.apply_filters()
@@ -815,7 +4765,7 @@ class PlayerManagementApp:
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
-    def submit_player_update(self, player, name, level, subclass, player_class, discordName, in_guild, guild_rank_known, guild_name, guild_rank, status, notes, associates=[]):
+    def submit_player_update(self, player, name, level, subclass, player_class, discordName, in_guild, guild_rank_known, guild_name, guild_rank, status, notes, associates=[], sighting_location=None):
         try:
             # Process level and validate
             level = int(level)
@@ -850,19 +4800,10 @@ class PlayerManagementApp:
                 'Known Associates': [associate.strip() for associate in associates.split(',') if associate.strip()]
             }
 
-            # Update the primary player's data in Firebase
-            self.firebase_service.add_or_update_player(player_data)
-
-            # Ensure reciprocal links in known associates
-            for associate_name in player_data['Known Associates']:
-                # Fetch associate data to check if they already exist in Firebase
-                associate_data = self.firebase_service.get_player_by_name(associate_name)
-
-                if associate_data:
-                    # Add primary player as a known associate of the associate if not already listed
-                    if name not in associate_data.get('Known Associates', []):
-                        associate_data.setdefault('Known Associates', []).append(name)
-                        self.firebase_service.add_or_update_player(associate_data)
+            # Update the primary player's data in Firebase and ensure reciprocal links in known associates
+            self.firebase_service.save_player_with_associates(player_data)
+            if sighting_location is not None:
+                self.record_sighting(player_data, sighting_location)
 
             # Notify success and close update window
             messagebox.showinfo("Success", "Player information and associates updated.")
@@ -875,6 +4816,70 @@ class PlayerManagementApp:
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+    def record_sighting(self, player, location=''):
+        """
+        Appends an encounter for the player in the background and mirrors it into the local store.
+        """
+        def work():
+            encounter = self.firebase_service.add_encounter(
+                player['Name'], level=player.get('Level'), guild=player.get('Guild'),
+                status=player.get('Hostile Status'), location=location
+            )
+            self.encounter_store.add([encounter])
+            return encounter
+        self.run_in_background(work, lambda encounter: None)
+
+    def show_timeline(self, player):
+        timeline_window = tk.Toplevel(self.root)
+        timeline_window.title(f"Timeline: {player['Name']}")
+        timeline_window.configure(bg='black')
+
+        last_seen_label = tk.Label(timeline_window, text="", bg='black', fg='white')
+        last_seen_label.pack(anchor='w', padx=10, pady=5)
+
+        columns = ('Time', 'Location', 'Level', 'Guild', 'Status', 'Reporter')
+        timeline_tree = ttk.Treeview(timeline_window, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            timeline_tree.heading(col, text=col, anchor='w')
+        timeline_tree.pack(expand=True, fill='both', padx=10, pady=5)
+
+        def render():
+            timeline_tree.delete(*timeline_tree.get_children())
+            for encounter in reversed(self.encounter_store.timeline(player['Name'])):
+                timeline_tree.insert('', 'end', values=(
+                    encounter.get('time', ''), encounter.get('location', ''), encounter.get('level', ''),
+                    encounter.get('guild', ''), encounter.get('status', ''), encounter.get('reporter', '')
+                ))
+            last = self.encounter_store.last_seen(player['Name'])
+            last_seen_label.config(text=f"Last seen: {describe_encounter(last)}" if last else "Never seen")
+
+        # Show what we have locally right away, then fetch only sightings newer than that
+        render()
+        since = self.encounter_store.latest_time(player['Name'])
+
+        def fetch():
+            encounters = self.firebase_service.get_encounters_since(player['Name'], since=since)
+            return self.encounter_store.add(encounters)
+
+        def done(added):
+            if added and timeline_window.winfo_exists():
+                render()
+        self.run_in_background(fetch, done)
+
+        def log_sighting():
+            location = simpledialog.askstring("Log Sighting", "Seen at (location/node):", parent=timeline_window)
+            if location is None:
+                return
+            def work():
+                encounter = self.firebase_service.add_encounter(
+                    player['Name'], level=player.get('Level'), guild=player.get('Guild'),
+                    status=player.get('Hostile Status'), location=location.strip()
+                )
+                self.encounter_store.add([encounter])
+            self.run_in_background(work, lambda result: render() if timeline_window.winfo_exists() else None)
+
+        tk.Button(timeline_window, text="Log Sighting", command=log_sighting, bg='black', fg='white').pack(anchor='e', padx=10, pady=10)
+
     def create_view_tab(self):
         """
         Sets up the view tab with filters and displays the list of players.
@@ -934,42 +4939,78 @@ class PlayerManagementApp:
         # Bind double-click to view player details
         self.players_tree.bind('<Double-1>', self.on_player_double_click)
 
-        # Load initial data
-        self.apply_filters()
+        # Paint whatever roster we already have (snapshot or a finished background fetch) right away
+        if self.roster is not None:
+            self.render_players()
+            startup_timer.mark('view_painted')
 
     def apply_filters(self):
-        try:
-            all_players = self.firebase_service.get_all_players()
-            if not all_players:
-                messagebox.showinfo("Info", "No players found.")
-                return
-
-            filters = {
-                'Class': self.filter_class.get(),
-                'Hostile Status': self.filter_status.get(),
-                'Guild': self.filter_guild.get()
-            }
-            sort_by = self.sort_by_var.get()
+        """
+        Re-renders the list from the roster we already have, then refreshes it from Firebase in the background.
+        """
+        if not self.is_tab_built(self.view_frame):
+            # The View tab will render when it is first opened
+            self.refresh_roster()
+            return
+        if self.roster is not None:
+            self.render_players()
+        self.refresh_roster()
+
+    def refresh_roster(self):
+        if self.roster_refresh_running:
+            return
+        self.roster_refresh_running = True
+        state = self.workspace_state  # The fetch belongs to this workspace even if the user switches meanwhile
+
+        def fetch_and_snapshot():
+            players = state.firebase_service.get_all_players()
+            try:
+                state.roster_snapshot.save(players)
+            except OSError as e:
+                logger.warning("Failed to save roster snapshot: %s", e)
+            if state.roster_columns.version or (state is self.workspace_state and self.is_tab_built(self.analytics_frame)):
+                state.roster_columns.rebuild(players)
+            return players
 
-            # Apply filters
-            filtered_data = all_players
-            for key, value in filters.items():
-                if value:
-                    filtered_data = [player for player in filtered_data if player.get(key, '').lower() == value.lower()]
+        self.run_in_background(fetch_and_snapshot, lambda players: self.on_roster_loaded(players, state),
+                               lambda error: self.on_roster_error(error, state))
+
+    def on_roster_loaded(self, players, state):
+        state.roster_refresh_running = False
+        state.roster = players
+        startup_timer.mark('roster_loaded')
+        if state.watch_sync is None:
+            self.start_watching(players, state)
+        if state is not self.workspace_state:
+            return
+        if self.is_tab_built(self.analytics_frame):
+            self.refresh_analytics()
+        if not self.is_tab_built(self.view_frame):
+            return
+        if not players:
+            messagebox.showinfo("Info", "No players found.")
+            return
+        self.render_players()
+        startup_timer.mark('view_painted')
+
+    def on_roster_error(self, error, state):
+        state.roster_refresh_running = False
+        messagebox.showerror("Error", f"An error occurred while applying filters: {str(error)}")
+
+    def render_players(self):
+        filters = {
+            'Class': self.filter_class.get(),
+            'Hostile Status': self.filter_status.get(),
+            'Guild': self.filter_guild.get()
+        }
+        sort_by = self.sort_by_var.get()
 
-            # Sort data
-            if sort_by:
-                try:
-                    if sort_by == 'Level':
-                        filtered_data.sort(key=lambda x: x.get(sort_by, 0))
-                    else:
-                        filtered_data.sort(key=lambda x: x.get(sort_by, '').lower())
-                except KeyError:
-                    pass
+        with self.firebase_service.stats.span('filter_and_sort_players'):
+            filtered_data = filter_and_sort_players(self.roster or [], filters, sort_by)
 
+        with self.firebase_service.stats.span('ui.render_players'):
             # Clear existing data
-            for item in self.players_tree.get_children():
-                self.players_tree.delete(item)
+            self.players_tree.delete(*self.players_tree.get_children())
 
             # Insert new data
             for player in filtered_data:
@@ -992,13 +5033,508 @@ class PlayerManagementApp:
                     guild_display
                 ))
 
-            # Update the player count label with the total number of filtered players
-            total_players = len(filtered_data)
-            self.player_count_label.config(text=f"Total Players: {total_players}")
+        # Update the player count label with the total number of filtered players
+        total_players = len(filtered_data)
+        self.player_count_label.config(text=f"Total Players: {total_players}")
 
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred while applying filters: {str(e)}")
+    def create_analytics_tab(self):
+        """
+        Grouped counts, level distribution and guild comparisons, computed from RosterColumns.
+        """
+        controls_frame = ttk.LabelFrame(self.analytics_frame, text="Selection")
+        controls_frame.pack(fill='x', padx=10, pady=5)
+
+        self.analytics_filters = {}
+        for column, field in enumerate(('Class', 'Hostile Status', 'Guild')):
+            tk.Label(controls_frame, text=f"{field}:", bg='black', fg='white').grid(row=0, column=column * 2, sticky='e')
+            variable = tk.StringVar()
+            tk.Entry(controls_frame, textvariable=variable, bg='gray20', fg='white', width=16).grid(row=0, column=column * 2 + 1, sticky='w', padx=5)
+            self.analytics_filters[field] = variable
+
+        tk.Label(controls_frame, text="Group By:", bg='black', fg='white').grid(row=1, column=0, sticky='e')
+        self.analytics_group_var = tk.StringVar(value='Guild')
+        ttk.Combobox(controls_frame, textvariable=self.analytics_group_var, values=['Guild', 'Class', 'Subclass', 'Hostile Status', 'Guild Rank'],
+                     state='readonly', style='CustomCombobox.TCombobox').grid(row=1, column=1, sticky='w', padx=5, pady=5)
+        tk.Button(controls_frame, text="Apply", command=self.refresh_analytics, bg='black', fg='white').grid(row=1, column=3, sticky='w', pady=5)
+
+        tk.Label(controls_frame, text="Compare Guilds:", bg='black', fg='white').grid(row=2, column=0, sticky='e')
+        self.compare_guild_vars = (tk.StringVar(), tk.StringVar())
+        tk.Entry(controls_frame, textvariable=self.compare_guild_vars[0], bg='gray20', fg='white', width=16).grid(row=2, column=1, sticky='w', padx=5)
+        tk.Entry(controls_frame, textvariable=self.compare_guild_vars[1], bg='gray20', fg='white', width=16).grid(row=2, column=3, sticky='w', padx=5)
+        tk.Button(controls_frame, text="Compare", command=self.compare_guilds, bg='black', fg='white').grid(row=2, column=5, sticky='w', pady=5)
+
+        self.analytics_summary_label = tk.Label(self.analytics_frame, text="Loading roster...", bg='black', fg='white', justify='left', anchor='w')
+        self.analytics_summary_label.pack(fill='x', padx=10, pady=5)
+
+        columns = ('Group', 'Players', 'Share', 'Avg Level', 'Median Level', 'p90 Level')
+        self.analytics_tree = ttk.Treeview(self.analytics_frame, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            self.analytics_tree.heading(col, text=col, anchor='w')
+        self.analytics_tree.pack(expand=True, fill='both', padx=10, pady=5)
+
+        self.analytics_details = tk.Text(self.analytics_frame, height=12, bg='gray10', fg='white', font=('Courier', 9))
+        self.analytics_details.pack(fill='x', padx=10, pady=5)
+
+        if self.roster is not None:
+            self.run_in_background(lambda: self.roster_columns.rebuild(self.roster), lambda result: self.refresh_analytics())
+
+    def on_players_changed(self, changed, removed, state):
+        # Change listener; runs on whichever thread saved or synced the players
+        if state.roster_columns.version == 0:
+            return  # Not built yet, the first rebuild will include these changes
+        state.roster_columns.apply_changes(changed, removed)
+        if state is self.workspace_state:
+            self.ui_queue.put((self.schedule_analytics_refresh, None))
+
+    def schedule_analytics_refresh(self, value=None):
+        # Bursts of changes (batch imports, syncs) only cause one refresh
+        if self.analytics_refresh_pending:
+            return
+        self.analytics_refresh_pending = True
+
+        def refresh():
+            self.analytics_refresh_pending = False
+            self.refresh_analytics()
+        self.root.after(300, refresh)
+
+    def current_analytics_filters(self):
+        return {field: variable.get().strip() for field, variable in self.analytics_filters.items()}
+
+    def refresh_analytics(self):
+        if not self.is_tab_built(self.analytics_frame) or self.roster_columns.version == 0:
+            return
+        filters = self.current_analytics_filters()
+        group_field = self.analytics_group_var.get()
+        columns = self.roster_columns
+
+        def work():
+            with self.firebase_service.stats.span('analytics.refresh'):
+                return {
+                    'groups': columns.group_counts(group_field, filters),
+                    'group_levels': columns.level_stats(group_field, filters),
+                    'overall': columns.level_stats(filters=filters, pcts=(25, 50, 75, 90)).get('All'),
+                    'histogram': columns.level_histogram(filters),
+                    'status_by_class': columns.crosstab('Class', 'Hostile Status', filters),
+                    'growth': columns.growth(filters),
+                }
+        self.run_in_background(work, self.show_analytics)
+
+    def show_analytics(self, result):
+        total = sum(count for _, count in result['groups'])
+        overall = result['overall']
+        summary = f"Players: {total}"
+        if overall:
+            summary += (f"    Level p25/p50/p75/p90: {overall['p25']}/{overall['p50']}/{overall['p75']}/{overall['p90']}"
+                        f"    Avg: {overall['mean']}")
+        if optional_numpy() is None:
+            summary += "    (install numpy for faster analytics)"
+        self.analytics_summary_label.config(text=summary)
+
+        self.analytics_tree.delete(*self.analytics_tree.get_children())
+        for group, count in result['groups']:
+            levels = result['group_levels'].get(group, {})
+            self.analytics_tree.insert('', 'end', values=(
+                group, count, f"{100.0 * count / total:.1f}%" if total else '',
+                levels.get('mean', ''), levels.get('p50', ''), levels.get('p90', '')
+            ))
+
+        lines = ["Level distribution:"]
+        widest = max((count for _, count in result['histogram']), default=0)
+        for low, count in result['histogram']:
+            bar = '#' * max(1, round(40.0 * count / widest))
+            lines.append(f"  {low:>3}-{low + 4:<3} {count:>7}  {bar}")
+        lines.append("")
+        lines.append("Hostile status by class:")
+        for player_class, statuses in sorted(result['status_by_class'].items()):
+            mix = ', '.join(f"{status} {count}" for status, count in sorted(statuses.items(), key=lambda item: -item[1]))
+            lines.append(f"  {player_class}: {mix}")
+        lines.append("")
+        lines.append("Added per month (running total):")
+        for month, count, running in result['growth'][-12:]:
+            lines.append(f"  {month}  +{count:<6} {running}")
+
+        self.analytics_details.config(state='normal')
+        self.analytics_details.delete("1.0", tk.END)
+        self.analytics_details.insert("1.0", "\n".join(lines))
+        self.analytics_details.config(state='disabled')
+
+    def compare_guilds(self):
+        guilds = [variable.get().strip() for variable in self.compare_guild_vars if variable.get().strip()]
+        if len(guilds) < 2:
+            messagebox.showinfo("Info", "Enter two guild names to compare.")
+            return
+        filters = self.current_analytics_filters()
+        filters.pop('Guild', None)
+        self.run_in_background(lambda: self.roster_columns.compare_guilds(guilds, filters),
+                               lambda comparison: self.show_guild_comparison(guilds, comparison))
+
+    def show_guild_comparison(self, guilds, comparison):
+        compare_window = tk.Toplevel(self.root)
+        compare_window.title(" vs ".join(guilds))
+        compare_window.configure(bg='black')
+
+        columns = ('Metric',) + tuple(guilds)
+        compare_tree = ttk.Treeview(compare_window, columns=columns, show='headings', style='Treeview', height=20)
+        for col in columns:
+            compare_tree.heading(col, text=col, anchor='w')
+        compare_tree.pack(expand=True, fill='both', padx=10, pady=10)
+
+        for key, label in (('players', 'Players'), ('mean', 'Avg Level'), ('p25', 'Level p25'),
+                           ('p50', 'Median Level'), ('p75', 'Level p75'), ('p90', 'Level p90')):
+            compare_tree.insert('', 'end', values=(label,) + tuple(comparison[guild]['levels'].get(key, '') for guild in guilds))
+        for section in ('classes', 'status'):
+            values = sorted({value for guild in guilds for value in comparison[guild][section]})
+            for value in values:
+                compare_tree.insert('', 'end', values=(value,) + tuple(comparison[guild][section].get(value, 0) for guild in guilds))
+
+    def start_watching(self, players, state):
+        """
+        Records current matches (without alerting), then picks up remote changes with incremental syncs.
+        Every opened workspace keeps polling, so watchlists of the other servers stay live too.
+        """
+        state.watch_sync = RosterSync(state.firebase_service)
+        state.watch_sync.seed(players)
+
+        def prime():
+            state.watchlist.prime(players)
+        self.run_in_background(prime, lambda result: self.refresh_watch_rules())
+        self.root.after(self.watch_poll_seconds * 1000, lambda: self.poll_remote_changes(state))
+
+    def poll_remote_changes(self, state):
+        if self.workspace_states.get(state.workspace.name) is not state:
+            return  # Logged out since; this loop ends here
+        self.root.after(self.watch_poll_seconds * 1000, lambda: self.poll_remote_changes(state))
+        analytics_open = state is self.workspace_state and self.is_tab_built(self.analytics_frame)
+        if not state.watchlist.rules and not analytics_open:
+            return  # Nobody is interested in remote changes right now
+
+        def work():
+            # Only asks for players changed since the last poll; listeners see them through _notify_change
+            state.firebase_service.ensure_fresh_token()
+            return state.watch_sync.incremental_sync(export=False)
+
+        def done(changed):
+            if changed:
+                state.roster = list(state.watch_sync.players.values())
+        self.run_in_background(work, done, lambda e: logger.warning("Watchlist poll failed: %s", e), background=True)
+
+    def on_watch_changes(self, changed, removed, state):
+        # Change listener; runs on whichever thread saved or synced the players
+        alerts = state.watchlist.check(changed, removed)
+        if alerts:
+            self.ui_queue.put((lambda alerts: self.on_watch_alerts(alerts, state), alerts))
+
+    def on_watch_alerts(self, alerts, state):
+        if state is self.workspace_state and self.is_tab_built(self.watch_frame):
+            for alert in reversed(alerts):
+                self.insert_watch_alert(alert, index=0)
+            self.refresh_watch_rules()
+        if not state.watchlist.desktop_notifications:
+            return
+
+        title = "Watchlist match" if len(alerts) == 1 else f"{len(alerts)} watchlist matches"
+        if state.workspace.name != DEFAULT_WORKSPACE:
+            title += f" ({state.workspace.name})"
+        message = "\n".join(describe_alert(alert) for alert in alerts[:3])
+        if len(alerts) > 3:
+            message += f"\n...and {len(alerts) - 3} more"
+        self.run_in_background(lambda: send_desktop_notification(title, message),
+                               lambda sent: None if sent else self.show_toast(title, message))
+
+    def show_toast(self, title, message):
+        """
+        Fallback when plyer isn't installed: a small window in the corner of the screen that closes itself.
+        """
+        toast = tk.Toplevel(self.root)
+        toast.overrideredirect(True)
+        toast.attributes('-topmost', True)
+        toast.configure(bg='gray15')
+        tk.Label(toast, text=title, bg='gray15', fg='orange', anchor='w').pack(fill='x', padx=10, pady=(8, 0))
+        tk.Label(toast, text=message, bg='gray15', fg='white', justify='left', anchor='w', wraplength=360).pack(fill='x', padx=10, pady=8)
+        toast.update_idletasks()
+        x = toast.winfo_screenwidth() - toast.winfo_reqwidth() - 20
+        y = toast.winfo_screenheight() - toast.winfo_reqheight() - 60
+        toast.geometry(f"+{x}+{y}")
+        toast.bind('<Button-1>', lambda event: toast.destroy())
+        self.root.bell()
+        self.root.after(8000, lambda: toast.winfo_exists() and toast.destroy())
+
+    def create_watch_tab(self):
+        """
+        Watchlist rules and the alerts they raised.
+        """
+        rules_frame = ttk.LabelFrame(self.watch_frame, text="Rules")
+        rules_frame.pack(fill='x', padx=10, pady=5)
+
+        self.watch_rule_entry = tk.Entry(rules_frame, bg='gray20', fg='white', width=60)
+        self.watch_rule_entry.grid(row=0, column=0, sticky='w', padx=5, pady=5)
+        self.watch_rule_entry.bind('<Return>', lambda event: self.add_watch_rule())
+        tk.Button(rules_frame, text="Add Rule", command=self.add_watch_rule, bg='black', fg='white').grid(row=0, column=1, padx=5)
+        tk.Button(rules_frame, text="Remove Selected", command=self.remove_watch_rule, bg='black', fg='white').grid(row=0, column=2, padx=5)
+        tk.Label(rules_frame, text="e.g.  Guild = Red Hand    |    Hostile Status = Hostile and Level >= 40    |    associate of Steven",
+                 bg='black', fg='gray70').grid(row=1, column=0, columnspan=3, sticky='w', padx=5)
+
+        self.watch_notify_var = tk.BooleanVar(value=self.watchlist.desktop_notifications)
+        tk.Checkbutton(rules_frame, text="Notify me", variable=self.watch_notify_var, bg='black', fg='white', selectcolor='black',
+                       command=lambda: self.watchlist.set_desktop_notifications(self.watch_notify_var.get())).grid(row=0, column=3, padx=5)
+
+        self.watch_rules_tree = ttk.Treeview(rules_frame, columns=('ID', 'Rule', 'Matching'), show='headings', style='Treeview', height=6)
+        for col in ('ID', 'Rule', 'Matching'):
+            self.watch_rules_tree.heading(col, text=col, anchor='w')
+        self.watch_rules_tree.column('ID', width=40)
+        self.watch_rules_tree.grid(row=2, column=0, columnspan=4, sticky='we', padx=5, pady=5)
+        self.watch_rules_tree.bind('<Double-1>', self.show_watch_matches)
+
+        alerts_frame = ttk.LabelFrame(self.watch_frame, text="Alerts")
+        alerts_frame.pack(expand=True, fill='both', padx=10, pady=5)
+        columns = ('Time', 'Player', 'Level', 'Guild', 'Status', 'Rule', 'Changed By')
+        self.watch_alerts_tree = ttk.Treeview(alerts_frame, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            self.watch_alerts_tree.heading(col, text=col, anchor='w')
+        self.watch_alerts_tree.pack(expand=True, fill='both', padx=5, pady=5)
+        self.watch_alerts_tree.bind('<Double-1>', self.on_watch_alert_double_click)
+
+        for alert in list(self.watchlist.alerts):
+            self.insert_watch_alert(alert)
+        self.refresh_watch_rules()
+
+    def insert_watch_alert(self, alert, index='end'):
+        self.watch_alerts_tree.insert('', index, values=(
+            alert['time'], alert['player'], alert.get('level', ''), alert.get('guild', ''),
+            alert.get('status', ''), alert['rule'], alert.get('updatedBy', '')
+        ))
+
+    def refresh_watch_rules(self, value=None):
+        if not self.is_tab_built(self.watch_frame):
+            return
+        counts = self.watchlist.match_counts()
+        self.watch_rules_tree.delete(*self.watch_rules_tree.get_children())
+        for rule in self.watchlist.rules.values():
+            self.watch_rules_tree.insert('', 'end', iid=str(rule.id), values=(rule.id, rule.text, counts.get(rule.id, 0)))
+
+    def add_watch_rule(self):
+        text = self.watch_rule_entry.get().strip()
+        if not text:
+            return
+        try:
+            rule = self.watchlist.add_rule(text)
+        except WatchRuleError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.watch_rule_entry.delete(0, tk.END)
+        self.refresh_watch_rules()
+        if self.roster is not None:
+            # One pass over the roster we already have, so the rule starts out knowing who matches
+            roster = self.roster
+            self.run_in_background(lambda: self.watchlist.prime(roster, rules=[rule]), self.refresh_watch_rules)
+
+    def remove_watch_rule(self):
+        for item in self.watch_rules_tree.selection():
+            self.watchlist.remove_rule(int(item))
+        self.refresh_watch_rules()
+
+    def show_watch_matches(self, event):
+        selection = self.watch_rules_tree.selection()
+        if not selection:
+            return
+        rule = self.watchlist.rules.get(int(selection[0]))
+        if rule is None:
+            return
+        matches_window = tk.Toplevel(self.root)
+        matches_window.title(f"Matching: {rule.text}")
+        matches_window.configure(bg='black')
+        matches = tk.Text(matches_window, height=20, width=50, bg='gray20', fg='white')
+        matches.pack(expand=True, fill='both', padx=10, pady=10)
+        matches.insert('1.0', "\n".join(self.watchlist.matching_players(rule.id)) or "No players match right now.")
+        matches.config(state='disabled')
+
+    def on_watch_alert_double_click(self, event):
+        selection = self.watch_alerts_tree.selection()
+        if not selection:
+            return
+        player_name = self.watch_alerts_tree.item(selection[0], 'values')[1]
+
+        def done(player):
+            if player:
+                self.show_player_info(player)
+        self.run_in_background(lambda: self.firebase_service.get_player_by_name(player_name), done)
+
+    def create_logs_tab(self):
+        """
+        Audit log explorer: server-side queries with paging, or searches of the local log cache.
+        """
+        filters_frame = ttk.LabelFrame(self.logs_frame, text="Search")
+        filters_frame.pack(fill='x', padx=10, pady=5)
+
+        self.log_player_var = tk.StringVar()
+        self.log_email_var = tk.StringVar()
+        self.log_field_var = tk.StringVar()
+        self.log_local_var = tk.BooleanVar(value=False)
+
+        tk.Label(filters_frame, text="Player:", bg='black', fg='white').grid(row=0, column=0, sticky='e')
+        tk.Entry(filters_frame, textvariable=self.log_player_var, bg='gray20', fg='white').grid(row=0, column=1, sticky='w')
+        tk.Label(filters_frame, text="Changed by (email):", bg='black', fg='white').grid(row=1, column=0, sticky='e')
+        tk.Entry(filters_frame, textvariable=self.log_email_var, bg='gray20', fg='white').grid(row=1, column=1, sticky='w')
+        tk.Label(filters_frame, text="Changed field:", bg='black', fg='white').grid(row=2, column=0, sticky='e')
+        tk.Entry(filters_frame, textvariable=self.log_field_var, bg='gray20', fg='white').grid(row=2, column=1, sticky='w')
+        tk.Checkbutton(filters_frame, text="Search local cache", variable=self.log_local_var,
+                       bg='black', fg='white', selectcolor='black').grid(row=3, column=1, sticky='w')
+
+        buttons_frame = tk.Frame(filters_frame, bg='black')
+        buttons_frame.grid(row=4, column=1, sticky='w', pady=5)
+        tk.Button(buttons_frame, text="Search", command=self.search_logs, bg='black', fg='white').pack(side='left', padx=2)
+        self.load_more_logs_button = tk.Button(buttons_frame, text="Load More", command=self.load_more_logs,
+                                               state='disabled', bg='black', fg='white')
+        self.load_more_logs_button.pack(side='left', padx=2)
+        tk.Button(buttons_frame, text="Update Local Cache", command=self.sync_log_cache, bg='black', fg='white').pack(side='left', padx=2)
+
+        self.logs_status_label = tk.Label(self.logs_frame, text="", bg='black', fg='white')
+        self.logs_status_label.pack(anchor='w', padx=10)
+
+        columns = ('Time', 'User', 'Action', 'Player', 'Changes')
+        self.logs_tree = ttk.Treeview(self.logs_frame, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            self.logs_tree.heading(col, text=col, anchor='w')
+        self.logs_tree.pack(expand=True, fill='both', padx=10, pady=5)
+        self.logs_tree.bind('<Double-1>', self.on_log_double_click)
+
+        self.log_entries = {}  # Treeview item -> log entry
+        self.logs_cursor = None
+
+    def current_log_filters(self):
+        return {
+            'player_name': self.log_player_var.get().strip() or None,
+            'email': self.log_email_var.get().strip() or None,
+            'field': self.log_field_var.get().strip() or None
+        }
+
+    def search_logs(self):
+        self.logs_tree.delete(*self.logs_tree.get_children())
+        self.log_entries = {}
+        self.logs_cursor = None
+        self.load_more_logs_button.config(state='disabled')
+        filters = self.current_log_filters()
+
+        if self.log_local_var.get():
+            entries = self.log_cache.query(limit=500, **filters)
+            self.show_log_entries(entries)
+            self.logs_status_label.config(text=f"{len(entries)} entries from the local cache.")
+            return
+        self.fetch_log_page(filters)
+
+    def load_more_logs(self):
+        if self.logs_cursor:
+            self.fetch_log_page(self.current_log_filters())
+
+    def fetch_log_page(self, filters):
+        cursor = self.logs_cursor
+
+        def done(result):
+            entries, self.logs_cursor = result
+            self.show_log_entries(entries)
+            self.load_more_logs_button.config(state='normal' if self.logs_cursor else 'disabled')
+            self.logs_status_label.config(text=f"{len(self.log_entries)} entries loaded.")
+
+        self.run_in_background(lambda: self.firebase_service.query_logs(cursor=cursor, **filters), done)
+
+    def show_log_entries(self, entries):
+        for entry in entries:
+            item = self.logs_tree.insert('', 'end', values=(
+                entry.get('timestamp', ''),
+                entry.get('email', ''),
+                entry.get('actionType', ''),
+                entry.get('playerName', ''),
+                summarize_log_changes(entry.get('changes'))
+            ))
+            self.log_entries[item] = entry
+
+    def sync_log_cache(self):
+        def done(added):
+            self.logs_status_label.config(text=f"Local cache updated, {added} new entries.")
+        self.logs_status_label.config(text="Updating local cache...")
+        self.run_in_background(lambda: self.log_cache.sync(self.firebase_service), done, background=True)
+
+    def on_log_double_click(self, event):
+        selection = self.logs_tree.selection()
+        if not selection:
+            return
+        entry = self.log_entries.get(selection[0])
+        if not entry:
+            return
+        details_window = tk.Toplevel(self.root)
+        details_window.title(f"{entry.get('actionType', '')}: {entry.get('playerName', '')}")
+        details_window.configure(bg='black')
+        details = tk.Text(details_window, height=20, width=70, bg='gray20', fg='white')
+        details.pack(expand=True, fill='both', padx=10, pady=10)
+        details.insert('1.0', json.dumps(entry, indent=2))
+        details.config(state='disabled')
+
+    def create_diagnostics_tab(self):
+        """
+        Shows request counters and p50/p95 latencies per operation, with a JSON dump for bug reports.
+        """
+        buttons_frame = tk.Frame(self.diagnostics_frame, bg='black')
+        buttons_frame.pack(fill='x', padx=10, pady=5)
+        tk.Button(buttons_frame, text="Refresh", command=self.refresh_diagnostics, bg='black', fg='white').pack(side='left', padx=5)
+        tk.Button(buttons_frame, text="Save JSON", command=self.save_diagnostics, bg='black', fg='white').pack(side='left', padx=5)
+        tk.Button(buttons_frame, text="Reset", command=self.reset_diagnostics, bg='black', fg='white').pack(side='left', padx=5)
+
+        usage = self.firebase_service.scheduler.budget.usage()
+        tk.Label(buttons_frame, text="Daily budget - reads:", bg='black', fg='white').pack(side='left', padx=(20, 5))
+        self.read_budget_entry = tk.Entry(buttons_frame, bg='gray20', fg='white', width=8)
+        self.read_budget_entry.insert(0, str(usage['read_limit']))
+        self.read_budget_entry.pack(side='left')
+        tk.Label(buttons_frame, text="writes:", bg='black', fg='white').pack(side='left', padx=5)
+        self.write_budget_entry = tk.Entry(buttons_frame, bg='gray20', fg='white', width=8)
+        self.write_budget_entry.insert(0, str(usage['write_limit']))
+        self.write_budget_entry.pack(side='left')
+        tk.Button(buttons_frame, text="Set Budget", command=self.set_request_budget, bg='black', fg='white').pack(side='left', padx=5)
+
+        self.counters_label = tk.Label(self.diagnostics_frame, text="", bg='black', fg='white', justify='left', anchor='w')
+        self.counters_label.pack(fill='x', padx=10, pady=5)
+
+        columns = ('Operation', 'Count', 'p50 (ms)', 'p95 (ms)', 'Max (ms)', 'Total (ms)')
+        self.diagnostics_tree = ttk.Treeview(self.diagnostics_frame, columns=columns, show='headings', style='Treeview')
+        for col in columns:
+            self.diagnostics_tree.heading(col, text=col, anchor='w')
+        self.diagnostics_tree.pack(expand=True, fill='both', padx=10, pady=5)
+
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        report = self.firebase_service.diagnostics()
+        counters = report['counters']
+        self.counters_label.config(text="\n".join(f"{key}: {value}" for key, value in sorted(counters.items())))
+
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        for op, timing in report['operations'].items():
+            self.diagnostics_tree.insert('', 'end', values=(
+                op, timing['count'], timing['p50_ms'], timing['p95_ms'], timing['max_ms'], timing['total_ms']
+            ))
+
+    def save_diagnostics(self):
+        path = filedialog.asksaveasfilename(defaultextension='.json', filetypes=[('JSON', '*.json')])
+        if not path:
+            return
+        try:
+            with open(path, 'w') as f:
+                json.dump(self.firebase_service.diagnostics(), f, indent=2)
+            messagebox.showinfo("Saved", f"Diagnostics written to {path}")
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to save diagnostics: {e}")
+
+    def set_request_budget(self):
+        try:
+            self.firebase_service.scheduler.budget.set_limits(int(self.read_budget_entry.get()), int(self.write_budget_entry.get()))
+        except ValueError:
+            messagebox.showerror("Error", "Budgets must be whole numbers.")
+            return
+        self.update_budget_label()
+        self.refresh_diagnostics()
 
+    def reset_diagnostics(self):
+        self.firebase_service.stats.reset()
+        self.refresh_diagnostics()
 
     def on_player_double_click(self, event):
         item = self.players_tree.selection()
@@ -1025,7 +5561,464 @@ class PlayerManagementApp:
             tk.Label(info_window, text=value, bg='black', fg='white').grid(row=row, column=1, sticky='w')
             row += 1
 
-if __name__ == "__main__":
+        last = self.encounter_store.last_seen(player['Name'])
+        tk.Label(info_window, text="Last Seen:", bg='black', fg='white').grid(row=row, column=0, sticky='e')
+        tk.Label(info_window, text=describe_encounter(last) if last else 'N/A', bg='black', fg='white').grid(row=row, column=1, sticky='w')
+        row += 1
+        tk.Button(info_window, text="Timeline", command=lambda: self.show_timeline(player), bg='black', fg='white').grid(row=row, column=1, sticky='e', padx=5, pady=5)
+
+
+def set_vault_root(firebase_service, vault_root):
+    for kind, path in vault_folders(vault_root).items():
+        setattr(firebase_service, f'{kind}_path', path)
+
+
+def headless_login(firebase_service, args):
+    email = args.email or os.environ.get('AOCDB_EMAIL') or input("Email: ")
+    password = os.environ.get('AOCDB_PASSWORD') or getpass.getpass("Password: ")
+    firebase_service.sign_in_user(email, password)
+    if firebase_service.fetch_user_role(firebase_service.user['localId']) != 'user':
+        raise Exception("Access Denied: Your account is not verified yet.")
+
+
+def run_gui():
     root = tk.Tk()
     app = PlayerManagementApp(root)
     root.mainloop()
+    for state in app.workspace_states.values():
+        state.firebase_service.scheduler.budget.save()
+
+
+def cli_sync(firebase_service, args):
+    if args.two_way or args.dry_run:
+        pushed = VaultSync(firebase_service).sync(dry_run=args.dry_run)
+        verb = "Would push" if args.dry_run else "Pushed"
+        print(f"{verb} vault edits for {len(pushed)} players.")
+        if args.dry_run:
+            return
+    count = RosterSync(firebase_service).full_sync()
+    print(f"Synced {count} players to the vault.")
+
+
+def cli_export(firebase_service, args):
+    players = firebase_service.get_all_players()
+    if args.format == 'markdown':
+        firebase_service.export_to_markdown(
+            players,
+            firebase_service.get_all_guilds(players),
+            firebase_service.get_all_discordNames(players)
+        )
+        print(f"Exported {len(players)} players to markdown.")
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(players, f, indent=2)
+        print(f"Exported {len(players)} players to {args.output}.")
+
+
+def cli_import(firebase_service, args):
+    with open(args.file) as f:
+        players = json.load(f)
+    if isinstance(players, dict):
+        players = [players]
+
+    imported = 0
+    for player_data in players:
+        if not player_data.get('Name'):
+            logger.warning("Skipping record without a Name: %s", player_data)
+            continue
+        if args.with_associates:
+            firebase_service.save_player_with_associates(player_data)
+        else:
+            firebase_service.add_or_update_player(player_data)
+        imported += 1
+    print(f"Imported {imported} players.")
+
+
+def cli_query(firebase_service, args):
+    filters = {
+        'Class': args.player_class or '',
+        'Hostile Status': args.status or '',
+        'Guild': args.guild or ''
+    }
+    players = filter_and_sort_players(firebase_service.get_all_players(), filters, args.sort)
+    if args.json:
+        print(json.dumps(players, indent=2))
+        return
+    for player in players:
+        print(f"{player.get('Name', ''):24} {str(player.get('Level', '')):>5}  {player.get('Class', ''):12} "
+              f"{player.get('Hostile Status', ''):10} {player.get('Guild', '')}")
+    print(f"Total Players: {len(players)}")
+
+
+def local_snapshot(firebase_service):
+    return LocalRosterSnapshot(os.path.join(firebase_service.data_dir, 'roster.aocsnap'))
+
+
+def cli_snapshot(firebase_service, args):
+    if args.action == 'export':
+        players = firebase_service.get_all_players()
+        if args.base:
+            base_header, base_players = read_roster_snapshot(args.base)
+            header = write_roster_snapshot(args.file, players, base_header=base_header, base_players=base_players)
+            print(f"Wrote delta of {header['upsert_count']} players to {args.file}.")
+        else:
+            header = write_roster_snapshot(args.file, players)
+            print(f"Wrote snapshot of {header['player_count']} players to {args.file}.")
+        return
+
+    local = local_snapshot(firebase_service)
+    base_header = base_players = None
+    if read_snapshot_header(args.file)['kind'] == 'delta':
+        # The local roster snapshot can't serve as base, it's rewritten on every roster refresh
+        if not args.base:
+            raise Exception(f"{args.file} is a delta; pass the snapshot it was made against with --base.")
+        base_header, base_players = read_roster_snapshot(args.base)
+    header, players = read_roster_snapshot(args.file, base_players=base_players, base_header=base_header)
+
+    # Catch up on anything that changed after the snapshot was taken
+    sync = RosterSync(firebase_service)
+    sync.seed(players, header.get('max_updated_at', ''))
+    changed = sync.incremental_sync(export=False)
+    local.save(list(sync.players.values()))
+    print(f"Loaded {len(players)} players from {args.file}, {len(changed)} changed since.")
+
+
+def cli_repair_associates(firebase_service, args):
+    report = AssociateConsistencyJob(firebase_service).run(dry_run=args.dry_run, prune_dangling=args.prune_dangling)
+    for player_name, associate_name in report['one_sided']:
+        print(f"one-sided: {player_name} -> {associate_name}")
+    for player_name, associate_name in report['dangling']:
+        print(f"dangling:  {player_name} -> {associate_name}")
+    verb = "Would update" if args.dry_run else "Updated"
+    print(f"Scanned {report['players_scanned']} players. {verb} {report['players_to_update']} players.")
+
+
+def cli_dedupe(firebase_service, args):
+    if args.merge:
+        primary_name, duplicate_name = args.merge
+        store = EncounterStore(os.path.join(firebase_service.data_dir, 'encounters.jsonl'))
+        merged, relinked = DuplicateMerger(firebase_service).merge(primary_name, duplicate_name, encounter_store=store)
+        print(f"Merged {duplicate_name} into {merged['Name']}, relinked {len(relinked)} players.")
+        return
+    candidates = DuplicateFinder(threshold=args.threshold).find(firebase_service.get_all_players())
+    for candidate in candidates:
+        print(f"{candidate['score']:.2f}  {candidate['kind']:9} {candidate['first']}  <->  {candidate['second']}  "
+              f"({', '.join(candidate['reasons'])})")
+    print(f"{len(candidates)} candidate pairs.")
+
+
+def cli_logs(firebase_service, args):
+    if args.local:
+        cache = LogCache(os.path.join(firebase_service.data_dir, 'logs.jsonl'))
+        added = cache.sync(firebase_service)
+        logger.info("Fetched %d new log entries.", added)
+        entries = cache.query(player_name=args.player, email=args.email, field=args.field, limit=args.limit)
+    else:
+        entries, _ = firebase_service.query_logs(player_name=args.player, email=args.email, limit=args.limit,
+                                                 field=args.field)
+    for entry in entries:
+        print(f"{entry.get('timestamp', '')}  {entry.get('email', ''):28} {entry.get('actionType', ''):16} "
+              f"{entry.get('playerName', ''):20} {summarize_log_changes(entry.get('changes'))}")
+
+
+def cli_timeline(firebase_service, args):
+    store = EncounterStore(os.path.join(firebase_service.data_dir, 'encounters.jsonl'))
+    if args.location is not None:
+        player = firebase_service.get_player_by_name(args.name) or {}
+        store.add([firebase_service.add_encounter(
+            args.name, level=player.get('Level'), guild=player.get('Guild'),
+            status=player.get('Hostile Status'), location=args.location
+        )])
+    # Only fetch sightings newer than the ones already stored locally
+    store.add(firebase_service.get_encounters_since(args.name, since=store.latest_time(args.name)))
+    for encounter in store.timeline(args.name, since=args.since):
+        print(describe_encounter(encounter))
+
+
+def cli_watch(firebase_service, args):
+    watchlist = Watchlist(os.path.join(firebase_service.data_dir, 'watchlist.json'))
+    if args.action == 'add':
+        rule = watchlist.add_rule(' '.join(args.rule))
+        print(f"Added rule {rule.id}: {rule.text}")
+    elif args.action == 'remove':
+        if len(args.rule) != 1 or not args.rule[0].isdigit() or int(args.rule[0]) not in watchlist.rules:
+            raise Exception("watch remove needs the id of an existing rule (see watch list).")
+        watchlist.remove_rule(int(args.rule[0]))
+        print(f"Removed rule {args.rule[0]}.")
+    elif args.action == 'check':
+        # One explicit pass over the whole roster, to see who matches right now
+        found = watchlist.prime(firebase_service.get_all_players())
+        for rule in watchlist.rules.values():
+            names = found.get(rule.id, [])
+            print(f"[{rule.id}] {rule.text}: {len(names)} matching")
+            for name in sorted(names):
+                print(f"    {name}")
+    else:
+        for rule in watchlist.rules.values():
+            print(f"[{rule.id}] {rule.text}")
+
+
+def cli_templates(firebase_service, args):
+    config = firebase_service.export_config
+    if args.action == 'init':
+        config.write_defaults()
+        print(f"Templates written next to {config.path}; edit them and export again.")
+    for kind in ExportConfig.KINDS:
+        print(f"{kind}: {config.template_path(kind) or 'built-in'} -> {getattr(firebase_service, kind + '_path')}")
+    # Compiling reports template mistakes before they show up half way through an export
+    config.compile_templates()
+    print("Templates OK.")
+
+
+def cli_workspace(firebase_service, args):
+    registry = workspace_registry()
+    if args.action != 'list' and not args.name:
+        raise Exception(f"workspace {args.action} needs a workspace name.")
+    if args.action == 'add':
+        if args.name in registry.workspaces:
+            raise Exception(f"Workspace {args.name} already exists.")
+        registry.add(Workspace(args.name, args.project_id, args.api_key, args.prefix, args.workspace_vault))
+        print(f"Added workspace {args.name}.")
+    elif args.action == 'remove':
+        # Only forgets the workspace; its local data folder is left alone
+        registry.get(args.name)
+        registry.remove(args.name)
+        print(f"Removed workspace {args.name}.")
+    elif args.action == 'use':
+        registry.set_active(args.name)
+        print(f"{args.name} is now the default workspace.")
+    else:
+        for name in registry.names():
+            workspace = registry.get(name)
+            marker = '*' if name == registry.active else ' '
+            print(f"{marker} {name:16} project={workspace.project_id or 'default'} "
+                  f"prefix={workspace.collection_prefix or '-'} vault={workspace.vault or '-'}")
+
+
+def cli_search(firebase_service, args):
+    """
+    Searches the local roster snapshots of every workspace, without signing in or downloading anything.
+    """
+    registry = workspace_registry()
+    sources = {name: LocalRosterSnapshot(os.path.join(registry.get(name).data_dir, 'roster.aocsnap')).load
+               for name in registry.names()}
+    filters = {
+        'Class': args.player_class or '',
+        'Hostile Status': args.status or '',
+        'Guild': args.guild or ''
+    }
+    results, errors = search_workspaces(sources, args.name, filters)
+    total = 0
+    for name in registry.names():
+        for player in results.get(name, []):
+            total += 1
+            print(f"{name:12} {player.get('Name', ''):24} {str(player.get('Level', '')):>5}  {player.get('Class', ''):12} "
+                  f"{player.get('Hostile Status', ''):10} {player.get('Guild', '')}")
+    for name, error in sorted(errors.items()):
+        print(f"{name}: not searched ({error})")
+    print(f"Total Players: {total}")
+
+
+def cli_daemon(firebase_service, args):
+    """
+    Keeps one signed-in session and warm roster, polling for changed players every interval.
+    """
+    sync = RosterSync(firebase_service)
+    vault_sync = VaultSync(firebase_service) if args.two_way else None
+    watchlist = Watchlist(os.path.join(firebase_service.data_dir, 'watchlist.json'))
+    if vault_sync:
+        vault_sync.sync()
+    snapshot_players = local_snapshot(firebase_service).load() if args.from_snapshot else None
+    if snapshot_players is not None:
+        # Skip the full download and vault rewrite, only catch up on what changed since the snapshot
+        sync.seed(snapshot_players)
+        sync.incremental_sync()
+        count = len(sync.players)
+    else:
+        count = sync.full_sync()
+    logger.info("Daemon started with %d players, polling every %ds.", count, args.interval)
+
+    if watchlist.rules:
+        watchlist.prime(sync.players.values())
+
+        def on_change(changed, removed):
+            for alert in watchlist.check(changed, removed):
+                logger.warning("Watchlist: %s", describe_alert(alert))
+                if watchlist.desktop_notifications:
+                    send_desktop_notification("Watchlist match", describe_alert(alert))
+        firebase_service.add_change_listener(on_change)
+
+    polls = 0
+    while True:
+        time.sleep(args.interval)
+        polls += 1
+        try:
+            firebase_service.ensure_fresh_token()
+            if vault_sync:
+                pushed = vault_sync.sync()
+                if pushed:
+                    logger.info("Pushed vault edits for %d players.", len(pushed))
+            if args.full_every and polls % args.full_every == 0:
+                # Players written without updatedAt never show up in the incremental query
+                count = sync.full_sync()
+                logger.info("Full resync: %d players.", count)
+            else:
+                changed = sync.incremental_sync()
+                if changed:
+                    logger.info("Updated %d changed players in the vault.", len(changed))
+        except Exception as e:
+            # Keep the daemon alive through network blips; the next poll will catch up
+            logger.error("Sync failed: %s", e)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Ashes of Creation player tracker.")
+    parser.add_argument('--email', help="Account email (or set AOCDB_EMAIL). Password is read from AOCDB_PASSWORD or prompted.")
+    parser.add_argument('--vault', help="Obsidian vault folder containing Players/, Guilds/ and Discord/")
+    parser.add_argument('--workspace', help="Workspace (game server) to use instead of the default one")
+    parser.add_argument('--log-level', help="DEBUG, INFO, WARNING or ERROR (or set AOCDB_LOG_LEVEL)")
+    subparsers = parser.add_subparsers(dest='command')
+
+    subparsers.add_parser('gui', help="Start the desktop app (default)")
+
+    sync_parser = subparsers.add_parser('sync', help="Download the roster and rewrite the vault")
+    sync_parser.add_argument('--two-way', action='store_true', help="Push edits made in Obsidian first")
+    sync_parser.add_argument('--dry-run', action='store_true', help="Only list the vault edits that would be pushed")
+
+    export_parser = subparsers.add_parser('export', help="Export the roster to JSON or markdown")
+    export_parser.add_argument('--format', choices=['json', 'markdown'], default='json')
+    export_parser.add_argument('--output', default='players.json')
+
+    import_parser = subparsers.add_parser('import', help="Add or update players from a JSON file")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--with-associates', action='store_true', help="Also add reciprocal associate links")
+
+    query_parser = subparsers.add_parser('query', help="List players matching the View tab filters")
+    query_parser.add_argument('--class', dest='player_class')
+    query_parser.add_argument('--status')
+    query_parser.add_argument('--guild')
+    query_parser.add_argument('--sort', default='Name', choices=['Name', 'Level', 'Class', 'Hostile Status', 'Guild'])
+    query_parser.add_argument('--json', action='store_true')
+
+    daemon_parser = subparsers.add_parser('daemon', help="Keep the vault in sync, polling for changes")
+    daemon_parser.add_argument('--interval', type=int, default=300, help="Seconds between polls")
+    daemon_parser.add_argument('--full-every', type=int, default=12, help="Do a full resync every N polls (0 to disable)")
+    daemon_parser.add_argument('--two-way', action='store_true', help="Also push edits made in Obsidian each poll")
+    daemon_parser.add_argument('--from-snapshot', action='store_true',
+                               help="Start from the local roster snapshot instead of a full download")
+
+    repair_parser = subparsers.add_parser('repair-associates', help="Report and fix one-sided or dangling associate links")
+    repair_parser.add_argument('--dry-run', action='store_true', help="Only report, don't write anything")
+    repair_parser.add_argument('--prune-dangling', action='store_true', help="Also remove links to players that don't exist")
+
+    dedupe_parser = subparsers.add_parser('dedupe', help="List likely duplicates and alts, or merge two entries")
+    dedupe_parser.add_argument('--threshold', type=float, default=0.6)
+    dedupe_parser.add_argument('--merge', nargs=2, metavar=('PRIMARY', 'DUPLICATE'), help="Merge DUPLICATE into PRIMARY")
+
+    logs_parser = subparsers.add_parser('logs', help="Search the audit log")
+    logs_parser.add_argument('--player')
+    logs_parser.add_argument('--email')
+    logs_parser.add_argument('--field', help="Only entries that changed this field, e.g. Guild")
+    logs_parser.add_argument('--limit', type=int, default=50)
+    logs_parser.add_argument('--local', action='store_true', help="Search the local log cache (after fetching new entries)")
+
+    timeline_parser = subparsers.add_parser('timeline', help="Show (or add to) a player's sightings")
+    timeline_parser.add_argument('name')
+    timeline_parser.add_argument('--since', help="Only sightings at or after this UTC time, e.g. 2024-05-01T00:00:00Z")
+    timeline_parser.add_argument('--location', help="Log a new sighting at this location first")
+
+    watch_parser = subparsers.add_parser('watch', help="List, add, remove or check watchlist rules")
+    watch_parser.add_argument('action', choices=['list', 'add', 'remove', 'check'], nargs='?', default='list')
+    watch_parser.add_argument('rule', nargs='*', help="Rule text for add (e.g. Guild = Red Hand), rule id for remove")
+
+    templates_parser = subparsers.add_parser('templates', help="Check the note templates, or write the defaults out for editing")
+    templates_parser.add_argument('action', choices=['check', 'init'], nargs='?', default='check')
+
+    workspace_parser = subparsers.add_parser('workspace', help="List, add, remove or pick the default workspace")
+    workspace_parser.add_argument('action', choices=['list', 'add', 'remove', 'use'], nargs='?', default='list')
+    workspace_parser.add_argument('name', nargs='?')
+    workspace_parser.add_argument('--prefix', default='', help="Collection prefix for this server, e.g. eu1_")
+    workspace_parser.add_argument('--project-id', help="Firebase project, if the server isn't in the default one")
+    workspace_parser.add_argument('--api-key', help="Web API key of that project")
+    workspace_parser.add_argument('--vault', dest='workspace_vault', help="Obsidian vault folder for this workspace")
+
+    search_parser = subparsers.add_parser('search', help="Search the local snapshots of all workspaces")
+    search_parser.add_argument('name', nargs='?', default='', help="Name or part of it")
+    search_parser.add_argument('--class', dest='player_class')
+    search_parser.add_argument('--status')
+    search_parser.add_argument('--guild')
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="Export or import a compressed roster snapshot")
+    snapshot_parser.add_argument('action', choices=['export', 'import'])
+    snapshot_parser.add_argument('file')
+    snapshot_parser.add_argument('--base', help="Base snapshot: export a delta against it, or apply a delta on top of it")
+    return parser
+
+
+# Bulk commands run as background work: they yield to nothing interactive, but stop at the daily budget
+BACKGROUND_COMMANDS = {'sync', 'import', 'daemon', 'repair-associates'}
+
+# Commands (or command actions) that only use local files and don't need a sign-in
+OFFLINE_COMMANDS = {'workspace', 'search', 'templates'}
+OFFLINE_ACTIONS = {'watch': {'list', 'add', 'remove'}}
+
+
+def is_offline(args):
+    return args.command in OFFLINE_COMMANDS or getattr(args, 'action', None) in OFFLINE_ACTIONS.get(args.command, ())
+
+
+CLI_COMMANDS = {
+    'sync': cli_sync,
+    'export': cli_export,
+    'import': cli_import,
+    'query': cli_query,
+    'daemon': cli_daemon,
+    'snapshot': cli_snapshot,
+    'repair-associates': cli_repair_associates,
+    'dedupe': cli_dedupe,
+    'logs': cli_logs,
+    'timeline': cli_timeline,
+    'watch': cli_watch,
+    'templates': cli_templates,
+    'workspace': cli_workspace,
+    'search': cli_search,
+}
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    configure_logging(args.log_level)
+
+    if args.command in (None, 'gui'):
+        run_gui()
+        return 0
+
+    try:
+        firebase_service = FirebaseService(workspace_registry().get(args.workspace))
+    except Exception as e:
+        logger.error("%s failed: %s", args.command, e)
+        return 1
+    if args.vault:
+        set_vault_root(firebase_service, args.vault)
+    try:
+        if is_offline(args):
+            CLI_COMMANDS[args.command](firebase_service, args)
+            return 0
+        headless_login(firebase_service, args)
+        if args.command in BACKGROUND_COMMANDS:
+            with background_requests():
+                CLI_COMMANDS[args.command](firebase_service, args)
+        else:
+            CLI_COMMANDS[args.command](firebase_service, args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        logger.error("%s failed: %s", args.command, e)
+        return 1
+    finally:
+        firebase_service.scheduler.budget.save()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
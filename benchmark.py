@@ -0,0 +1,487 @@
+"""
+Benchmark harness for FirebaseService.
+
+Runs the service against a local fake Firestore REST server seeded with synthetic rosters
+and writes a JSON report that can be compared between runs:
+
+    python benchmark.py --sizes 1000 10000 --output bench_report.json
+    python benchmark.py --sizes 1000 --compare bench_report.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from AshesDBOBSV2git import (AssociateConsistencyJob, FirebaseService, RequestBudget, RequestScheduler, RosterColumns,
+                             filter_and_sort_players)
+
+DOCUMENTS_PREFIX = '/v1/projects/bench/databases/(default)/documents'
+
+CLASSES = ['Fighter', 'Tank', 'Rogue', 'Ranger', 'Mage', 'Summoner', 'Cleric', 'Bard']
+STATUSES = ['Friendly', 'Neutral', 'Hostile']
+SYLLABLES = ['ka', 'ri', 'to', 'mel', 'dor', 'an', 'vy', 'sha', 'gr', 'om', 'el', 'thu', 'zi', 'ra', 'nox', 'bel']
+
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the parts of the Firestore REST API that FirebaseService uses.
+    Documents are stored by their full path relative to the documents root, e.g. 'players/bob'.
+    """
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def put(self, path, fields):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            existing = self.documents.get(path)
+            self.documents[path] = {
+                'name': f'projects/bench/databases/(default)/documents/{path}',
+                'fields': fields,
+                'createTime': existing['createTime'] if existing else now,
+                'updateTime': now
+            }
+            return self.documents[path]
+
+    def commit(self, writes):
+        """
+        Applies batch writes atomically, honouring updateMask, the array updateTransforms and the
+        exists and updateTime preconditions.
+        """
+        with self.lock:
+            for write in writes:
+                path = (write.get('update') or {}).get('name') or write.get('delete')
+                path = path.split('/documents/', 1)[1]
+                exists = write.get('currentDocument', {}).get('exists')
+                if exists is not None and (path in self.documents) != exists:
+                    return False
+                update_time = write.get('currentDocument', {}).get('updateTime')
+                if update_time is not None and self.documents.get(path, {}).get('updateTime') != update_time:
+                    return False
+        for write in writes:
+            if 'delete' in write:
+                with self.lock:
+                    self.documents.pop(write['delete'].split('/documents/', 1)[1], None)
+                continue
+            path = write['update']['name'].split('/documents/', 1)[1]
+            fields = write['update'].get('fields', {})
+            if 'updateMask' in write:
+                with self.lock:
+                    merged = dict(self.documents.get(path, {}).get('fields', {}))
+                for field_path in write['updateMask']['fieldPaths']:
+                    key = field_path.strip('`')
+                    if key in fields:
+                        merged[key] = fields[key]
+                    else:
+                        merged.pop(key, None)
+                fields = merged
+            for transform in write.get('updateTransforms', []):
+                key = transform['fieldPath'].strip('`')
+                current = list(fields.get(key, {}).get('arrayValue', {}).get('values', []))
+                if 'appendMissingElements' in transform:
+                    current += [value for value in transform['appendMissingElements']['values'] if value not in current]
+                else:
+                    removed = transform['removeAllFromArray']['values']
+                    current = [value for value in current if value not in removed]
+                fields = dict(fields, **{key: {'arrayValue': {'values': current}}})
+            self.put(path, fields)
+        return True
+
+    def list_collection(self, collection):
+        prefix = collection + '/'
+        with self.lock:
+            return sorted(
+                (path, doc) for path, doc in self.documents.items()
+                if path.startswith(prefix) and '/' not in path[len(prefix):]
+            )
+
+
+def decode_value(value):
+    for key in ('stringValue', 'timestampValue', 'booleanValue', 'doubleValue', 'referenceValue'):
+        if key in value:
+            return value[key]
+    if 'integerValue' in value:
+        return int(value['integerValue'])
+    if 'arrayValue' in value:
+        return [decode_value(item) for item in value['arrayValue'].get('values', [])]
+    if 'mapValue' in value:
+        return {key: decode_value(item) for key, item in value['mapValue'].get('fields', {}).items()}
+    return None
+
+
+def document_value(doc, field_path):
+    field_path = field_path.strip('`')
+    if field_path == '__name__':
+        return doc['name']
+    return decode_value(doc['fields'].get(field_path, {}))
+
+
+FILTER_OPS = {
+    'EQUAL': lambda a, b: a == b,
+    'NOT_EQUAL': lambda a, b: a != b,
+    'LESS_THAN': lambda a, b: a < b,
+    'LESS_THAN_OR_EQUAL': lambda a, b: a <= b,
+    'GREATER_THAN': lambda a, b: a > b,
+    'GREATER_THAN_OR_EQUAL': lambda a, b: a >= b,
+    'ARRAY_CONTAINS': lambda a, b: isinstance(a, list) and b in a,
+    'IN': lambda a, b: a in b,
+}
+
+
+def matches_filter(fields, where):
+    if not where:
+        return True
+    if 'compositeFilter' in where:
+        return all(matches_filter(fields, f) for f in where['compositeFilter']['filters'])
+    field_filter = where['fieldFilter']
+    field_path = field_filter['field']['fieldPath'].strip('`')
+    if field_path not in fields:
+        return False
+    left = decode_value(fields[field_path])
+    right = decode_value(field_filter['value'])
+    try:
+        return FILTER_OPS[field_filter['op']](left, right)
+    except TypeError:
+        return False
+
+
+def run_structured_query(store, parent, query):
+    """
+    Evaluates the subset of structuredQuery the app uses: filters, orderBy, cursors and limit.
+    """
+    collection_id = query['from'][0]['collectionId']
+    collection = f'{parent}/{collection_id}' if parent else collection_id
+    documents = [doc for _, doc in store.list_collection(collection)
+                 if matches_filter(doc['fields'], query.get('where'))]
+
+    order_by = query.get('orderBy', [])
+    for order in reversed(order_by):
+        field_path = order['field']['fieldPath']
+        documents.sort(key=lambda doc: document_value(doc, field_path) or '',
+                       reverse=order.get('direction') == 'DESCENDING')
+
+    def cursor_key(doc):
+        return [document_value(doc, o['field']['fieldPath']) or '' for o in order_by]
+
+    def past_cursor(doc, cursor, inclusive):
+        key = cursor_key(doc)[:len(cursor['values'])]
+        values = [decode_value(v) for v in cursor['values']]
+        descending = order_by and order_by[0].get('direction') == 'DESCENDING'
+        if key == values:
+            return inclusive
+        return key < values if descending else key > values
+
+    if 'startAt' in query:
+        cursor = query['startAt']
+        documents = [doc for doc in documents if past_cursor(doc, cursor, cursor.get('before', False))]
+    documents = documents[query.get('offset', 0):]
+    if 'limit' in query:
+        documents = documents[:query['limit']]
+
+    read_time = datetime.now(timezone.utc).isoformat()
+    if not documents:
+        return [{'readTime': read_time}]
+    return [{'document': doc, 'readTime': read_time} for doc in documents]
+
+
+class FakeFirestoreHandler(BaseHTTPRequestHandler):
+    store = None  # Set by start_fake_firestore
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _relative_path(self):
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        if not path.startswith(DOCUMENTS_PREFIX):
+            return None, parsed
+        return path[len(DOCUMENTS_PREFIX):].strip('/'), parsed
+
+    def do_GET(self):
+        path, parsed = self._relative_path()
+        if path is None:
+            return self._send_json(404, {'error': {'message': 'NOT_FOUND'}})
+
+        if path.count('/') % 2 == 0:
+            # Collection listing with pageSize/pageToken paging
+            query = parse_qs(parsed.query)
+            page_size = int(query.get('pageSize', ['300'])[0])
+            start = int(query.get('pageToken', ['0'])[0])
+            documents = [doc for _, doc in self.store.list_collection(path)]
+            page = documents[start:start + page_size]
+            body = {'documents': page}
+            if start + page_size < len(documents):
+                body['nextPageToken'] = str(start + page_size)
+            return self._send_json(200, body)
+
+        doc = self.store.documents.get(path)
+        if doc is None:
+            return self._send_json(404, {'error': {'code': 404, 'message': 'NOT_FOUND'}})
+        return self._send_json(200, doc)
+
+    def do_PATCH(self):
+        path, parsed = self._relative_path()
+        if path is None or path.count('/') % 2 == 0:
+            return self._send_json(400, {'error': {'message': 'INVALID_ARGUMENT'}})
+        body = self._read_json()
+        fields = body.get('fields', {})
+        field_paths = parse_qs(parsed.query).get('updateMask.fieldPaths')
+        if field_paths:
+            # Only the masked fields change; the rest of the stored document is kept
+            with self.store.lock:
+                merged = dict(self.store.documents.get(path, {}).get('fields', {}))
+            for field_path in field_paths:
+                key = field_path.strip('`')
+                if key in fields:
+                    merged[key] = fields[key]
+                else:
+                    merged.pop(key, None)
+            fields = merged
+        return self._send_json(200, self.store.put(path, fields))
+
+    def do_POST(self):
+        path, _ = self._relative_path()
+        if path is None:
+            return self._send_json(404, {'error': {'message': 'NOT_FOUND'}})
+        body = self._read_json()
+        if path.endswith(':commit'):
+            if not self.store.commit(body.get('writes', [])):
+                return self._send_json(400, {'error': {'status': 'FAILED_PRECONDITION'}})
+            return self._send_json(200, {'writeResults': [{} for _ in body.get('writes', [])]})
+        if path.endswith(':runQuery'):
+            parent = path[:-len(':runQuery')].strip('/')
+            return self._send_json(200, run_structured_query(self.store, parent, body['structuredQuery']))
+        # POST to a collection creates a document with a generated ID
+        doc_path = f'{path}/{uuid.uuid4().hex[:20]}'
+        return self._send_json(200, self.store.put(doc_path, body.get('fields', {})))
+
+
+def start_fake_firestore(store):
+    handler = type('BoundFakeFirestoreHandler', (FakeFirestoreHandler,), {'store': store})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_name(rng, index):
+    parts = [rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))]
+    return ''.join(parts).capitalize() + str(index)
+
+
+def generate_roster(size, seed=42):
+    """
+    Builds a synthetic roster with skewed guild sizes, shared Discord names (alts)
+    and mostly reciprocal associate links within guilds.
+    """
+    rng = random.Random(seed)
+    guild_count = max(1, size // 25)
+    guild_names = [f"Guild{make_name(rng, i)}" for i in range(guild_count)]
+    discord_count = max(1, int(size * 0.8))
+
+    players = []
+    for i in range(size):
+        level = rng.randint(1, 50)
+        in_guild = rng.random() < 0.8
+        # Skew membership towards the first guilds, like real servers with a few zergs
+        guild = guild_names[min(guild_count - 1, int(rng.paretovariate(1.2)) - 1)] if in_guild else 'N/A'
+        players.append({
+            'Name': make_name(rng, i),
+            'Level': level,
+            'Class': rng.choice(CLASSES),
+            'Subclass': rng.choice(CLASSES) if level >= 25 else 'Unavailable',
+            'Hostile Status': rng.choice(STATUSES),
+            'Guild': guild,
+            'Guild Rank': rng.choice(['Member', 'Officer', 'Unknown']) if in_guild else 'N/A',
+            'Notes': '',
+            'Discord': f"user{rng.randrange(discord_count)}" if rng.random() < 0.6 else '',
+            'Known Associates': []
+        })
+
+    by_guild = {}
+    for player in players:
+        by_guild.setdefault(player['Guild'], []).append(player)
+
+    for player in players:
+        pool = by_guild[player['Guild']] if player['Guild'] != 'N/A' and rng.random() < 0.8 else players
+        for _ in range(rng.randint(0, 4)):
+            other = rng.choice(pool)
+            if other is player or other['Name'] in player['Known Associates']:
+                continue
+            player['Known Associates'].append(other['Name'])
+            # About one in ten links is one-sided, like the real data
+            if rng.random() < 0.9 and player['Name'] not in other['Known Associates']:
+                other['Known Associates'].append(player['Name'])
+    return players
+
+
+def seed_store(store, service, players):
+    for player in players:
+        store.put(f"{service.collection('players')}/{player['Name'].lower()}", service.dict_to_firestore_fields(player))
+
+
+def make_service(port, output_root):
+    service = FirebaseService()
+    service.database_url = f'http://127.0.0.1:{port}{DOCUMENTS_PREFIX}'
+    service.id_token = 'bench-token'
+    service.user = {'email': 'bench@example.com', 'localId': 'bench-user'}
+    service.user_role = 'user'
+    service.player_path = os.path.join(output_root, 'Players')
+    service.guild_path = os.path.join(output_root, 'Guilds')
+    service.discord_path = os.path.join(output_root, 'Discord')
+    # Measure the client code, not the rate limits, and keep the fake traffic out of the real daily budget
+    unlimited = {name: (100000, 100000) for name in ('read', 'write', 'auth')}
+    service.scheduler = RequestScheduler(RequestBudget(os.path.join(output_root, 'request_budget.json')), rates=unlimited)
+    return service
+
+
+def time_runs(func, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - start) * 1000.0)
+    return {
+        'runs': repeat,
+        'min_ms': round(min(durations), 2),
+        'median_ms': round(statistics.median(durations), 2),
+        'max_ms': round(max(durations), 2)
+    }, result
+
+
+def run_size(size, repeat, save_samples, seed):
+    store = FakeFirestore()
+    server = start_fake_firestore(store)
+    output_root = tempfile.mkdtemp(prefix='aocdb-bench-')
+    try:
+        service = make_service(server.server_address[1], output_root)
+        roster = generate_roster(size, seed=seed)
+        seed_store(store, service, roster)
+        results = {}
+
+        results['get_all_players'], players = time_runs(service.get_all_players, repeat)
+
+        filters = {'Class': 'Mage', 'Hostile Status': 'Hostile', 'Guild': ''}
+        results['filter_and_sort_players'], _ = time_runs(
+            lambda: filter_and_sort_players(players, filters, 'Level'), repeat)
+        results['filter_and_sort_players.unfiltered'], _ = time_runs(
+            lambda: filter_and_sort_players(players, {}, 'Name'), repeat)
+
+        guilds = service.get_all_guilds(players)
+        discord_names = service.get_all_discordNames(players)
+        results['export_to_markdown'], _ = time_runs(
+            lambda: service.export_to_markdown(players, guilds, discord_names), repeat)
+
+        results['associate_check.scan'], _ = time_runs(
+            lambda: AssociateConsistencyJob(service).scan(players), repeat)
+
+        columns = RosterColumns()
+        results['analytics.rebuild'], _ = time_runs(lambda: columns.rebuild(players), repeat)
+        results['analytics.level_stats_by_guild'], _ = time_runs(
+            lambda: columns.level_stats('Guild', {'Hostile Status': 'Hostile'}), repeat)
+
+        rng = random.Random(seed + 1)
+        samples = rng.sample(players, min(save_samples, len(players)))
+
+        def save_samples_with_associates():
+            for player in samples:
+                service.save_player_with_associates(dict(player))
+
+        results['save_player_with_associates'], _ = time_runs(save_samples_with_associates, 1)
+        results['save_player_with_associates']['players_saved'] = len(samples)
+
+        return {'results': results, 'service_diagnostics': service.diagnostics()}
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(output_root, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare_reports(baseline, current):
+    """
+    Prints the median change for every operation present in both reports.
+    """
+    for size, data in current['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if not base:
+            continue
+        print(f"\nRoster size {size}:")
+        for op, timing in data['results'].items():
+            base_timing = base['results'].get(op)
+            if not base_timing or not base_timing['median_ms']:
+                continue
+            ratio = timing['median_ms'] / base_timing['median_ms']
+            print(f"  {op:40s} {base_timing['median_ms']:>10.2f} -> {timing['median_ms']:>10.2f} ms  ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FirebaseService against a local fake Firestore.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save-samples', type=int, default=50, help="Players saved in the save-with-associates flow")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_report.json')
+    parser.add_argument('--compare', help="Previous report to compare medians against")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'sizes': {}
+    }
+
+    for size in args.sizes:
+        print(f"Benchmarking roster of {size} players...")
+        report['sizes'][str(size)] = run_size(size, args.repeat, args.save_samples, args.seed)
+        for op, timing in report['sizes'][str(size)]['results'].items():
+            print(f"  {op:40s} median {timing['median_ms']:>10.2f} ms")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app reads its data folder at import time; never let tests touch ~/.aocdb
+os.environ['AOCDB_HOME'] = tempfile.mkdtemp(prefix='aocdb-tests-')
+
+import AshesDBOBSV2git as aocdb  # noqa: E402
+import benchmark  # noqa: E402
+
+
+@pytest.fixture
+def app_home(tmp_path, monkeypatch):
+    """
+    A fresh, empty app data folder for the test.
+    """
+    monkeypatch.setattr(aocdb, 'APP_DATA_DIR', str(tmp_path))
+    return tmp_path
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+@pytest.fixture
+def fake_response():
+    return FakeResponse
+
+
+@pytest.fixture
+def firestore(app_home):
+    """
+    A signed-in FirebaseService talking to the in-memory fake Firestore from benchmark.py.
+    Returns (store, service); failed requests aren't retried.
+    """
+    store = benchmark.FakeFirestore()
+    server = benchmark.start_fake_firestore(store)
+    service = benchmark.make_service(server.server_address[1], str(app_home / 'vault'))
+    service.max_retries = 0
+    yield store, service
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,98 @@
+import pytest
+
+import AshesDBOBSV2git as aocdb
+import benchmark
+
+
+def build_columns():
+    players = benchmark.generate_roster(300, seed=7)
+    for index, player in enumerate(players):
+        player['createdAt'] = f'2024-{index % 12 + 1:02d}-01T00:00:00Z'
+    players[0]['Level'] = 'unknown'
+    columns = aocdb.RosterColumns()
+    columns.rebuild(players)
+    changed = [dict(players[1], Level=50, Guild='Brand New Guild'), {'Name': 'Latecomer', 'Level': 3}]
+    columns.apply_changes(changed=changed, removed=[players[2]['Name'], 'Nobody'])
+    return columns
+
+
+def all_results(columns):
+    guild = columns.group_counts('Guild')[1][0]
+    filters = {'Hostile Status': 'hostile'}
+    return {
+        'classes': columns.group_counts('Class'),
+        'hostile classes': columns.group_counts('Class', filters),
+        'crosstab': columns.crosstab('Class', 'Hostile Status'),
+        'histogram': columns.level_histogram(bin_width=10),
+        'stats': columns.level_stats(),
+        'stats by guild': columns.level_stats('Guild', filters, pcts=(25, 50, 90)),
+        'compare': columns.compare_guilds([guild, 'Brand New Guild', 'No Such Guild']),
+        'growth': columns.growth(),
+    }
+
+
+@pytest.fixture
+def without_numpy(monkeypatch):
+    monkeypatch.setattr(aocdb, '_numpy', None)
+
+
+def test_numpy_and_plain_python_agree(monkeypatch):
+    if aocdb.optional_numpy() is None:
+        pytest.skip("numpy not installed")
+    with_numpy = all_results(build_columns())
+    monkeypatch.setattr(aocdb, '_numpy', None)
+    assert all_results(build_columns()) == with_numpy
+
+
+def test_counts_match_the_roster(without_numpy):
+    players = benchmark.generate_roster(200, seed=3)
+    columns = aocdb.RosterColumns()
+    columns.rebuild(players)
+    assert len(columns) == 200
+    hostile = aocdb.filter_and_sort_players(players, {'Hostile Status': 'Hostile'})
+    counts = dict(columns.group_counts('Class', {'Hostile Status': 'HOSTILE'}))
+    assert sum(counts.values()) == len(hostile)
+    for class_name, count in counts.items():
+        assert count == sum(1 for player in hostile if player['Class'] == class_name)
+
+
+def test_changes_update_rows_in_place(without_numpy):
+    columns = aocdb.RosterColumns()
+    columns.rebuild([{'Name': 'Grimclaw', 'Level': 10, 'Guild': 'Red Hand'}, {'Name': 'Ivy', 'Level': 30}])
+    version = columns.version
+    columns.apply_changes(changed=[{'Name': 'grimclaw', 'Level': 20, 'Guild': 'Blue'}], removed=['Ivy'])
+    assert columns.version == version + 1
+    assert len(columns) == 1 and len(columns.names) == 2
+    assert columns.group_counts('Guild') == [('Blue', 1)]
+    assert columns.level_stats() == {'All': {'players': 1, 'mean': 20.0, 'p50': 20, 'p90': 20}}
+    columns.apply_changes(changed=[{'Name': 'Ivy', 'Level': 31}])
+    assert len(columns) == 2
+
+
+def test_level_stats_use_nearest_rank(without_numpy):
+    columns = aocdb.RosterColumns()
+    columns.rebuild([{'Name': f'p{level}', 'Level': level, 'Guild': 'Red Hand' if level % 2 else 'Blue'}
+                     for level in range(1, 11)] + [{'Name': 'unknown', 'Level': None}])
+    stats = columns.level_stats('Guild', pcts=(50, 90))
+    assert stats['Red Hand'] == {'players': 5, 'mean': 5.0, 'p50': 5, 'p90': 9}
+    assert stats['Blue'] == {'players': 5, 'mean': 6.0, 'p50': 6, 'p90': 10}
+    assert columns.level_histogram(bin_width=5) == [(0, 4), (5, 5), (10, 1)]
+
+
+def test_growth_counts_players_by_month_added(without_numpy):
+    columns = aocdb.RosterColumns()
+    columns.rebuild([{'Name': 'a', 'createdAt': '2024-01-05T00:00:00Z'},
+                     {'Name': 'b', 'createdAt': '2024-03-01T00:00:00Z', 'updatedAt': '2024-06-01T00:00:00Z'},
+                     {'Name': 'c', 'updatedAt': '2024-01-09T00:00:00Z'},
+                     {'Name': 'd'}])
+    assert columns.growth() == [('2024-01', 2, 2), ('2024-03', 1, 3), ('Unknown', 1, 4)]
+
+
+def test_created_at_falls_back_to_the_create_time():
+    service = aocdb.FirebaseService()
+    document = {'fields': service.dict_to_firestore_fields({'Name': 'Grimclaw'}),
+                'createTime': '2024-05-01T02:30:00.123456Z'}
+    # Shifted like updatedAt, so both read the same way
+    assert service.player_from_document(document)['createdAt'] == '2024-04-30T22:30:00Z'
+    document['fields'] = service.dict_to_firestore_fields({'Name': 'Grimclaw', 'createdAt': '2024-01-01T00:00:00Z'})
+    assert service.player_from_document(document)['createdAt'] == '2024-01-01T00:00:00Z'
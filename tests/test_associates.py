@@ -0,0 +1,66 @@
+import AshesDBOBSV2git as aocdb
+
+
+def make_roster():
+    return [
+        {'Name': 'Grimclaw', 'Known Associates': ['Ivy', 'Oak', 'Ghost', 'grimclaw']},
+        {'Name': 'Ivy', 'Known Associates': ['GRIMCLAW']},
+        {'Name': 'Oak', 'Known Associates': []},
+        {'Name': 'Ash', 'Known Associates': ['Oak']},
+        {'Known Associates': ['Ivy']},  # No name, skipped
+    ]
+
+
+def test_scan_finds_one_sided_and_dangling_links():
+    report = aocdb.AssociateConsistencyJob(None).scan(make_roster())
+    assert report == {'players_scanned': 4,
+                      'one_sided': [('Grimclaw', 'Oak'), ('Ash', 'Oak')],
+                      'dangling': [('Grimclaw', 'Ghost')]}
+
+
+def test_plan_only_prunes_dangling_links_when_asked():
+    job = aocdb.AssociateConsistencyJob(None)
+    players = make_roster()
+    report = job.scan(players)
+    assert job.plan_fixes(players, report) == {'Oak': {'append': ['Grimclaw', 'Ash'], 'remove': []}}
+    assert job.plan_fixes(players, report, prune_dangling=True) == {
+        'Oak': {'append': ['Grimclaw', 'Ash'], 'remove': []},
+        'Grimclaw': {'append': [], 'remove': ['Ghost']},
+    }
+
+
+def test_one_sided_links_to_the_same_player_are_appended_once():
+    players = [{'Name': 'Oak', 'Known Associates': []},
+               {'Name': 'Ivy', 'Known Associates': ['Oak']},
+               {'Name': 'ivy', 'Known Associates': ['Oak']}]
+    job = aocdb.AssociateConsistencyJob(None)
+    assert job.plan_fixes(players, job.scan(players))['Oak']['append'] == ['ivy']
+
+
+def test_field_update_uses_array_transforms(firestore):
+    _, service = firestore
+    write = service.player_field_update('Oak', append={'Known Associates': ['Ash']})
+    assert write['updateMask'] == {'fieldPaths': ['updatedBy', 'updatedAt']}
+    assert write['currentDocument'] == {'exists': True}
+    assert write['updateTransforms'] == [{'fieldPath': '`Known Associates`',
+                                          'appendMissingElements': {'values': [{'stringValue': 'Ash'}]}}]
+
+
+def test_repair_keeps_links_added_since_the_scan(firestore):
+    store, service = firestore
+    players = [player for player in make_roster() if player.get('Name')]
+    for player in players:
+        store.put(f"players/{player['Name'].lower()}", service.dict_to_firestore_fields(player))
+    roster = service.get_all_players()
+    # Another scout links Oak to Ivy after the roster was read
+    oak = dict(roster[[player['Name'] for player in roster].index('Oak')], **{'Known Associates': ['Ivy']})
+    store.put('players/oak', service.dict_to_firestore_fields(oak))
+
+    report = aocdb.AssociateConsistencyJob(service).run(players=roster, dry_run=False, prune_dangling=True)
+    assert report['committed'] == 2
+
+    def associates(name):
+        return service.firestore_fields_to_dict(store.documents[f'players/{name}']['fields'])['Known Associates']
+    assert associates('oak') == ['Ivy', 'Ash', 'Grimclaw']
+    assert associates('grimclaw') == ['Ivy', 'Oak', 'grimclaw']
+    assert aocdb.AssociateConsistencyJob(service).run(dry_run=True)['players_to_update'] == 1  # The link Oak got meanwhile
@@ -0,0 +1,114 @@
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+def test_names_normalise_across_spacing_case_and_accents():
+    for name in ('Dark  Knight_', 'darkknight', 'DárkKnight'):
+        assert aocdb.normalize_player_name(name) == 'darkknight'
+
+
+def test_only_players_sharing_a_block_are_paired():
+    players = [
+        {'Name': 'Grimclaw'}, {'Name': 'Grimclaww'},  # Share most trigrams
+        {'Name': 'Zephyr'},  # Shares nothing with anyone
+        {'Name': 'Ivy', 'Discord': 'ivy#7'}, {'Name': 'Oakheart', 'Discord': 'IVY#7 '},
+    ]
+    pairs = aocdb.DuplicateFinder().candidate_pairs(players)
+    assert pairs == {(0, 1): {'trigram'}, (3, 4): {'discord'}}
+
+
+def test_trigrams_shared_by_too_many_players_are_ignored():
+    players = [{'Name': f'xyz{index}'} for index in range(10)]
+    finder = aocdb.DuplicateFinder(max_bucket_size=5)
+    assert finder.candidate_pairs(players) == {}
+
+
+def test_score_rewards_name_discord_guild_and_class():
+    finder = aocdb.DuplicateFinder()
+    same, reasons = finder.score({'Name': 'Dark Knight', 'Guild': 'Red', 'Class': 'Tank'},
+                                 {'Name': 'darkknight', 'Guild': 'Red', 'Class': 'Tank'})
+    assert same == 0.75
+    assert reasons == ['same normalised name', 'same guild', 'same class']
+    unrelated, _ = finder.score({'Name': 'Grimclaw', 'Guild': 'N/A'}, {'Name': 'Zephyr', 'Guild': 'N/A'})
+    assert unrelated < 0.3
+
+
+def test_typos_are_duplicates_and_shared_discords_are_alts():
+    players = [
+        {'Name': 'Grimclaw', 'Discord': 'grim#1'},
+        {'Name': 'Shadowbane', 'Discord': 'grim#1'},
+        {'Name': 'Bob the Brave'},
+        {'Name': 'Bob-the-Brave'},
+        {'Name': 'Zephyr'},
+    ]
+    found = {(candidate['first'], candidate['second']): candidate for candidate in aocdb.DuplicateFinder().find(players)}
+    assert set(found) == {('Grimclaw', 'Shadowbane'), ('Bob the Brave', 'Bob-the-Brave')}
+    assert found[('Grimclaw', 'Shadowbane')]['kind'] == 'alt'
+    assert found[('Bob the Brave', 'Bob-the-Brave')]['kind'] == 'duplicate'
+
+
+def test_merge_keeps_primary_fills_gaps_and_unions_associates():
+    primary = {'Name': 'Grimclaw', 'Level': 20, 'Guild': 'N/A', 'Class': 'Fighter', 'Notes': 'Tank',
+               'Known Associates': ['Ivy', 'Grimclow']}
+    duplicate = {'Name': 'Grimclow', 'Level': 25, 'Guild': 'Red Hand', 'Class': 'Rogue', 'Notes': 'Seen at Lynthia',
+                 'Known Associates': ['ivy', 'Oak', 'Grimclaw']}
+    merged = aocdb.merge_player_records(primary, duplicate)
+    assert merged['Name'] == 'Grimclaw'
+    assert merged['Level'] == 25
+    assert merged['Guild'] == 'Red Hand'
+    assert merged['Class'] == 'Fighter'
+    assert merged['Notes'] == 'Tank\n\nSeen at Lynthia'
+    assert merged['Known Associates'] == ['Ivy', 'Oak']
+
+
+def put(store, service, player):
+    store.put(f"players/{player['Name'].lower()}", service.dict_to_firestore_fields(player))
+
+
+def stored(store, service, name):
+    return service.firestore_fields_to_dict(store.documents[f'players/{name}']['fields'])
+
+
+def test_merge_uses_the_players_as_stored_now(firestore, tmp_path):
+    store, service = firestore
+    put(store, service, {'Name': 'Grimclaw', 'Level': 20, 'Guild': 'N/A', 'Known Associates': [],
+                         'createdAt': '2024-01-01T00:00:00Z'})
+    put(store, service, {'Name': 'Grimclow', 'Level': 25, 'Guild': 'Red Hand', 'Known Associates': []})
+    roster = service.get_all_players()
+    # Someone edits the primary after the roster was read
+    put(store, service, dict(stored(store, service, 'grimclaw'), Class='Mage'))
+    encounters = aocdb.EncounterStore(str(tmp_path / 'encounters.jsonl'))
+    encounters.add([service.add_encounter('Grimclow', seen_at='2024-05-01T10:00:00Z'),
+                    service.add_encounter('Grimclaw', seen_at='2024-05-02T10:00:00Z')])
+
+    merged, _ = aocdb.DuplicateMerger(service).merge('Grimclaw', 'Grimclow', players=roster,
+                                                     encounter_store=encounters)
+    primary = stored(store, service, 'grimclaw')
+    assert primary['Class'] == 'Mage' and primary['Level'] == 25 and primary['Guild'] == 'Red Hand'
+    assert primary['createdAt'] == '2024-01-01T00:00:00Z'
+    assert 'players/grimclow' not in store.documents
+    assert merged['Class'] == 'Mage'
+
+    times = ['2024-05-01T10:00:00Z', '2024-05-02T10:00:00Z']
+    assert [encounter['time'] for encounter in encounters.timeline('Grimclaw')] == times
+    assert encounters.timeline('Grimclow') == []
+    reloaded = aocdb.EncounterStore(encounters.path)
+    assert [encounter['player'] for encounter in reloaded.timeline('grimclaw')] == ['Grimclaw', 'Grimclaw']
+
+
+def test_merge_fails_if_a_player_changed_before_the_commit(firestore):
+    store, service = firestore
+    put(store, service, {'Name': 'Grimclaw', 'Level': 20, 'Known Associates': []})
+    put(store, service, {'Name': 'Grimclow', 'Level': 25, 'Known Associates': []})
+    times = {name: store.documents[f'players/{name}']['updateTime'] for name in ('grimclaw', 'grimclow')}
+    merger = aocdb.DuplicateMerger(service)
+    _, _, writes = merger.plan(service.get_all_players(), 'Grimclaw', 'Grimclow', times)
+    assert writes[0]['currentDocument'] == {'updateTime': times['grimclaw']}
+    assert 'Level' in writes[0]['updateMask']['fieldPaths']
+
+    put(store, service, dict(stored(store, service, 'grimclaw'), Level=21))
+    with pytest.raises(Exception):
+        service.commit_writes(writes)
+    assert stored(store, service, 'grimclaw')['Level'] == 21
+    assert 'players/grimclow' in store.documents
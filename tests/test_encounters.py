@@ -0,0 +1,79 @@
+import AshesDBOBSV2git as aocdb
+
+
+def encounter(encounter_id, player, time, **fields):
+    return dict(fields, id=encounter_id, player=player, time=time)
+
+
+def times(encounters):
+    return [encounter['time'] for encounter in encounters]
+
+
+def test_store_keeps_each_timeline_sorted(tmp_path):
+    store = aocdb.EncounterStore(str(tmp_path / 'encounters.jsonl'))
+    assert store.add([encounter('a', 'Grimclaw', '2024-05-03T10:00:00Z'),
+                      encounter('b', 'grimclaw', '2024-05-01T10:00:00Z'),
+                      encounter('c', 'Ivy', '2024-05-02T10:00:00Z')]) == 3
+    assert store.add([encounter('d', 'Grimclaw', '2024-05-02T10:00:00Z'),
+                      encounter('a', 'Grimclaw', '2024-05-03T10:00:00Z')]) == 1
+    assert times(store.timeline('GRIMCLAW')) == ['2024-05-01T10:00:00Z', '2024-05-02T10:00:00Z', '2024-05-03T10:00:00Z']
+    assert store.latest_time('Grimclaw') == '2024-05-03T10:00:00Z'
+    assert store.last_seen('Oak') is None and store.latest_time('Oak') is None
+
+
+def test_timeline_ranges(tmp_path):
+    store = aocdb.EncounterStore(str(tmp_path / 'encounters.jsonl'))
+    store.add([encounter(str(day), 'Grimclaw', f'2024-05-0{day}T10:00:00Z') for day in range(1, 6)])
+    assert [e['id'] for e in store.timeline('Grimclaw', since='2024-05-02T10:00:00Z', until='2024-05-04T10:00:00Z')] == ['2', '3']
+    assert [e['id'] for e in store.timeline('Grimclaw', since='2024-05-04T00:00:00Z')] == ['4', '5']
+    assert [e['id'] for e in store.timeline('Grimclaw', until='2024-05-01T10:00:01Z')] == ['1']
+
+
+def test_store_persists_and_skips_damaged_lines(tmp_path):
+    path = tmp_path / 'encounters.jsonl'
+    store = aocdb.EncounterStore(str(path))
+    store.add([encounter('a', 'Grimclaw', '2024-05-01T10:00:00Z', location='Lynthia')])
+    with open(path, 'a') as f:
+        f.write('{"id": "broken\n')
+    reloaded = aocdb.EncounterStore(str(path))
+    assert reloaded.last_seen('Grimclaw')['location'] == 'Lynthia'
+    assert reloaded.add([encounter('a', 'Grimclaw', '2024-05-01T10:00:00Z')]) == 0
+
+
+def test_move_refiles_sightings(tmp_path):
+    store = aocdb.EncounterStore(str(tmp_path / 'encounters.jsonl'))
+    store.add([encounter('a', 'Grimclow', '2024-05-01T10:00:00Z'), encounter('b', 'Grimclaw', '2024-05-02T10:00:00Z')])
+    assert store.move('Grimclow', 'Grimclaw') == 1
+    assert store.move('Grimclow', 'Grimclaw') == 0
+    reloaded = aocdb.EncounterStore(store.path)
+    assert [e['id'] for e in reloaded.timeline('Grimclaw')] == ['a', 'b']
+    assert reloaded.timeline('Grimclow') == []
+
+
+def test_sightings_round_trip_through_firestore(firestore):
+    _, service = firestore
+    for day in (3, 1, 2):
+        service.add_encounter('Grimclaw', level=20 + day, guild='Red Hand', location='Lynthia',
+                              seen_at=f'2024-05-0{day}T10:00:00Z')
+    newest = service.get_encounters('Grimclaw', limit=2)
+    assert times(newest) == ['2024-05-03T10:00:00Z', '2024-05-02T10:00:00Z']
+    assert newest[0]['level'] == 23 and newest[0]['reporter'] == 'bench@example.com'
+    assert service.get_last_seen('grimclaw')['time'] == '2024-05-03T10:00:00Z'
+    assert service.get_encounters('Oak') == []
+
+
+def test_catching_up_reads_every_page(firestore, tmp_path):
+    _, service = firestore
+    for minute in range(7):
+        service.add_encounter('Grimclaw', seen_at=f'2024-05-01T10:0{minute}:00Z')
+    # Several sightings in the same second still page correctly
+    for _ in range(3):
+        service.add_encounter('Grimclaw', seen_at='2024-05-01T10:03:00Z')
+    fetched = service.get_encounters_since('Grimclaw', page_size=3)
+    assert len(fetched) == 10 and len({e['id'] for e in fetched}) == 10
+    assert times(fetched) == sorted(times(fetched))
+
+    store = aocdb.EncounterStore(str(tmp_path / 'encounters.jsonl'))
+    store.add(fetched[:4])
+    since = service.get_encounters_since('Grimclaw', since=store.latest_time('Grimclaw'), page_size=3)
+    assert store.add(since) == 6
@@ -0,0 +1,70 @@
+import AshesDBOBSV2git as aocdb
+
+
+def add_log(store, service, log_id, timestamp, player, changes, email='scout@example.com'):
+    fields = service.dict_to_firestore_fields({'userId': 'u1', 'email': email, 'actionType': 'update',
+                                               'playerName': player, 'changes': changes})
+    fields['timestamp'] = {'timestampValue': timestamp}
+    store.put(f'logs/{log_id}', fields)
+
+
+def seed_logs(store, service):
+    store.put('players/grimclaw', service.dict_to_firestore_fields({'Name': 'Grimclaw', 'Level': 6}))
+    add_log(store, service, 'a', '2024-05-01T10:00:00Z', 'Grimclaw', {'Level': {'old': 4, 'new': 5}})
+    add_log(store, service, 'b', '2024-05-01T11:00:00Z', 'Ivy', {'Guild': {'old': 'N/A', 'new': 'Red Hand'}},
+            email='other@example.com')
+    add_log(store, service, 'c', '2024-05-01T12:00:00Z', 'Grimclaw', {'Notes': {'old': '', 'new': 'Tank'}})
+    add_log(store, service, 'd', '2024-05-01T13:00:00Z', 'Ivy', {'Level': {'old': 1, 'new': 2}},
+            email='other@example.com')
+    add_log(store, service, 'e', '2024-05-01T14:00:00Z', 'Grimclaw', {'Level': {'old': 5, 'new': 6}})
+
+
+def ids(entries):
+    return [entry['id'] for entry in entries]
+
+
+def test_query_logs_pages_with_a_cursor(firestore):
+    store, service = firestore
+    seed_logs(store, service)
+    pages = []
+    cursor = None
+    while True:
+        entries, cursor = service.query_logs(limit=2, cursor=cursor)
+        pages.append(ids(entries))
+        if not cursor:
+            break
+    assert pages == [['e', 'd'], ['c', 'b'], ['a']]
+    entries, _ = service.query_logs(since='2024-05-01T12:00:00Z', until='2024-05-01T14:00:00Z', ascending=True)
+    assert ids(entries) == ['c', 'd']
+
+
+def test_query_logs_ignores_case_of_names_and_emails(firestore):
+    store, service = firestore
+    seed_logs(store, service)
+    assert ids(service.query_logs(player_name='GRIMCLAW')[0]) == ['e', 'c', 'a']
+    assert ids(service.query_logs(email='Other@Example.com')[0]) == ['d', 'b']
+
+
+def test_query_logs_filters_fields_before_the_limit(firestore):
+    store, service = firestore
+    seed_logs(store, service)
+    entries, cursor = service.query_logs(field='Level', limit=2)
+    assert ids(entries) == ['e', 'd']
+    entries, cursor = service.query_logs(field='Level', limit=2, cursor=cursor)
+    assert ids(entries) == ['a'] and cursor is None
+
+
+def test_log_cache_only_fetches_new_entries(firestore, tmp_path):
+    store, service = firestore
+    seed_logs(store, service)
+    cache = aocdb.LogCache(str(tmp_path / 'logs.jsonl'))
+    assert cache.sync(service, page_size=2) == 5
+    assert cache.sync(service, page_size=2) == 0
+    add_log(store, service, 'f', '2024-05-01T14:00:00Z', 'Oak', {'Level': {'old': 1, 'new': 3}})
+    assert cache.sync(service) == 1
+
+    reloaded = aocdb.LogCache(cache.path)
+    assert ids(reloaded.query()) == ['f', 'e', 'd', 'c', 'b', 'a']
+    assert ids(reloaded.query(player_name='grimclaw', field='Level')) == ['e', 'a']
+    assert ids(reloaded.query(email='OTHER@example.com', limit=1)) == ['d']
+    assert reloaded.latest_timestamp() == '2024-05-01T14:00:00Z'
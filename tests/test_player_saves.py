@@ -0,0 +1,73 @@
+import AshesDBOBSV2git as aocdb
+
+
+def stored(store, service, name):
+    document = store.documents[f"{service.collection('players')}/{name.lower()}"]
+    return service.firestore_fields_to_dict(document['fields'])
+
+
+def fail_reads(service, fake_response):
+    request = service.session.request
+
+    def failing(method, url, **kwargs):
+        if method == 'GET':
+            return fake_response(500, b'{}')
+        return request(method, url, **kwargs)
+    service.session.request = failing
+
+
+def logged_actions(store, service):
+    return [service.firestore_fields_to_dict(doc['fields'])['actionType']
+            for _, doc in store.list_collection(service.collection('logs'))]
+
+
+def test_new_players_get_created_at(firestore):
+    store, service = firestore
+    service.add_or_update_player({'Name': 'Grimclaw', 'Level': 5})
+    player = stored(store, service, 'Grimclaw')
+    assert player['createdAt'] == player['updatedAt']
+    assert logged_actions(store, service) == ['add']
+
+
+def test_created_at_survives_updates(firestore):
+    store, service = firestore
+    player = {'Name': 'Grimclaw', 'Level': 5, 'createdAt': '2024-01-01T00:00:00Z'}
+    store.put('players/grimclaw', service.dict_to_firestore_fields(player))
+    service.add_or_update_player({'Name': 'Grimclaw', 'Level': 6})
+    assert stored(store, service, 'Grimclaw')['createdAt'] == '2024-01-01T00:00:00Z'
+
+
+def test_failed_lookup_is_not_a_new_player(firestore, fake_response):
+    store, service = firestore
+    store.put('players/grimclaw', service.dict_to_firestore_fields(
+        {'Name': 'Grimclaw', 'Level': 5, 'Guild': 'Red Hand', 'createdAt': '2024-01-01T00:00:00Z'}))
+    fail_reads(service, fake_response)
+    service.add_or_update_player({'Name': 'Grimclaw', 'Level': 6})
+    player = stored(store, service, 'Grimclaw')
+    assert player['createdAt'] == '2024-01-01T00:00:00Z'
+    assert player['Level'] == 6 and player['Guild'] == 'Red Hand'
+    assert logged_actions(store, service) == ['update']
+
+
+def test_failed_lookup_raises_for_writers(firestore, fake_response):
+    _, service = firestore
+    fail_reads(service, fake_response)
+    assert service.get_player_by_name('Grimclaw') is None
+    try:
+        service.get_player_for_update('Grimclaw')
+    except aocdb.TransientLookupError:
+        pass
+    else:
+        raise AssertionError('a 500 must not read as a missing player')
+
+
+def test_saves_read_past_the_cache(firestore):
+    store, service = firestore
+    service.add_or_update_player({'Name': 'Ivy', 'Level': 5, 'Guild': 'N/A', 'Known Associates': []})
+    assert service.get_player_by_name('Ivy')['Guild'] == 'N/A'
+    # Another scout moves Ivy into a guild while our copy is still cached
+    store.put('players/ivy', service.dict_to_firestore_fields(dict(stored(store, service, 'Ivy'), Guild='Red Hand')))
+    service.save_player_with_associates({'Name': 'Grimclaw', 'Level': 6, 'Known Associates': ['Ivy']})
+    ivy = stored(store, service, 'Ivy')
+    assert ivy['Guild'] == 'Red Hand'
+    assert ivy['Known Associates'] == ['Grimclaw']
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+class SlowLoader:
+    """
+    A loader that blocks until released, counting its calls.
+    """
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self.value
+
+
+def load_in_thread(cache, key, loader, results):
+    def run():
+        try:
+            results.append(cache.get_or_load(key, loader))
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_hits_return_copies():
+    cache = aocdb.ReadThroughCache()
+    assert cache.get_or_load('grim', lambda: {'Known Associates': ['Ivy']}) == {'Known Associates': ['Ivy']}
+    cache.get_or_load('grim', lambda: None)['Known Associates'].append('Oak')
+    assert cache.get_or_load('grim', lambda: None) == {'Known Associates': ['Ivy']}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_concurrent_lookups_share_one_load():
+    cache = aocdb.ReadThroughCache()
+    loader = SlowLoader({'Name': 'Grimclaw'})
+    results = []
+    threads = [load_in_thread(cache, 'grim', loader, results) for _ in range(5)]
+    wait_for(lambda: cache.coalesced == 4)
+    loader.release.set()
+    for thread in threads:
+        thread.join()
+    assert loader.calls == 1
+    assert results == [{'Name': 'Grimclaw'}] * 5
+    assert results[0] is not results[1]
+
+
+def test_failed_loads_reach_every_waiter_and_are_not_cached():
+    cache = aocdb.ReadThroughCache()
+    loader = SlowLoader(error=aocdb.TransientLookupError('HTTP 503'))
+    results = []
+    threads = [load_in_thread(cache, 'grim', loader, results) for _ in range(3)]
+    wait_for(lambda: cache.coalesced == 2)
+    loader.release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(result, aocdb.TransientLookupError) for result in results)
+    assert cache.get_or_load('grim', lambda: 'loaded') == 'loaded'
+
+
+@pytest.mark.parametrize('local_write', ['put', 'invalidate'])
+def test_local_writes_during_a_load_win(local_write):
+    cache = aocdb.ReadThroughCache()
+    loader = SlowLoader({'Level': 1})
+    results = []
+    thread = load_in_thread(cache, 'grim', loader, results)
+    assert loader.started.wait(5)
+    if local_write == 'put':
+        cache.put('grim', {'Level': 2})
+    else:
+        cache.invalidate('grim')
+    loader.release.set()
+    thread.join()
+    assert results == [{'Level': 1}]
+    expected = {'Level': 2} if local_write == 'put' else {'Level': 3}
+    assert cache.get_or_load('grim', lambda: {'Level': 3}) == expected
+
+
+def test_entries_expire():
+    cache = aocdb.ReadThroughCache(ttl_seconds=0)
+    cache.get_or_load('grim', lambda: 1)
+    assert cache.get_or_load('grim', lambda: 2) == 2
+    assert cache.misses == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = aocdb.ReadThroughCache(max_entries=2)
+    cache.get_or_load('a', lambda: 'a')
+    cache.get_or_load('b', lambda: 'b')
+    cache.get_or_load('a', lambda: 'reloaded')  # a is now the most recently used
+    cache.get_or_load('c', lambda: 'c')
+    assert cache.get_or_load('a', lambda: 'reloaded') == 'a'
+    assert cache.get_or_load('b', lambda: 'reloaded') == 'reloaded'
+
+
+def test_clear_drops_everything():
+    cache = aocdb.ReadThroughCache()
+    cache.put('a', 1)
+    cache.clear()
+    assert cache.get_or_load('a', lambda: 2) == 2
+
+
+def test_player_lookups_are_cached(firestore):
+    store, service = firestore
+    store.put('players/grimclaw', service.dict_to_firestore_fields({'Name': 'Grimclaw', 'Level': 5}))
+    assert service.get_player_by_name('Grimclaw')['Level'] == 5
+    assert service.get_player_by_name('GRIMCLAW')['Level'] == 5
+    assert service.get_player_by_name('Nobody') is None
+    assert service.stats.snapshot()['counters']['http_get'] == 2
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = aocdb.TokenBucket(rate=50, capacity=3)
+    assert all(bucket.acquire() < 0.01 for _ in range(3))
+    assert bucket.acquire() > 0.005
+
+
+def test_background_requests_leave_the_reserve_to_interactive_ones():
+    bucket = aocdb.TokenBucket(rate=0.001, capacity=4, reserve_fraction=0.25, min_rate=0.001)
+    for _ in range(3):
+        bucket.acquire(interactive=False)
+    # A fourth background request would have to wait for a refill; the user's request doesn't
+    assert bucket.acquire(interactive=True) < 0.01
+
+
+def test_token_bucket_backs_off_on_429_and_recovers():
+    bucket = aocdb.TokenBucket(rate=8, capacity=8, min_rate=1)
+    bucket.throttled()
+    assert bucket.rate == 4
+    for _ in range(5):
+        bucket.throttled()
+    assert bucket.rate == 1
+    for _ in range(1000):
+        bucket.succeeded()
+    assert bucket.rate == 8
+
+
+def test_budget_counts_and_persists(tmp_path):
+    path = tmp_path / 'budget.json'
+    budget = aocdb.RequestBudget(str(path), read_limit=10, write_limit=5)
+    budget.add('read', 4)
+    budget.add('write', 1)
+    assert budget.remaining('read') == 6
+    assert budget.remaining('write') == 4
+    budget.save()
+
+    reloaded = aocdb.RequestBudget(str(path))
+    assert reloaded.usage()['reads'] == 4
+    assert reloaded.usage()['read_limit'] == 10
+
+
+def test_budget_starts_over_on_a_new_day(tmp_path, monkeypatch):
+    budget = aocdb.RequestBudget(str(tmp_path / 'budget.json'))
+    monkeypatch.setattr(aocdb.RequestBudget, 'today', staticmethod(lambda: '2024-05-01'))
+    budget.add('read', 100)
+    monkeypatch.setattr(aocdb.RequestBudget, 'today', staticmethod(lambda: '2024-05-02'))
+    assert budget.usage()['reads'] == 0
+    assert budget.usage()['date'] == '2024-05-02'
+
+
+def test_set_limits_is_saved_right_away(tmp_path):
+    path = tmp_path / 'budget.json'
+    aocdb.RequestBudget(str(path)).set_limits(read_limit=123)
+    assert json.loads(path.read_text())['read_limit'] == 123
+
+
+def test_scheduler_stops_background_work_over_budget(tmp_path):
+    budget = aocdb.RequestBudget(str(tmp_path / 'budget.json'), read_limit=1)
+    scheduler = aocdb.RequestScheduler(budget, rates={'read': (1000, 1000), 'write': (1000, 1000), 'auth': (1, 1)})
+    budget.add('read', 1)
+    with pytest.raises(aocdb.RequestBudgetExceeded):
+        scheduler.acquire('read', interactive=False)
+    scheduler.acquire('read', interactive=True)  # The user can still look things up
+    scheduler.acquire('write', interactive=False)
+
+
+def test_over_budget_warning_once_a_day(tmp_path, monkeypatch, caplog):
+    budget = aocdb.RequestBudget(str(tmp_path / 'budget.json'), read_limit=1)
+    scheduler = aocdb.RequestScheduler(budget, rates={'read': (1000, 1000), 'write': (1000, 1000), 'auth': (1, 1)})
+    for day in ('2024-05-01', '2024-05-02'):
+        monkeypatch.setattr(aocdb.RequestBudget, 'today', staticmethod(lambda: day))
+        budget.add('read', 1)
+        scheduler.acquire('read')
+        scheduler.acquire('read')
+    assert caplog.text.count('Daily read budget used up') == 2
+
+
+def test_billed_units(fake_response):
+    billed = aocdb.RequestScheduler.billed_units
+    commit = {'writes': [{}, {}, {}]}
+    assert billed('write', 'POST', 'https://x/documents:commit', commit, fake_response()) == 3
+    assert billed('write', 'PATCH', 'https://x/documents/players/a', {}, fake_response()) == 1
+    listing = fake_response(content=b'[{"createTime": 1}, {"createTime": 2}]')
+    assert billed('read', 'GET', 'https://x/documents/players', None, listing) == 2
+    assert billed('read', 'POST', 'https://x/documents:runQuery', {}, fake_response(content=b'[]')) == 1
+    assert billed('read', 'GET', 'https://x/documents/players/a', None, fake_response(404)) == 0
@@ -0,0 +1,37 @@
+import AshesDBOBSV2git as aocdb
+
+
+def put(store, service, player):
+    store.put(f"players/{player['Name'].lower()}", service.dict_to_firestore_fields(player))
+
+
+def names(players):
+    return sorted(player['Name'] for player in players)
+
+
+def test_writes_in_the_last_seen_second_are_fetched(firestore):
+    store, service = firestore
+    put(store, service, {'Name': 'Grimclaw', 'Level': 5, 'updatedAt': '2024-05-01T10:00:00Z'})
+    sync = aocdb.RosterSync(service)
+    sync.full_sync(export=False)
+    assert sync.incremental_sync(export=False) == []
+
+    # Written after the last poll, but within the same second as the newest player we have
+    put(store, service, {'Name': 'Ivy', 'Level': 7, 'updatedAt': '2024-05-01T10:00:00Z'})
+    put(store, service, {'Name': 'Grimclaw', 'Level': 6, 'updatedAt': '2024-05-01T10:00:00Z'})
+    assert names(sync.incremental_sync(export=False)) == ['Grimclaw', 'Ivy']
+    assert sync.players['grimclaw']['Level'] == 6
+    assert sync.incremental_sync(export=False) == []
+
+
+def test_listeners_only_hear_about_real_changes(firestore):
+    store, service = firestore
+    put(store, service, {'Name': 'Grimclaw', 'Level': 5, 'updatedAt': '2024-05-01T10:00:00Z'})
+    sync = aocdb.RosterSync(service)
+    sync.seed([service.get_all_players()[0]])
+    heard = []
+    service.add_change_listener(lambda changed, removed: heard.append(names(changed)))
+    sync.incremental_sync(export=False)
+    put(store, service, {'Name': 'Oak', 'Level': 1, 'updatedAt': '2024-05-01T10:00:01Z'})
+    sync.incremental_sync(export=False)
+    assert heard == [['Oak']]
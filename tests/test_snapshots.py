@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+def make_roster():
+    return [
+        {'Name': 'Grimclaw', 'Level': 25, 'Class': 'Fighter', 'Guild': 'Red Hand', 'Discord': 'grim#1',
+         'Known Associates': ['Shadowbane', 'Ivy'], 'updatedAt': '2024-05-01T10:00:00Z'},
+        {'Name': 'Shadowbane', 'Level': 12, 'Class': 'Rogue', 'Guild': 'N/A', 'Discord': '',
+         'Known Associates': [], 'updatedAt': '2024-05-02T10:00:00Z'},
+        {'Name': 'Ivy', 'Level': 40, 'Class': 'Cleric', 'Guild': 'Red Hand', 'Notes': 'Healer, ünïcode ok',
+         'Known Associates': ['Grimclaw'], 'updatedAt': '2024-04-30T10:00:00Z'},
+    ]
+
+
+def by_name(players):
+    return {player['Name']: player for player in players}
+
+
+@pytest.mark.parametrize('codec', ['zlib', pytest.param('zstd', marks=pytest.mark.skipif(
+    aocdb.zstandard is None, reason="zstandard not installed"))])
+def test_full_snapshot_round_trip(tmp_path, codec):
+    path = str(tmp_path / 'roster.aocsnap')
+    roster = make_roster()
+    header = aocdb.write_roster_snapshot(path, roster, codec=codec)
+    assert header['kind'] == 'full'
+    assert header['player_count'] == 3
+    assert header['max_updated_at'] == '2024-05-02T10:00:00Z'
+
+    read_header, players = aocdb.read_roster_snapshot(path)
+    assert read_header['checksum'] == header['checksum']
+    assert by_name(players) == by_name(roster)
+
+
+def test_damaged_snapshot_is_rejected(tmp_path):
+    path = tmp_path / 'roster.aocsnap'
+    aocdb.write_roster_snapshot(str(path), make_roster())
+    data = bytearray(path.read_bytes())
+    data[-5] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(aocdb.RosterSnapshotError):
+        aocdb.read_roster_snapshot(str(path))
+
+
+def test_delta_applies_changes_additions_and_removals(tmp_path):
+    base_path = str(tmp_path / 'base.aocsnap')
+    delta_path = str(tmp_path / 'delta.aocsnap')
+    base = make_roster()
+    base_header = aocdb.write_roster_snapshot(base_path, base)
+
+    current = [dict(player) for player in base if player['Name'] != 'Ivy']
+    current[0]['Level'] = 26
+    current.append({'Name': 'Newcomer', 'Level': 1, 'Known Associates': []})
+    header = aocdb.write_roster_snapshot(delta_path, current, base_header=base_header, base_players=base)
+    assert header['kind'] == 'delta'
+    assert header['upsert_count'] == 2
+
+    read_base_header, read_base = aocdb.read_roster_snapshot(base_path)
+    _, players = aocdb.read_roster_snapshot(delta_path, base_players=read_base, base_header=read_base_header)
+    assert by_name(players) == by_name(current)
+
+
+def test_delta_needs_its_own_base(tmp_path):
+    base = make_roster()
+    base_header = aocdb.write_roster_snapshot(str(tmp_path / 'base.aocsnap'), base)
+    other_header = aocdb.write_roster_snapshot(str(tmp_path / 'other.aocsnap'), base[:1])
+    delta_path = str(tmp_path / 'delta.aocsnap')
+    aocdb.write_roster_snapshot(delta_path, base[:2], base_header=base_header, base_players=base)
+
+    with pytest.raises(aocdb.RosterSnapshotError):
+        aocdb.read_roster_snapshot(delta_path)
+    with pytest.raises(aocdb.RosterSnapshotError):
+        aocdb.read_roster_snapshot(delta_path, base_players=base[:1], base_header=other_header)
+
+
+def test_delta_skips_records_without_a_name(tmp_path):
+    base = make_roster()
+    base_header = aocdb.write_roster_snapshot(str(tmp_path / 'base.aocsnap'), base)
+    current = base + [{'Level': 3}]
+    header = aocdb.write_roster_snapshot(str(tmp_path / 'delta.aocsnap'), current,
+                                         base_header=base_header, base_players=base)
+    assert header['upsert_count'] == 0
+
+
+def test_local_snapshot_ignores_unreadable_files(tmp_path):
+    path = tmp_path / 'roster.aocsnap'
+    local = aocdb.LocalRosterSnapshot(str(path))
+    assert local.load() is None
+    path.write_bytes(b'not a snapshot at all')
+    assert local.load() is None
+    local.save(make_roster())
+    assert len(local.load()) == 3
+
+
+def test_cli_delta_import_requires_a_base(firestore, tmp_path):
+    _, service = firestore
+    base = make_roster()
+    base_path = str(tmp_path / 'base.aocsnap')
+    delta_path = str(tmp_path / 'delta.aocsnap')
+    base_header = aocdb.write_roster_snapshot(base_path, base)
+    current = [dict(player) for player in base]
+    current[0]['Level'] = 26
+    aocdb.write_roster_snapshot(delta_path, current, base_header=base_header, base_players=base)
+    # A local snapshot exists, but it's no base for someone else's delta
+    aocdb.local_snapshot(service).save(base)
+
+    with pytest.raises(Exception, match='--base'):
+        aocdb.cli_snapshot(service, SimpleNamespace(action='import', file=delta_path, base=None))
+    aocdb.cli_snapshot(service, SimpleNamespace(action='import', file=delta_path, base=base_path))
+    assert by_name(aocdb.local_snapshot(service).load())['Grimclaw']['Level'] == 26
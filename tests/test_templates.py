@@ -0,0 +1,67 @@
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+LINKS = aocdb.ExportConfig.DEFAULT_LINKS
+
+
+def render(source, context, links=LINKS):
+    return aocdb.MarkdownTemplate(source, links=links).render(context)
+
+
+def test_default_player_note():
+    player = {'Name': 'Grimclaw', 'Level': 5, 'Guild': 'Red Hand', 'Known Associates': ['Ivy', 'Oak'],
+              'Discord': 'grim#1'}
+    assert render(aocdb.DEFAULT_PLAYER_TEMPLATE, player) == (
+        "# Grimclaw\n"
+        "- **Level**: 5\n"
+        "- **Class**: N/A\n"
+        "- **Hostile Status**: N/A\n"
+        "- **Subclass**: N/A\n"
+        "- **Guild**: [Red Hand](../Guilds/Red Hand.md)\n"
+        "\n"
+        "## Known Associates\n"
+        "- [Ivy](../Players/Ivy.md)\n"
+        "- [Oak](../Players/Oak.md)\n"
+        "\n"
+        "- **Discord Name**: [grim#1](../Discord/grim#1.md)\n"
+    )
+
+
+def test_empty_sections_leave_no_blank_lines():
+    note = render(aocdb.DEFAULT_PLAYER_TEMPLATE, {'Name': 'Ivy', 'Known Associates': [], 'Discord': ''})
+    assert note.endswith("- **Guild**: N/A\n")
+
+
+def test_rendered_notes_parse_back():
+    player = {'Name': 'Grimclaw', 'Level': 5, 'Class': 'Fighter', 'Hostile Status': 'Hostile',
+              'Subclass': 'Knight', 'Guild': 'Red Hand', 'Known Associates': ['Ivy'], 'Discord': 'grim#1'}
+    note = render(aocdb.DEFAULT_PLAYER_TEMPLATE, player)
+    assert aocdb.parse_player_markdown('---\ntags: [player]\n---\n' + note) == player
+
+
+def test_sections_and_filters():
+    source = "{{#members}}{{Name|upper}};{{/members}} {{?Guild}}in {{Guild}}{{/Guild}}{{^Guild}}no guild{{/Guild}}"
+    assert render(source, {'members': [{'Name': 'a'}, {'Name': 'b'}], 'Guild': ''}) == "A;B; no guild"
+    assert render("{{Tag|tag}} {{Notes|yaml}} {{Name|wikilink}} {{Level|default:?}}",
+                  {'Tag': 'Red Hand!', 'Notes': 'a: "b"', 'Name': 'Ivy'}) == 'red-hand "a: \\"b\\"" [[Ivy]] ?'
+
+
+@pytest.mark.parametrize('source', ["{{#a}}never closed", "{{/a}}", "{{#a}}{{/b}}", "{{a|nope}}"])
+def test_template_mistakes_are_reported_when_compiling(source):
+    with pytest.raises(aocdb.TemplateError):
+        aocdb.MarkdownTemplate(source)
+
+
+def test_frontmatter_is_stripped():
+    assert aocdb.strip_frontmatter("---\ntags: [x]\n---\n# Ivy\n") == "# Ivy\n"
+    assert aocdb.strip_frontmatter("# Ivy\n---\n") == "# Ivy\n---\n"
+
+
+def test_export_config_uses_custom_templates(tmp_path):
+    config = aocdb.ExportConfig(str(tmp_path / 'export.json'))
+    config.write_defaults()
+    (tmp_path / 'templates' / 'guild.md').write_text("Guild {{name}} ({{count}})\n")
+    templates = aocdb.ExportConfig(str(tmp_path / 'export.json')).compile_templates()
+    assert templates['guild'].render({'name': 'Red Hand', 'count': 2, 'members': []}) == "Guild Red Hand (2)\n"
+    assert templates['player'].render({'Name': 'Ivy'}).startswith("# Ivy\n")
@@ -0,0 +1,158 @@
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+def write(path, text, mtime_ns=None):
+    path.write_text(text)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def changed(index, folder):
+    return [os.path.basename(path) for path, _, _ in index.changed_files(str(folder))]
+
+
+def test_unknown_notes_are_changed(tmp_path):
+    index = aocdb.VaultIndex(str(tmp_path / 'index.json'))
+    write(tmp_path / 'Grim.md', '# Grim\n')
+    write(tmp_path / 'notes.txt', 'not a note')
+    assert changed(index, tmp_path) == ['Grim.md']
+    assert changed(index, tmp_path / 'missing') == []
+
+
+def test_recorded_notes_are_skipped_until_edited(tmp_path):
+    index = aocdb.VaultIndex(str(tmp_path / 'index.json'))
+    path = write(tmp_path / 'Grim.md', '# Grim\n', mtime_ns=1_000_000_000)
+    index.record(path, b'# Grim\n', base={'Name': 'Grim'})
+    assert changed(index, tmp_path) == []
+
+    write(tmp_path / 'Grim.md', '# Grim\n- **Level**: 5\n', mtime_ns=2_000_000_000)
+    [(_, data, entry)] = index.changed_files(str(tmp_path))
+    assert data == b'# Grim\n- **Level**: 5\n'
+    assert entry['base'] == {'Name': 'Grim'}
+
+
+def test_touched_notes_only_refresh_the_stat(tmp_path):
+    index = aocdb.VaultIndex(str(tmp_path / 'index.json'))
+    path = write(tmp_path / 'Grim.md', '# Grim\n', mtime_ns=1_000_000_000)
+    index.record(path, b'# Grim\n')
+    os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+    assert changed(index, tmp_path) == []
+    assert index.get(path)['mtime_ns'] == 3_000_000_000
+
+
+def test_index_persists(tmp_path):
+    index_path = str(tmp_path / 'index' / 'index.json')
+    index = aocdb.VaultIndex(index_path)
+    path = write(tmp_path / 'Grim.md', '# Grim\n')
+    index.record(path, b'# Grim\n', base={'Name': 'Grim'})
+    index.save()
+    reloaded = aocdb.VaultIndex(index_path)
+    assert reloaded.get(path)['base'] == {'Name': 'Grim'}
+    reloaded.forget(path)
+    assert reloaded.get(path) is None
+
+
+def test_player_base_copies_lists():
+    player = {'Name': 'Grim', 'Level': 5, 'Known Associates': ['Ivy'], 'Notes': 'not exported'}
+    base = aocdb.VaultIndex.player_base(player)
+    player['Known Associates'].append('Oak')
+    assert base['Known Associates'] == ['Ivy']
+    assert base['Name'] == 'Grim' and 'Notes' not in base
+
+
+def test_only_pushed_notes_become_the_new_base(tmp_path):
+    index = aocdb.VaultIndex(str(tmp_path / 'index.json'))
+    sync = aocdb.VaultSync(SimpleNamespace(vault_index=index))
+    grim = write(tmp_path / 'Grim.md', '# Grim\n')
+    ivy = write(tmp_path / 'Ivy.md', '# Ivy\n')
+    sync.pending = [(grim, b'# Grim\n', {'Name': 'Grim'}, {'grim'}),
+                    (ivy, b'# Ivy\n', {'Name': 'Ivy'}, {'ivy'})]
+    sync.record_pushed({'grim'})
+    assert index.get(grim)['base'] == {'Name': 'Grim'}
+    assert index.get(ivy) is None
+    assert [entry[0] for entry in sync.pending] == [ivy]
+
+
+def test_failed_lookup_keeps_the_player_and_the_edit(firestore, fake_response):
+    store, service = firestore
+    player = {'Name': 'Grimclaw', 'Level': 20, 'Class': 'Fighter', 'Guild': 'Red Hand', 'Known Associates': ['Ivy']}
+    store.put('players/grimclaw', service.dict_to_firestore_fields(player))
+    service.export_to_markdown([player], {}, {})
+    note = os.path.join(service.player_path, 'Grimclaw.md')
+    with open(note) as f:
+        text = f.read()
+    with open(note, 'w') as f:
+        f.write(text.replace('**Level**: 20', '**Level**: 21'))
+    os.utime(note, ns=(5_000_000_000, 5_000_000_000))
+
+    request = service.session.request
+    service.session.request = lambda method, url, **kwargs: (
+        fake_response(500, b'{}') if method == 'GET' else request(method, url, **kwargs))
+    sync = aocdb.VaultSync(service)
+    with pytest.raises(aocdb.TransientLookupError):
+        sync.sync()
+    stored = service.firestore_fields_to_dict(store.documents['players/grimclaw']['fields'])
+    assert stored == player
+
+    service.session.request = request
+    assert [edited['Level'] for edited in sync.collect_updates(dry_run=True).values()] == [21]
+    sync.sync()
+    stored = service.firestore_fields_to_dict(store.documents['players/grimclaw']['fields'])
+    assert stored['Level'] == 21 and stored['Guild'] == 'Red Hand' and stored['Known Associates'] == ['Ivy']
+
+
+def test_untracked_notes_only_create_missing_players(firestore):
+    store, service = firestore
+    player = {'Name': 'Grimclaw', 'Level': 20, 'Guild': 'Red Hand', 'Known Associates': []}
+    store.put('players/grimclaw', service.dict_to_firestore_fields(player))
+    # Notes written by an exporter that didn't keep the index
+    for folder, name, text in ((service.player_path, 'Grimclaw', '# Grimclaw\n- **Level**: 5\n- **Guild**: Old Guild\n'),
+                               (service.player_path, 'Ivy', '# Ivy\n- **Level**: 7\n'),
+                               (service.guild_path, 'Old Guild', '# Guild: Old Guild\n- [Grimclaw](../Players/Grimclaw.md)\n')):
+        os.makedirs(folder, exist_ok=True)
+        write(Path(folder) / f'{name}.md', text)
+
+    sync = aocdb.VaultSync(service)
+    assert [player['Name'] for player in sync.sync()] == ['Ivy']
+    stored = service.firestore_fields_to_dict(store.documents['players/grimclaw']['fields'])
+    assert stored['Level'] == 20 and stored['Guild'] == 'Red Hand'
+    assert service.firestore_fields_to_dict(store.documents['players/ivy']['fields'])['Level'] == 7
+    # From now on they are tracked, so a real edit does get pushed
+    assert sync.collect_updates(dry_run=True) == {}
+    write(Path(service.player_path) / 'Grimclaw.md', '# Grimclaw\n- **Level**: 6\n- **Guild**: Old Guild\n',
+          mtime_ns=9_000_000_000)
+    assert sync.collect_updates(dry_run=True) == {'grimclaw': {'Name': 'Grimclaw', 'Level': 6}}
+
+
+def test_associate_edits_update_the_links_back(firestore, caplog):
+    store, service = firestore
+    players = [{'Name': 'Grimclaw', 'Guild': 'Red Hand', 'Known Associates': ['Oak']},
+               {'Name': 'Ivy', 'Guild': 'Red Hand', 'Known Associates': []},
+               {'Name': 'Oak', 'Guild': 'N/A', 'Known Associates': ['Grimclaw']}]
+    for player in players:
+        store.put(f"players/{player['Name'].lower()}", service.dict_to_firestore_fields(player))
+    service.export_to_markdown(players, service.get_all_guilds(players), {})
+
+    note = Path(service.player_path) / 'Grimclaw.md'
+    write(note, note.read_text().replace('[Oak](../Players/Oak.md)', '[Ivy](../Players/Ivy.md)'),
+          mtime_ns=9_000_000_000)
+    page = Path(service.guild_path) / 'Red Hand.md'
+    write(page, page.read_text().replace('- [Ivy](../Players/Ivy.md)\n', ''), mtime_ns=9_000_000_000)
+
+    aocdb.VaultSync(service).sync()
+
+    def associates(name):
+        return service.firestore_fields_to_dict(store.documents[f'players/{name}']['fields'])['Known Associates']
+    assert associates('grimclaw') == ['Ivy']
+    assert associates('ivy') == ['Grimclaw']
+    assert associates('oak') == []
+    ivy = service.firestore_fields_to_dict(store.documents['players/ivy']['fields'])
+    assert ivy['Guild'] == 'Red Hand'
+    assert 'Ignoring Ivy removed from Guild page Red Hand' in caplog.text
@@ -0,0 +1,86 @@
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+def test_rule_parsing():
+    rule = aocdb.WatchRule(1, 'Status = Hostile and Level >= 40 and associate of "Steven"')
+    assert rule.conditions == [('Hostile Status', '=', 'hostile'), ('Level', '>=', 40),
+                               ('Known Associates', 'has', 'steven')]
+
+
+def test_quoted_values_keep_and():
+    rule = aocdb.WatchRule(1, 'Guild = "Salt and Pepper"')
+    assert rule.conditions == [('Guild', '=', 'salt and pepper')]
+
+
+@pytest.mark.parametrize('text', ['Height = 6', 'Level >= forty', 'Guild > Red Hand', 'just words'])
+def test_bad_rules_are_rejected(text):
+    with pytest.raises(aocdb.WatchRuleError):
+        aocdb.WatchRule(1, text)
+
+
+def test_matching():
+    rule = aocdb.WatchRule(1, 'Guild = red hand and Level > 30')
+    assert rule.matches({'Name': 'A', 'Guild': 'Red Hand', 'Level': '31'})
+    assert not rule.matches({'Name': 'B', 'Guild': 'Red Hand', 'Level': 30})
+    assert not rule.matches({'Name': 'C', 'Guild': 'Red Hand'})
+    assert aocdb.WatchRule(2, 'associate of Ivy').matches({'Known Associates': ['IVY']})
+
+
+def test_anchor_prefers_the_most_selective_field():
+    assert aocdb.WatchRule(1, 'Class = Mage and Guild = Red Hand').anchor() == ('Guild', 'red hand')
+    assert aocdb.WatchRule(2, 'Guild = Red Hand and associate of Ivy').anchor() == ('Known Associates', 'ivy')
+    assert aocdb.WatchRule(3, 'Guild != Red Hand and Level >= 40').anchor() is None
+
+
+def watchlist(tmp_path, *texts):
+    watchlist = aocdb.Watchlist(str(tmp_path / 'watchlist.json'))
+    for text in texts:
+        watchlist.add_rule(text)
+    return watchlist
+
+
+def test_rules_are_indexed(tmp_path):
+    wl = watchlist(tmp_path, 'Guild = Red Hand', 'Level >= 40', 'associate of Ivy')
+    assert set(wl.index) == {('Guild', 'red hand'), ('Known Associates', 'ivy')}
+    assert [rule.text for rule in wl.unanchored] == ['Level >= 40']
+    candidates = wl.candidates({'Name': 'A', 'Guild': 'Blue Moon', 'Level': 10})
+    assert [rule.text for rule in candidates] == ['Level >= 40']
+
+
+def test_only_new_matches_alert(tmp_path):
+    wl = watchlist(tmp_path, 'Guild = Red Hand')
+    assert wl.prime([{'Name': 'Grim', 'Guild': 'Red Hand'}, {'Name': 'Ivy', 'Guild': 'Blue'}]) == {1: ['Grim']}
+    assert wl.check(changed=[{'Name': 'Grim', 'Guild': 'Red Hand', 'Level': 5}]) == []
+    alerts = wl.check(changed=[{'Name': 'Ivy', 'Guild': 'Red Hand'}])
+    assert [(alert['rule_id'], alert['player']) for alert in alerts] == [(1, 'Ivy')]
+    assert wl.matching_players(1) == ['grim', 'ivy']
+
+
+def test_leaving_and_rejoining_alerts_again(tmp_path):
+    wl = watchlist(tmp_path, 'Guild = Red Hand')
+    wl.prime([{'Name': 'Grim', 'Guild': 'Red Hand'}])
+    assert wl.check(changed=[{'Name': 'Grim', 'Guild': 'Blue'}]) == []
+    assert len(wl.check(changed=[{'Name': 'Grim', 'Guild': 'Red Hand'}])) == 1
+    assert wl.check(removed=['grim']) == []
+    assert wl.match_counts() == {1: 0}
+
+
+def test_removing_a_rule(tmp_path):
+    wl = watchlist(tmp_path, 'Guild = Red Hand', 'Level >= 40')
+    wl.prime([{'Name': 'Grim', 'Guild': 'Red Hand', 'Level': 50}])
+    wl.remove_rule(1)
+    assert list(wl.rules) == [2]
+    assert wl.matching_players(1) == []
+    assert wl.index == {}
+
+
+def test_rules_persist(tmp_path):
+    wl = watchlist(tmp_path, 'Guild = Red Hand', 'Level >= 40')
+    wl.remove_rule(1)
+    wl.set_desktop_notifications(False)
+    reloaded = aocdb.Watchlist(wl.path)
+    assert [(rule.id, rule.text) for rule in reloaded.rules.values()] == [(2, 'Level >= 40')]
+    assert reloaded.next_id == 3
+    assert reloaded.desktop_notifications is False
@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+import AshesDBOBSV2git as aocdb
+
+
+@pytest.fixture
+def registry(app_home, monkeypatch):
+    monkeypatch.setattr(aocdb, '_schedulers', {})
+    return aocdb.workspace_registry()
+
+
+def test_default_workspace_always_exists(registry, app_home):
+    assert registry.names() == ['default']
+    assert registry.get().data_dir == str(app_home)
+    assert not os.path.exists(registry.path)
+
+
+def test_workspaces_persist(registry, app_home):
+    registry.add(aocdb.Workspace('eu1', collection_prefix='eu1_', vault='~/vaults/eu1'))
+    registry.add(aocdb.Workspace('Na-2', project_id='other-project', api_key='key'))
+    registry.set_active('eu1')
+    reloaded = aocdb.workspace_registry()
+    assert reloaded.names() == ['default', 'eu1', 'Na-2']
+    assert reloaded.active == 'eu1'
+    assert reloaded.get().to_dict() == {'project_id': None, 'api_key': None,
+                                        'collection_prefix': 'eu1_', 'vault': '~/vaults/eu1'}
+    assert reloaded.get('eu1').data_dir == os.path.join(str(app_home), 'workspaces', 'eu1')
+
+
+def test_removing_the_active_workspace(registry):
+    registry.add(aocdb.Workspace('eu1'))
+    registry.set_active('eu1')
+    registry.remove('eu1')
+    assert registry.active == 'default'
+    with pytest.raises(Exception):
+        registry.remove('default')
+    with pytest.raises(Exception):
+        registry.get('eu1')
+
+
+@pytest.mark.parametrize('name, prefix', [('eu 1', ''), ('', ''), ('eu1', 'eu/1_')])
+def test_invalid_workspaces(name, prefix):
+    with pytest.raises(Exception):
+        aocdb.Workspace(name, collection_prefix=prefix)
+
+
+def test_broken_entries_are_ignored(app_home):
+    (app_home / 'workspaces.json').write_text(json.dumps({
+        'active': 'bad name', 'workspaces': {'bad name': {}, 'eu1': {'collection_prefix': 'eu1_'}}}))
+    registry = aocdb.workspace_registry()
+    assert registry.names() == ['default', 'eu1']
+    assert registry.active == 'default'
+
+
+def test_collections_are_prefixed(registry):
+    service = aocdb.FirebaseService(aocdb.Workspace('eu1', collection_prefix='eu1_'))
+    assert service.collection('players') == 'eu1_players'
+    assert aocdb.FirebaseService().collection('players') == 'players'
+
+
+def test_vaults_are_per_workspace(registry, app_home):
+    eu1 = aocdb.Workspace('eu1')
+    assert aocdb.workspace_vault_paths(eu1)['player'] == os.path.join(eu1.data_dir, 'vault', 'Players')
+    os.makedirs(eu1.data_dir)
+    with open(os.path.join(eu1.data_dir, 'export.json'), 'w') as f:
+        json.dump({'guild_path': str(app_home / 'guilds')}, f)
+    assert aocdb.workspace_vault_paths(eu1)['guild'] == str(app_home / 'guilds')
+    eu1.vault = str(app_home / 'eu1-vault')
+    assert aocdb.workspace_vault_paths(eu1) == aocdb.vault_folders(str(app_home / 'eu1-vault'))
+
+
+def test_shared_vault_folders_are_refused(registry, app_home):
+    registry.add(aocdb.Workspace('eu1', vault=str(app_home / 'vault')))
+    registry.add(aocdb.Workspace('eu2', vault=str(app_home / 'vault')))
+    registry.add(aocdb.Workspace('na1'))
+    aocdb.FirebaseService(registry.get('na1')).check_vault_folders()
+    with pytest.raises(Exception, match='eu2'):
+        aocdb.FirebaseService(registry.get('eu1')).check_vault_folders()
+
+
+def test_schedulers_are_shared_per_project(registry):
+    same = aocdb.FirebaseService(aocdb.Workspace('eu1', collection_prefix='eu1_'))
+    assert same.scheduler is aocdb.FirebaseService().scheduler
+    other = aocdb.FirebaseService(aocdb.Workspace('na1', project_id='other-project'))
+    assert other.scheduler is not same.scheduler
+
+
+def test_search_across_workspaces():
+    def failing():
+        raise Exception('snapshot unreadable')
+
+    sources = {
+        'eu1': lambda: [{'Name': 'Grimclaw', 'Guild': 'Red Hand'}, {'Name': 'Ivy', 'Guild': 'Red Hand'}],
+        'na1': lambda: [{'Name': 'grimtooth', 'Guild': 'Blue'}],
+        'na2': lambda: None,
+        'bad': failing,
+    }
+    results, errors = aocdb.search_workspaces(sources, 'GRIM')
+    assert {name: [player['Name'] for player in players] for name, players in results.items()} == {
+        'eu1': ['Grimclaw'], 'na1': ['grimtooth'], 'na2': []}
+    assert list(errors) == ['bad']
+    results, _ = aocdb.search_workspaces(sources, '', {'Guild': 'red hand'})
+    assert [player['Name'] for player in results['eu1']] == ['Grimclaw', 'Ivy']
+    assert aocdb.search_workspaces({}, 'grim') == ({}, {})